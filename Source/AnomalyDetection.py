@@ -449,7 +449,7 @@ class AnomAnalWindow(QtWidgets.QDialog):
             print('No file returned')
             return
 
-        root = HDFRoot.readHDF5(inFilePath[0])
+        root = HDFRoot.readHDF5(inFilePath[0], lazy=True)
         if root.attributes["PROCESSING_LEVEL"] != "1a":
             msg = "This is not a Level 1A file."
             Utilities.errorWindow("File Error", msg)
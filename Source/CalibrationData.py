@@ -4,9 +4,12 @@ import math
 import struct
 import sys
 
+import numpy as np
+
 class CalibrationData:
     ''' CalibrationData class stores information regarding the 
          sensor definition lines and coefficients from the calibration file'''
+    ASCII_TYPES = ("HS", "HU", "AI", "AU", "AF", "AS")
 
     def __init__(self):
         self.type = ""
@@ -59,6 +62,47 @@ class CalibrationData:
                 val = int(0 - (math.pow(2, bits) - val))
         return val
 
+    # numpy format of a fixed width field, or None if it cannot be read with a record dtype
+    # Integer widths numpy lacks (e.g. 3 byte DATETAG) and ASCII fields are read as bytes;
+    # see binaryValues
+    @staticmethod
+    def fieldFormat(dataType, fieldLength):
+        dataType = dataType.upper()
+        if fieldLength <= 0:
+            return None
+        if dataType in ("BU", "BULE", "BS", "BSLE") and fieldLength <= 8:
+            if fieldLength not in (1, 2, 4, 8):
+                return (np.uint8, (fieldLength,))
+            order = "<" if dataType.endswith("LE") else ">"
+            kind = "i" if dataType.startswith("BS") else "u"
+            return np.dtype(f"{order}{kind}{fieldLength}")
+        if dataType == "BF" and fieldLength == 4:
+            return np.dtype("=f4") # struct.unpack("f") is native byte order
+        if dataType == "BD" and fieldLength == 8:
+            return np.dtype("=f8")
+        if dataType in CalibrationData.ASCII_TYPES:
+            return (np.uint8, (fieldLength,))
+        return None
+
+    # Converts a column of binary fields read with fieldFormat to python values, as convertRaw would.
+    # (ASCII fields are left to convertRaw, one value at a time.)
+    @staticmethod
+    def binaryValues(field, dataType):
+        dataType = dataType.upper()
+        if field.ndim == 2:
+            # Odd width integers: combine the bytes
+            width = field.shape[1]
+            if dataType.endswith("LE"):
+                field = field[:, ::-1]
+            values = np.zeros(field.shape[0], dtype=np.uint64)
+            for k in range(width):
+                values = (values << np.uint64(8)) | field[:, k].astype(np.uint64)
+            if dataType.startswith("BS"):
+                values = values.astype(np.int64)
+                values[values >= 2**(8*width-1)] -= 2**(8*width)
+            field = values
+        return field.tolist()
+
     # Used when reading a raw file to convert binary data to correct type
     def convertRaw(self, b):
         v = 0
@@ -1,9 +1,9 @@
 ''' Interpret raw SeaBird-style data files
     Reads raw files line by line and parses the data 
 '''
-import binascii
 import os
-import sys
+
+import numpy as np
 
 from Source.CalibrationData import CalibrationData
 from Source.Utilities import Utilities
@@ -87,12 +87,20 @@ class CalibrationFile:
 
     # Verify raw data message can be read successfully
     def verifyRaw(self, msg):
+        return self.parseRaw(msg) is not None
+
+    # Parses one raw message frame into a value per calibration data line
+    # Returns (values, nRead), or None on error
+    def parseRaw(self, msg):
+        nRead = 0
+        values = []
         try:
-            nRead = 0
             for i, cd in enumerate(self.data):
-                v = 0 # for debugging; ignore
+                v = 0
                 # cd = self.data[i]
 
+                # Get value from message frame
+
                 # Read variable length message frames (field length == -1)
                 if cd.fieldLength == -1:
                     delimiter = self.data[i+1].units
@@ -100,13 +108,9 @@ class CalibrationFile:
                     #print("delimiter:", delimiter)
 
                     end = msg[nRead:].find(delimiter)
-                    # print("read:", nRead, end)
-                    if end == 0:
-                        v = 0.0
-                    else:
-                        b = msg[nRead:nRead+end]
-                        v = cd.convertRaw(b)
-
+                    #print("read:", nRead, end)
+                    b = msg[nRead:nRead+end]
+                    v = cd.convertRaw(b)
                     nRead += end
 
                 # Read fixed length message frames
@@ -117,71 +121,94 @@ class CalibrationFile:
                             # print(nRead, cd.fieldLength, b)
                             v = cd.convertRaw(b)
                     nRead  += cd.fieldLength
-
-                # Passed EndOfFile
-                #if nRead > len(msg):
-                #    return False
-
-            return True
+                values.append(v)
 
         except KeyError:
             # pass
             pmsg = "Failed to read message successfully"
             print(pmsg)
             Utilities.writeLogFile(pmsg)
+            return None
 
-        return False
+        return values, nRead
 
+    # True if the instrument appends binary DATETAG (3 bytes) and TIMETAG2 (4 bytes) to each frame
+    def hasTimeTags(self):
+        # Some instruments produce additional bytes for
+        # DATETAG (3 bytes), and TIMETAG2 (4 bytes)
+        #       apparently SATMSG does not .... comes out jibberish
+        #       $GPGGA also does not work and timetags will be added later from NMEA strings
+        instrumentId = ""
+        for cd in self.data:
+            if cd.type.upper() == "INSTRUMENT" or cd.type.upper() == "VLF_INSTRUMENT":
+                instrumentId = cd.id
+        return instrumentId.startswith(("SATHED", "SATHLD", "SATHSE", "SATHSL", "SATPYR",
+                                        "SATNAV", "$GPRMC", "SATTHS", "UMTWR"))
+                                        # "SATMSG"
+
+    # Stores the attributes carried by the calibration data lines in the group
+    def storeAttributes(self, gp):
+        for cd in self.data:
+            cdtype = cd.type.upper()
+            if cd.fitType.upper() != "NONE" and cd.fitType.upper() != "DELIMITER":
+                if cdtype in ('INSTRUMENT', 'VLF_INSTRUMENT', 'SN', 'VLF_SN'):
+                    gp.attributes[cdtype] = cd.id
+            # None types are stored as attributes
+            if cd.fitType.upper() == "NONE":
+                if cdtype == "SN" or cdtype == "DATARATE" or cdtype == "RATE":
+                    gp.attributes[cdtype] = cd.id
+
+    # Returns the numpy record dtype of a frame and its length in bytes, or (None, None) if the frame
+    # has ASCII or variable width fields and has to be parsed one at a time
+    def getFrameDtype(self):
+        if not hasattr(self, "_frameDtype"):
+            self._frameDtype = self.buildFrameDtype()
+        return self._frameDtype
+
+    def buildFrameDtype(self):
+        names, formats, offsets = [], [], []
+        stored = set()
+        nRead = 0
+        for i, cd in enumerate(self.data):
+            fitType = cd.fitType.upper()
+            if cd.fieldLength == -1:
+                return None, None
+            if fitType != "DELIMITER" and cd.fieldLength != 0:
+                fmt = CalibrationData.fieldFormat(cd.dataType, cd.fieldLength)
+                if fmt is None:
+                    return None, None
+                names.append(f"f{i}")
+                formats.append(fmt)
+                offsets.append(nRead)
+            if fitType != "NONE" and fitType != "DELIMITER" and \
+                    cd.type.upper() not in ('INSTRUMENT', 'VLF_INSTRUMENT', 'SN', 'VLF_SN'):
+                # Repeated columns interleave their values frame by frame; leave those to parseRaw
+                if (cd.type, cd.id) in stored:
+                    return None, None
+                stored.add((cd.type, cd.id))
+            nRead += cd.fieldLength
+        if self.hasTimeTags():
+            names.extend(["DATETAG", "TIMETAG2"])
+            formats.extend([CalibrationData.fieldFormat("BU", 3), CalibrationData.fieldFormat("BU", 4)])
+            offsets.extend([nRead, nRead + 3])
+            nRead += 7
+        return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": nRead}), nRead
 
     # Reads a message frame from the raw file and generates hdf groups/datasets
     # Returns nRead (number of bytes read) or -1 on error
     def convertRaw(self, msg, gp):
-        nRead = 0
-        instrumentId = ""
 
         #for i in range(0, len(self.data)):
         #    self.data[i].printd()
         #print("file:", msg)
 
-        if self.verifyRaw(msg) is False:
+        parsed = self.parseRaw(msg)
+        if parsed is None:
             print("Message not read successfully:\n" + str(msg))
-            self.verifyRaw(msg)
             return -1
+        values, nRead = parsed
 
-        for i, cd in enumerate(self.data):
-            v = 0
-            # cd = self.data[i]
-
-            # Get value from message frame
-
-            # Read variable length message frames (field length == -1)
-            if cd.fieldLength == -1:
-                delimiter = self.data[i+1].units
-                delimiter = delimiter.encode("utf-8").decode("unicode_escape").encode("utf-8")
-                #print("delimiter:", delimiter)
-
-                end = msg[nRead:].find(delimiter)
-                #print("read:", nRead, end)
-                b = msg[nRead:nRead+end]
-                v = cd.convertRaw(b)
-                nRead += end
-
-            # Read fixed length message frames
-            else:
-                if cd.fitType.upper() != "DELIMITER":
-                    if cd.fieldLength != 0:
-                        b = msg[nRead:nRead+cd.fieldLength]
-                        # print(nRead, cd.fieldLength, b)
-                        v = cd.convertRaw(b)
-                nRead  += cd.fieldLength
-
-
-            # Stores the instrument id to check for DATETAG/TIMETAG2
-            if cd.type.upper() == "INSTRUMENT" or cd.type.upper() == "VLF_INSTRUMENT":
-                instrumentId = cd.id
-
-            # Stores value in dataset or attribute depending on type
-
+        for cd, v in zip(self.data, values):
             # Stores raw data into hdf datasets according to type
             if cd.fitType.upper() != "NONE" and cd.fitType.upper() != "DELIMITER":
                 cdtype = cd.type.upper()
@@ -189,47 +216,13 @@ class CalibrationFile:
                     ds = gp.getDataset(cd.type)
                     if ds is None:
                         ds = gp.addDataset(cd.type)
-                    #print(cd.id)
-                    #ds.temp.append(v)
-                    #ds.addColumn(cd.id)
                     ds.appendColumn(cd.id, v)
-                else:
-                    if sys.version_info[0] < 3: # Python3
-                        gp.attributes[cdtype.encode('utf-8')] = cd.id
-                    else: # Python2
-                        gp.attributes[cdtype] = cd.id
+        self.storeAttributes(gp)
 
-            # None types are stored as attributes
-            if cd.fitType.upper() == "NONE":
-                cdtype = cd.type.upper()
-                if cdtype == "SN" or cdtype == "DATARATE" or cdtype == "RATE":
-                    if sys.version_info[0] < 3:
-                        gp.attributes[cdtype.encode('utf-8')] = cd.id
-                    else:
-                        gp.attributes[cdtype] = cd.id
-
-
-        # Some instruments produce additional bytes for
-        # DATETAG (3 bytes), and TIMETAG2 (4 bytes)        
-        #       apparently SATMSG does not .... comes out jibberish
-        #       $GPGGA also does not work and timetags will be added later from NMEA strings 
-        if instrumentId.startswith("SATHED") or \
-            instrumentId.startswith("SATHLD") or \
-            instrumentId.startswith("SATHSE") or \
-            instrumentId.startswith("SATHSL") or \
-            instrumentId.startswith("SATPYR") or \
-            instrumentId.startswith("SATNAV") or \
-            instrumentId.startswith("$GPRMC") or \
-            instrumentId.startswith("SATTHS") or \
-            instrumentId.startswith("UMTWR"):
-            #    instrumentId.startswith("SATMSG") or \
-            #print("not gps")
+        if self.hasTimeTags():
             # Read DATETAG
             b = msg[nRead:nRead+3]
-            if sys.version_info[0] < 3:
-                v = int(binascii.hexlify(b), 16)
-            else:
-                v = int.from_bytes(b, byteorder='big', signed=False)
+            v = int.from_bytes(b, byteorder='big', signed=False)
             nRead += 3
             #print("Date:",v)
             ds1 = gp.getDataset("DATETAG")
@@ -238,10 +231,7 @@ class CalibrationFile:
             ds1.appendColumn("NONE", v)
             # Read TIMETAG2
             b = msg[nRead:nRead+4]
-            if sys.version_info[0] < 3:
-                v = int(binascii.hexlify(b), 16)
-            else:
-                v = int.from_bytes(b, byteorder='big', signed=False)
+            v = int.from_bytes(b, byteorder='big', signed=False)
             nRead += 4
             #print("Time:",v)
             ds1 = gp.getDataset("TIMETAG2")
@@ -250,3 +240,58 @@ class CalibrationFile:
             ds1.appendColumn("NONE", v)
 
         return nRead
+
+    # Decodes every complete frame of this type at once from the raw file buffer (e.g. an mmap)
+    # offsets are the frame start positions. Requires getFrameDtype() to return a dtype.
+    # Returns a boolean mask of the frames that were stored (False where a field failed to parse).
+    def convertRawFrames(self, buffer, offsets, gp):
+        dtype, frameLength = self.getFrameDtype()
+        raw = np.frombuffer(buffer, dtype=np.uint8)
+        index = np.asarray(offsets, dtype=np.int64)[:, None] + np.arange(frameLength)
+        frames = raw[index].view(dtype).reshape(len(offsets))
+        del raw
+
+        # Values of every stored field; ASCII fields parse one value at a time and may fail
+        good = np.ones(len(offsets), dtype=bool)
+        columns = {}
+        for i, cd in enumerate(self.data):
+            name = f"f{i}"
+            if name not in dtype.names:
+                continue
+            if cd.dataType.upper() in CalibrationData.ASCII_TYPES:
+                values = []
+                for n, row in enumerate(frames[name]):
+                    try:
+                        values.append(cd.convertRaw(row.tobytes()))
+                    except Exception:
+                        values.append(None)
+                        if good[n]:
+                            good[n] = False
+                            pmsg = f'Unable to convert the following raw message: {frames[n].tobytes()}'
+                            print(pmsg)
+                            Utilities.writeLogFile(pmsg)
+                columns[i] = values
+            else:
+                columns[i] = CalibrationData.binaryValues(frames[name], cd.dataType)
+        if not good.all():
+            columns = {i: [v for v, ok in zip(values, good) if ok] for i, values in columns.items()}
+            frames = frames[good]
+
+        for i, cd in enumerate(self.data):
+            if cd.fitType.upper() != "NONE" and cd.fitType.upper() != "DELIMITER":
+                cdtype = cd.type.upper()
+                if cdtype not in ('INSTRUMENT', 'VLF_INSTRUMENT', 'SN', 'VLF_SN'):
+                    ds = gp.getDataset(cd.type)
+                    if ds is None:
+                        ds = gp.addDataset(cd.type)
+                    # Zero length fields read as 0
+                    ds.extendColumn(cd.id, columns.get(i, [0] * len(frames)))
+        self.storeAttributes(gp)
+
+        if "DATETAG" in dtype.names:
+            for name in ("DATETAG", "TIMETAG2"):
+                ds1 = gp.getDataset(name)
+                if ds1 is None:
+                    ds1 = gp.addDataset(name)
+                ds1.extendColumn("NONE", CalibrationData.binaryValues(frames[name], "BU"))
+        return good
@@ -1,52 +1,166 @@
 '''Read in calibration and telemetry definition files'''
 import collections
+import hashlib
+import inspect
+import io
 import os.path
+import pickle
 import shutil
+import sys
+import tempfile
 import zipfile
+import zlib
 
+from Source import PATH_TO_DATA
+from Source.CalibrationData import CalibrationData
 from Source.CalibrationFile import CalibrationFile
+from Source.Utilities import Utilities
 
 
 class CalibrationFileReader:
     '''Read in calibration and telemetry definition files. Return the calibrationMap.'''
+
+    # Parsed calibration maps are pickled here, named by a hash of the source file contents
+    CACHE_DIR = os.path.join(PATH_TO_DATA, 'Cache', 'Calibration')
+    # Bump when the pickle layout changes; edits to CalibrationFile/CalibrationData are keyed by their source
+    CACHE_VERSION = 2
+    # In-process copy of the pickles, so batch runs skip the disk as well
+    _memo = {}
+    _classDigest = None
+    cacheStats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def isCalibrationFile(name):
+        return os.path.splitext(name)[1].lower() in ('.cal', '.tdf')
+
+    @staticmethod
+    def classDigest():
+        ''' Hash of the pickled classes' source, so a change to them invalidates old pickles '''
+        if CalibrationFileReader._classDigest is None:
+            h = hashlib.sha256()
+            for cls in (CalibrationFile, CalibrationData):
+                try:
+                    h.update(inspect.getsource(sys.modules[cls.__module__]).encode('utf-8'))
+                except (OSError, TypeError):
+                    # No source (e.g. a frozen build); fall back to the class layout
+                    h.update(repr(sorted(vars(cls))).encode('utf-8'))
+            CalibrationFileReader._classDigest = h.hexdigest()
+        return CalibrationFileReader._classDigest
+
+    @staticmethod
+    def cacheKey(items):
+        ''' Hash (name, fingerprint) pairs in order, with the cache version and class digest '''
+        h = hashlib.sha256(f'calibration-v{CalibrationFileReader.CACHE_VERSION}'.encode('utf-8'))
+        h.update(CalibrationFileReader.classDigest().encode('utf-8'))
+        for name, fingerprint in items:
+            h.update(name.encode('utf-8') + b'\0')
+            h.update(len(fingerprint).to_bytes(8, 'little'))
+            h.update(fingerprint)
+        return h.hexdigest()
+
+    @staticmethod
+    def loadCache(key):
+        ''' Return a fresh calibrationMap for key, or None on a cache miss '''
+        # Unpickle per call: callers (e.g. Controller.generateContext) mutate the map
+        blob = CalibrationFileReader._memo.get(key)
+        if blob is not None:
+            return pickle.loads(blob)
+
+        fp = os.path.join(CalibrationFileReader.CACHE_DIR, key + '.pkl')
+        if not os.path.isfile(fp):
+            return None
+        try:
+            with open(fp, 'rb') as f:
+                blob = f.read()
+            calibrationMap = pickle.loads(blob)
+        except Exception:
+            # Truncated or stale pickle; it is rewritten after parsing
+            return None
+        CalibrationFileReader._memo[key] = blob
+        return calibrationMap
+
+    @staticmethod
+    def saveCache(key, calibrationMap):
+        blob = pickle.dumps(calibrationMap, protocol=pickle.HIGHEST_PROTOCOL)
+        CalibrationFileReader._memo[key] = blob
+        try:
+            os.makedirs(CalibrationFileReader.CACHE_DIR, exist_ok=True)
+            # Write then rename, so concurrent workers never read a partial file
+            with tempfile.NamedTemporaryFile(dir=CalibrationFileReader.CACHE_DIR, suffix='.tmp', delete=False) as f:
+                f.write(blob)
+            os.replace(f.name, os.path.join(CalibrationFileReader.CACHE_DIR, key + '.pkl'))
+        except OSError as err:
+            msg = f'CalibrationFileReader: unable to write calibration cache: {err}'
+            print(msg)
+            Utilities.writeLogFile(msg)
+
+    @staticmethod
+    def parse(items, readContent):
+        ''' Parse calibration files into a calibrationMap, using the cache when possible.
+            items are (name, fingerprint) pairs; readContent(name) is only called on a cache miss '''
+        key = CalibrationFileReader.cacheKey(items)
+        calibrationMap = CalibrationFileReader.loadCache(key)
+        if calibrationMap is not None:
+            CalibrationFileReader.cacheStats['hits'] += 1
+            return calibrationMap
+        CalibrationFileReader.cacheStats['misses'] += 1
+
+        calibrationMap = collections.OrderedDict()
+        for name, _ in items:
+            f = io.BytesIO(readContent(name))
+            f.name = name
+            cf = CalibrationFile()
+            cf.read(f)
+            #print("id:", cf.id)
+            calibrationMap[name] = cf
+        CalibrationFileReader.saveCache(key, calibrationMap)
+        return calibrationMap
+
     # reads calibration files stored in directory
     @staticmethod
     def read(fp):
-        calibrationMap = collections.OrderedDict()
+        contents = collections.OrderedDict()
 
         for (dirpath, dirnames, filenames) in os.walk(fp):
             for name in filenames:
                 #print("infile:", name)
-                if os.path.splitext(name)[1].lower() == ".cal" or \
-                   os.path.splitext(name)[1].lower() == ".tdf":
+                if CalibrationFileReader.isCalibrationFile(name):
                     with open(os.path.join(dirpath, name), 'rb') as f:
-                        cf = CalibrationFile()
-                        cf.read(f)
-                        #print("id:", cf.id)
-                        calibrationMap[name] = cf
+                        contents[name] = f.read()
             break
 
-        return calibrationMap
+        return CalibrationFileReader.parse(list(contents.items()), contents.get)
+
+    @staticmethod
+    def fileCrc(fp):
+        crc = 0
+        with open(fp, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                crc = zlib.crc32(chunk, crc)
+        return crc
 
     # reads calibration files stored in .sip file (renamed .zip)
     @staticmethod
     def readSip(fp):
-        calibrationMap = collections.OrderedDict()
+        items = []
+        [dest,_] = os.path.split(fp)
 
         with zipfile.ZipFile(fp, 'r') as zf:
             for finfo in zf.infolist():
                 if not str(finfo.filename).startswith('__MACOSX/'):
                     print("infile:", finfo.filename)
-                    if os.path.splitext(finfo.filename)[1].lower() == ".cal" or \
-                    os.path.splitext(finfo.filename)[1].lower() == ".tdf":
-                        with zf.open(finfo) as f:
-                            cf = CalibrationFile()
-                            cf.read(f)
-                            #print("id:", cf.id)
-                            calibrationMap[finfo.filename] = cf
-                            [dest,_] = os.path.split(fp)
-                            src = zf.extract(f.name,path=dest)
-                            [_,fname] = os.path.split(f.name)
-                            shutil.move(src, os.path.join(dest,fname))
+                    if CalibrationFileReader.isCalibrationFile(finfo.filename):
+                        # The central directory's CRC and size identify the member without decompressing it
+                        items.append((finfo.filename, f'{finfo.CRC:08x}:{finfo.file_size}'.encode('utf-8')))
 
-        return calibrationMap
+                        # Extract flat into the calibration folder, unless an identical copy is there
+                        [_,fname] = os.path.split(finfo.filename)
+                        target = os.path.join(dest, fname)
+                        if os.path.isfile(target) and os.path.getsize(target) == finfo.file_size \
+                                and CalibrationFileReader.fileCrc(target) == finfo.CRC:
+                            continue
+                        src = zf.extract(finfo, path=dest)
+                        if os.path.abspath(src) != os.path.abspath(target):
+                            shutil.move(src, target)
+
+            return CalibrationFileReader.parse(items, zf.read)
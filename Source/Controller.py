@@ -2,6 +2,7 @@
 import os
 import datetime
 import collections
+import traceback
 import numpy as np
 
 from Source import PATH_TO_CONFIG, PACKAGE_DIR
@@ -31,6 +32,8 @@ class Controller:
     @staticmethod
     def writeReport(fileName, pathOut, outFilePath, level, inFilePath):
         print('Writing PDF Report...')
+        # The report includes the logs, so write out what is still buffered
+        Utilities.flushLogFile()
         numLevelDict = {'L1A':1,'L1AQC':2,'L1B':3,'L1BQC':4,'L2':5}
         numLevel = numLevelDict[level]
 
@@ -59,6 +62,7 @@ class Controller:
                         Utilities.errorWindow("File Error", msg)
                     print(msg)
                     Utilities.writeLogFile(msg)
+                    Utilities.flushLogFile()
                     return
 
             else:
@@ -138,6 +142,7 @@ class Controller:
             Utilities.errorWindow("File Error", msg)
             print(msg)
             Utilities.writeLogFile(msg)
+            Utilities.flushLogFile()
 
     @staticmethod
     def generateContext(calibrationMap):
@@ -297,6 +302,7 @@ class Controller:
                         Utilities.errorWindow("File Error", msg)
                     print(msg)
                     Utilities.writeLogFile(msg)
+                    Utilities.flushLogFile()
                     return None, None
             else:
                 msg = "L1a processing failed. Nothing to output."
@@ -318,12 +324,13 @@ class Controller:
         # Process the data
         print("ProcessL1aqc")
         try:
-            root = HDFRoot.readHDF5(inFilePath)
+            root = HDFRoot.readHDF5(inFilePath, lazy=True)
         except Exception:
             msg = "Unable to open file. May be open in another application."
             Utilities.errorWindow("File Error", msg)
             print(msg)
             Utilities.writeLogFile(msg)
+            Utilities.flushLogFile()
             return None
 
         # At this stage the Anomanal parameterizations are current in ConfigFile.settings,
@@ -340,6 +347,7 @@ class Controller:
                     Utilities.errorWindow("File Error", msg)
                 print(msg)
                 Utilities.writeLogFile(msg)
+                Utilities.flushLogFile()
                 return None
         else:
             msg = "L1aqc processing failed. Nothing to output."
@@ -363,12 +371,13 @@ class Controller:
         print(msg)
         Utilities.writeLogFile(msg)
         try:
-            root = HDFRoot.readHDF5(inFilePath)
+            root = HDFRoot.readHDF5(inFilePath, lazy=True)
         except Exception:
             msg = "Controller.processL1b: Unable to open HDF file. May be open in another application."
             Utilities.errorWindow("File Error", msg)
             print(msg)
             Utilities.writeLogFile(msg)
+            Utilities.flushLogFile()
             return None
 
         if flag_Trios == 0:
@@ -388,6 +397,7 @@ class Controller:
                 Utilities.errorWindow("File Error", msg)
                 print(msg)
                 Utilities.writeLogFile(msg)
+                Utilities.flushLogFile()
                 return None
         else:
             msg = "L1b processing failed. Nothing to output."
@@ -410,12 +420,13 @@ class Controller:
         # Process the data
         print("ProcessL1bqc")
         try:
-            root = HDFRoot.readHDF5(inFilePath)
+            root = HDFRoot.readHDF5(inFilePath, lazy=True)
         except Exception:
             msg = "Unable to open file. May be open in another application."
             Utilities.errorWindow("File Error", msg)
             print(msg)
             Utilities.writeLogFile(msg)
+            Utilities.flushLogFile()
             return None
 
         root.attributes['In_Filepath'] = inFilePath
@@ -430,6 +441,7 @@ class Controller:
                 Utilities.errorWindow("File Error", msg)
                 print(msg)
                 Utilities.writeLogFile(msg)
+                Utilities.flushLogFile()
                 return None,
         else:
             msg = "L1bqc processing failed. Nothing to output."
@@ -492,6 +504,7 @@ class Controller:
                 Utilities.errorWindow("File Error", msg)
                 print(msg)
                 Utilities.writeLogFile(msg)
+                Utilities.flushLogFile()
                 return None
         else:
             msg = "L2 processing failed. Nothing to output."
@@ -503,8 +516,20 @@ class Controller:
 
     # Process every file in a list of files 1 level
     @staticmethod
-    # def processSingleLevel(pathOut, inFilePath, calibrationMap, level, ancFile=None):
     def processSingleLevel(pathOut, inFilePath, calibrationMap, level, flag_Trios):
+        ''' Process one level; if it raises, the traceback and the buffered log are put on disk first '''
+        try:
+            return Controller._processSingleLevel(pathOut, inFilePath, calibrationMap, level, flag_Trios)
+        except Exception:
+            msg = f'Controller.processSingleLevel: {level} processing failed'
+            print(msg)
+            Utilities.writeLogFile(f'{msg}\n{traceback.format_exc()}')
+            Utilities.flushLogFile()
+            raise
+
+    @staticmethod
+    # def processSingleLevel(pathOut, inFilePath, calibrationMap, level, ancFile=None):
+    def _processSingleLevel(pathOut, inFilePath, calibrationMap, level, flag_Trios):
         # Find the absolute path to the output directory
         pathOut = os.path.abspath(pathOut)
 
@@ -643,7 +668,7 @@ class Controller:
             try:
                 # root variable is replaced by L2 node unless station extraction, in which case
                 #   it is retained and node is returned from ProcessL2
-                root = HDFRoot.readHDF5(inFilePath)
+                root = HDFRoot.readHDF5(inFilePath, lazy=True)
                 root.attributes['L1BQC_FILE_NAME'] = inFileName
                 del root.attributes["In_Filepath"]
             except Exception:
@@ -651,6 +676,7 @@ class Controller:
                 Utilities.errorWindow("File Error", msg)
                 print(msg)
                 Utilities.writeLogFile(msg)
+                Utilities.flushLogFile()
                 return False#None, outFilePath
 
             # Check for new 6S model group
@@ -780,6 +806,9 @@ class Controller:
                             root.attributes['SeaBASS_File_Name_Base'] = baseName
                             root.writeHDF5(outFilePath)
 
+        # Level done: put its log on disk (also covers pool workers, which skip atexit)
+        Utilities.flushLogFile()
+
         # If the process failed at any level, write a report and return
         if root is None and ConfigFile.settings["bL2Stations"] == 0:
             if ConfigFile.settings["bL2WriteReport"] == 1:
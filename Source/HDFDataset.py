@@ -1,15 +1,119 @@
 import collections
+import copy
+import os
 import sys
 
+import h5py
 import numpy as np
+from numpy.lib import recfunctions
+
+# Target chunk size when writing compressed datasets. Chunks always span whole rows
+# (i.e., complete spectra), so reading one timestamp touches one chunk.
+CHUNK_BYTES = 256 * 1024
+# Datasets smaller than this are written contiguously; chunk overhead would outweigh the gain
+MIN_COMPRESS_BYTES = 4096
+
+class HDFFileLoader:
+    ''' One read handle shared by the lazily read datasets of a file. The file is opened on
+        the first load and closed once every dataset has been loaded (or replaced), or when the
+        root overwrites the file. Loading after the file has changed on disk raises. '''
+    def __init__(self, fp):
+        self.fp = os.path.abspath(fp)
+        self.pending = 0
+        self._file = None
+        self._stamp = self.stamp()
+
+    def stamp(self):
+        stat = os.stat(self.fp)
+        return stat.st_mtime_ns, stat.st_size
+
+    def read(self, name):
+        if self._file is None:
+            if not os.path.isfile(self.fp) or self.stamp() != self._stamp:
+                raise IOError(f'{self.fp} has changed since it was opened; its unread datasets are lost')
+            self._file = h5py.File(self.fp, "r")
+        data = self._file[name][:]
+        self.release()
+        return data
+
+    def release(self):
+        ''' A dataset no longer needs the file '''
+        self.pending -= 1
+        if self.pending <= 0:
+            self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Copies of a lazy dataset share the loader; h5py handles cannot be copied
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
 
 class HDFDataset:
     def __init__(self):
         self.id = ""
         self.attributes = collections.OrderedDict()
         self.columns = collections.OrderedDict()
+        self._source = None
         self.data = None
 
+    @property
+    def data(self):
+        ''' The numpy array; lazily read datasets are loaded from file on first access '''
+        if self._source is not None:
+            self.load()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        # Assigning data replaces anything still waiting to be read from file
+        if self._source is not None:
+            self._source[0].release()
+        self._source = None
+        self._data = value
+
+    # A copy of a lazy dataset is one more dataset waiting on the loader, so the file stays open for it
+    def __copy__(self):
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        if new._source is not None:
+            new._source[0].pending += 1
+        return new
+
+    def __deepcopy__(self, memo):
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        for k, v in self.__dict__.items():
+            new.__dict__[k] = copy.deepcopy(v, memo)
+        if new._source is not None:
+            new._source[0].pending += 1
+        return new
+
+    def __getstate__(self):
+        # The loader's file handle cannot be pickled; read the data first
+        self.load()
+        return self.__dict__
+
+    def getSourceFile(self):
+        ''' Path of the file a lazy dataset will be read from, or None once loaded '''
+        if self._source is None:
+            return None
+        return self._source[0].fp
+
+    def load(self):
+        ''' Reads a lazily opened dataset through its file's shared loader '''
+        if self._source is None:
+            return
+        loader, name = self._source
+        self._data = loader.read(name)
+        self._source = None
+
     def copy(self, ds):
         self.copyAttributes(ds)
         self.data = np.copy(ds.data)
@@ -29,7 +133,9 @@ class HDFDataset:
     def printd(self):
         print("Dataset:", self.id)
 
-    def read(self, f):
+    def read(self, f, loader=None):
+        ''' Reads attributes immediately. With an HDFFileLoader the data array is only
+            read from the file the first time it is accessed. '''
         name = f.name[f.name.rfind("/")+1:]
         self.id = name
 
@@ -43,17 +149,41 @@ class HDFDataset:
                 self.attributes[k] = f.attrs[k].decode("utf-8")
 
         # Read dataset
-        self.data = f[:] # Gets converted to numpy.ndarray
+        if loader is not None:
+            loader.pending += 1
+            self._source = (loader, f.name)
+            self._data = None
+        else:
+            self.data = f[:] # Gets converted to numpy.ndarray
         # print("Dataset:", name)
         # print("Data:", self.data.dtype)
 
-    def write(self, f):
+    def storageOptions(self, compression=None, compressionLevel=None, shuffle=False):
+        ''' h5py create_dataset keywords for chunking and lossless compression.
+            compression: None/'none', 'gzip' or 'lzf' '''
+        if compression not in (None, 'none', 'gzip', 'lzf'):
+            raise ValueError(f"Unknown HDF5 compression '{compression}'; use 'none', 'gzip' or 'lzf'")
+        data = np.asarray(self.data)
+        if compression in (None, 'none') or data.ndim == 0 or data.size == 0 \
+                or data.nbytes < MIN_COMPRESS_BYTES:
+            return {}
+
+        rowBytes = data.dtype.itemsize * int(np.prod(data.shape[1:]))
+        rows = int(max(1, min(data.shape[0], CHUNK_BYTES // max(rowBytes, 1))))
+        options = {'chunks': (rows,) + data.shape[1:], 'compression': compression,
+                   'shuffle': bool(shuffle)}
+        if compression == 'gzip' and compressionLevel is not None:
+            options['compression_opts'] = int(compressionLevel)
+        return options
+
+    def write(self, f, compression=None, compressionLevel=None, shuffle=False):
         #print("id:", self.id)
         #print("columns:", self.columns)
         #print("data:", self.data)
 
         if self.data is not None:
-            dset = f.create_dataset(self.id, data=self.data, dtype=self.data.dtype)
+            options = self.storageOptions(compression, compressionLevel, shuffle)
+            dset = f.create_dataset(self.id, data=self.data, dtype=self.data.dtype, **options)
             # f = f.create_group(self.id)
             # Write attributes
             for k in self.attributes:
@@ -72,12 +202,76 @@ class HDFDataset:
         else:
             self.columns[name].append(val)
 
+    def extendColumn(self, name, vals):
+        if name not in self.columns:
+            self.columns[name] = list(vals)
+        else:
+            self.columns[name].extend(vals)
+
+    def getColumnNames(self):
+        ''' Returns the column names of the numpy array, in order '''
+        if self.data is None or self.data.dtype.names is None:
+            return []
+        return list(self.data.dtype.names)
+
+    def isHomogeneous(self, names=None):
+        ''' True if the (selected) columns of the numpy array share a single numeric dtype '''
+        if self.data is None or self.data.dtype.names is None:
+            return False
+        if names is None:
+            names = self.data.dtype.names
+        dtypes = {self.data.dtype.fields[k][0] for k in names}
+        if len(dtypes) != 1:
+            return False
+        dtype = dtypes.pop()
+        return np.issubdtype(dtype, np.number) and dtype.shape == ()
+
+    def toArray(self, names=None):
+        ''' Returns the (selected) columns as a 2-D (rows x columns) numeric array.
+            When the columns share one dtype this is a view on the dataset, not a copy,
+            so in-place changes to the array are seen in self.data. Raises TypeError
+            for non-numeric columns. '''
+        if self.data is None:
+            print("Warning - toArray: data is empty")
+            return None
+        if names is None:
+            names = self.data.dtype.names
+        names = list(names)
+        if self.isHomogeneous(names) and not self.data.dtype.hasobject:
+            return recfunctions.structured_to_unstructured(self.data[names], copy=False)
+        # Object columns (e.g. Datetime) have no float value; select the numeric columns instead
+        nonNumeric = [k for k in names if not np.issubdtype(self.data.dtype.fields[k][0], np.number)
+                      and self.data.dtype.fields[k][0] != np.bool_]
+        if nonNumeric:
+            raise TypeError(f'toArray: {self.id} columns {nonNumeric} are not numeric')
+        # Mixed numeric types cannot be viewed; copy instead
+        return np.column_stack([self.data[k] for k in names]).astype(np.float64)
+
+    def fromArray(self, array, names, dtype=np.float64):
+        ''' Builds the numpy array from a 2-D (rows x columns) array and a list of column
+            names in one pass. The result shares one contiguous buffer, so later
+            toArray() calls are zero-copy. '''
+        array = np.ascontiguousarray(array, dtype=dtype)
+        if array.ndim == 1:
+            array = array.reshape(-1, 1)
+        if array.shape[1] != len(names):
+            print(f"Warning - fromArray: {array.shape[1]} columns for {len(names)} names")
+            return False
+        structType = np.dtype([(str(name), dtype) for name in names])
+        self.data = array.view(structType).reshape(array.shape[0])
+        return True
+
     def datasetToColumns(self):
         ''' Converts numpy array into columns (stored as a dictionary) '''
         if self.data is None:
             print("Warning - datasetToColumns: data is empty")
             return
         self.columns = collections.OrderedDict()
+        if self.isHomogeneous() and len(self.data.dtype.names) > 1:
+            # Single conversion of the 2-D view rather than one per column
+            for k, col in zip(self.data.dtype.names, self.toArray().T.tolist()):
+                self.columns[k] = col
+            return
         for k in self.data.dtype.names:
             #print("type",type(ltData.data[k]))
             self.columns[k] = self.data[k].tolist()
@@ -128,6 +322,16 @@ class HDFDataset:
         #print("Id:", self.id)
         #print("Dtype:", dtype)
         #print("Shape:", shape)
+
+        # Spectral datasets are all-float; build them as one contiguous 2-D block
+        if len(dtype) > 1 and all(dt is np.float64 or dt is float for _, dt in dtype):
+            try:
+                array = np.array(list(self.columns.values()), dtype=np.float64)
+            except (TypeError, ValueError):
+                array = None
+            if array is not None and array.shape == (len(dtype), shape[0]):
+                return self.fromArray(array.T, list(self.columns.keys()))
+
         self.data = np.empty(shape, dtype=dtype) # empty means uninitialized, i.e. random values.
         for k,v in self.columns.items():
             # HDF5 deliberately makes including string vectors difficult
@@ -1,6 +1,7 @@
 
 import collections
 import sys
+import weakref
 import h5py
 import numpy as np
 
@@ -8,10 +9,39 @@ from Source.HDFDataset import HDFDataset
 
 class HDFGroup:
     def __init__(self):
+        # Group lists (HDFRoot.groups) holding this group, told to rebuild their id index on rename
+        self._groupLists = []
         self.id = ""
         self.datasets = collections.OrderedDict()
         self.attributes = collections.OrderedDict()
 
+    @property
+    def id(self):
+        return self._id
+
+    @id.setter
+    def id(self, value):
+        self._id = value
+        for ref in self._groupLists:
+            groups = ref()
+            if groups is not None:
+                groups._invalidate()
+
+    def _addGroupList(self, groups):
+        # A list the group has since left only gets a harmless extra rebuild on rename
+        self._groupLists = [ref for ref in self._groupLists if ref() is not None and ref() is not groups]
+        self._groupLists.append(weakref.ref(groups))
+
+    # Weak references cannot be pickled; a copy is registered again by the list it is put in
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_groupLists']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._groupLists = []
+
     def copy(self, gp):
         self.copyAttributes(gp)
         for k, ds in gp.datasets.items():
@@ -27,6 +57,38 @@ class HDFGroup:
             ds = self.datasets[k]
             ds.data = np.delete(ds.data, (i), axis=0)
 
+    def datasetKeepRows(self, keep, exclude=()):
+        ''' Compacts every dataset in one pass, keeping the rows where the boolean mask keep
+            is True. Datasets named in exclude are left untouched, as are datasets of a different
+            length than the mask (i.e., not time series), which are logged. Returns rows removed. '''
+        keep = np.asarray(keep, dtype=bool)
+        skipped = []
+        for k in self.datasets:
+            ds = self.datasets[k]
+            if k in exclude or ds.data is None:
+                continue
+            if len(ds.data) != len(keep):
+                skipped.append(k)
+                continue
+            if isinstance(ds.data, list):
+                # e.g. DATETIME datasets of python datetimes
+                ds.data = [row for row, flag in zip(ds.data, keep) if flag]
+            else:
+                ds.data = ds.data[keep]
+        if skipped:
+            from Source.Utilities import Utilities
+            msg = f'{self.id}: rows not removed from {", ".join(skipped)}, not of length {len(keep)}'
+            print(msg)
+            Utilities.writeLogFile(msg)
+        return int(np.count_nonzero(~keep))
+
+    def datasetDeleteRows(self, rows, length):
+        ''' Deletes every row index in rows from all datasets of length records in one pass
+            (see datasetKeepRows) '''
+        keep = np.ones(length, dtype=bool)
+        keep[np.asarray(rows, dtype=int)] = False
+        return self.datasetKeepRows(keep)
+
     def removeDataset(self, name):
         if len(name) == 0:
             print("Name is 0")
@@ -85,7 +147,7 @@ class HDFGroup:
             ds = self.datasets[k]
             ds.printd()
 
-    def read(self, f):
+    def read(self, f, loader=None):
         name = f.name[f.name.rfind("/")+1:]
         self.id = name
 
@@ -105,9 +167,9 @@ class HDFGroup:
                 #print("Item:", k)
                 ds = HDFDataset()
                 self.datasets[k] = ds
-                ds.read(item)
+                ds.read(item, loader)
 
-    def write(self, f):
+    def write(self, f, compression=None, compressionLevel=None, shuffle=False):
         #print("Group:", self.id)
         try:
             f = f.create_group(self.id)
@@ -117,7 +179,7 @@ class HDFGroup:
             # Write datasets
             for key,ds in self.datasets.items():
                 #f.create_dataset(ds.id, data=np.asarray(ds.data))
-                ds.write(f)
+                ds.write(f, compression, compressionLevel, shuffle)
         except:
             e = sys.exc_info()[0]
             print(e)
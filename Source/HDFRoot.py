@@ -1,17 +1,131 @@
 
+import bisect
 import collections
+import os
+
 import h5py
 import numpy as np
 
 from Source.HDFGroup import HDFGroup
-from Source.HDFDataset import HDFDataset
+from Source.HDFDataset import HDFDataset, HDFFileLoader
+from Source.MainConfig import MainConfig
+
+class HDFGroupList(list):
+    ''' List of groups with an id index for O(1) lookup and a sorted id index for
+        prefix lookups. Both are rebuilt lazily after the list changes or one of its
+        groups is renamed. '''
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._adopt(self)
+        self._invalidate()
+
+    def __reduce__(self):
+        # Rebuilt through __init__, so copies adopt their groups and index afresh
+        return (self.__class__, (list(self),))
+
+    def _adopt(self, gps):
+        for gp in gps:
+            gp._addGroupList(self)
+
+    def _invalidate(self):
+        self._byId = None
+
+    def _index(self):
+        if self._byId is None:
+            # Ids are kept in first-appearance order, each with its groups in list order
+            byId = {}
+            for gp in self:
+                byId.setdefault(gp.id, []).append(gp)
+            self._order = {name: n for n, name in enumerate(byId)}
+            self._sortedIds = sorted(byId)
+            self._byId = byId
+        return self._byId
+
+    def find(self, name):
+        gps = self._index().get(name)
+        # First group wins, as with a linear search
+        return gps[0] if gps else None
+
+    def findByPrefix(self, prefix):
+        byId = self._index()
+        i = bisect.bisect_left(self._sortedIds, prefix)
+        ids = []
+        while i < len(self._sortedIds) and self._sortedIds[i].startswith(prefix):
+            ids.append(self._sortedIds[i])
+            i += 1
+        ids.sort(key=self._order.get)
+        return [gp for name in ids for gp in byId[name]]
+
+    def __setitem__(self, i, value):
+        super().__setitem__(i, value)
+        self._adopt(self[i] if isinstance(i, slice) else [value])
+        self._invalidate()
+
+    def __delitem__(self, i):
+        super().__delitem__(i)
+        self._invalidate()
+
+    def __iadd__(self, other):
+        other = list(other)
+        result = super().__iadd__(other)
+        self._adopt(other)
+        self._invalidate()
+        return result
+
+    def append(self, gp):
+        super().append(gp)
+        gp._addGroupList(self)
+        self._invalidate()
+
+    def extend(self, gps):
+        gps = list(gps)
+        super().extend(gps)
+        self._adopt(gps)
+        self._invalidate()
+
+    def insert(self, i, gp):
+        super().insert(i, gp)
+        gp._addGroupList(self)
+        self._invalidate()
+
+    def remove(self, gp):
+        super().remove(gp)
+        self._invalidate()
+
+    def pop(self, *args):
+        gp = super().pop(*args)
+        self._invalidate()
+        return gp
+
+    def clear(self):
+        super().clear()
+        self._invalidate()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._invalidate()
+
+    def reverse(self):
+        super().reverse()
+        self._invalidate()
+
 
 class HDFRoot:
     def __init__(self):
         self.id = ""
-        self.groups = []
+        self.groups = HDFGroupList()
         self.datasets = []
         self.attributes = collections.OrderedDict()
+        # Shared read handle of a lazily read file, see readHDF5
+        self._loader = None
+
+    @property
+    def groups(self):
+        return self._groups
+
+    @groups.setter
+    def groups(self, value):
+        self._groups = value if isinstance(value, HDFGroupList) else HDFGroupList(value)
 
     def copy(self, node):
         self.copyAttributes(node)
@@ -32,10 +146,11 @@ class HDFRoot:
         return gp
 
     def getGroup(self, name):
-        for gp in self.groups:
-            if gp.id == name:
-                return gp
-        return None
+        return self.groups.find(name)
+
+    def getGroupsByPrefix(self, prefix):
+        ''' Groups whose ids start with prefix, in file order '''
+        return self.groups.findByPrefix(prefix)
 
     def removeGroup(self, name):
         gp = name
@@ -55,9 +170,27 @@ class HDFRoot:
         for gp in self.groups:
             gp.printd()
 
+    def loadFrom(self, fp):
+        ''' Reads any datasets still pending lazy loading from file fp '''
+        fp = os.path.abspath(fp)
+        datasets = list(self.datasets)
+        for gp in self.groups:
+            datasets.extend(gp.datasets.values())
+        for ds in datasets:
+            source = ds.getSourceFile()
+            if source is not None and source == fp:
+                ds.load()
+        # Datasets removed before being read no longer hold the file open
+        if self._loader is not None and self._loader.fp == fp:
+            self._loader.close()
+
     @staticmethod
-    def readHDF5(fp):
+    def readHDF5(fp, lazy=False):
+        ''' With lazy=True, dataset arrays are read on first access rather than
+            up front, so groups a level never touches are never read. '''
         root = HDFRoot()
+        loader = HDFFileLoader(fp) if lazy else None
+        root._loader = loader
         with h5py.File(fp, "r") as f:
 
             # set name to text after last '/'
@@ -84,17 +217,32 @@ class HDFRoot:
                 if isinstance(item, h5py.Group):
                     gp = HDFGroup()
                     root.groups.append(gp)
-                    gp.read(item)
+                    gp.read(item, loader)
                 elif isinstance(item, h5py.Dataset):
                     # print("HDFRoot should not contain datasets")
                     ds = HDFDataset()
                     root.datasets.append(ds)
-                    ds.read(item)
+                    ds.read(item, loader)
 
         return root
 
     # Writing to HDF5 file
-    def writeHDF5(self, fp):
+    def writeHDF5(self, fp, compression=None, compressionLevel=None, shuffle=None):
+        ''' compression: 'none', 'gzip' or 'lzf'. Anything left as None is taken from
+            the hdfCompression, hdfCompressionLevel and hdfShuffle main settings. '''
+        if compression is None:
+            compression = MainConfig.settings.get("hdfCompression", "none")
+        if compressionLevel is None:
+            compressionLevel = MainConfig.settings.get("hdfCompressionLevel", None)
+        if shuffle is None:
+            shuffle = int(MainConfig.settings.get("hdfShuffle", 0)) == 1
+        # Check the setting before the file is truncated
+        if compression not in ('none', 'gzip', 'lzf'):
+            raise ValueError(f"Unknown HDF5 compression '{compression}'; use 'none', 'gzip' or 'lzf'")
+
+        # Overwriting the file a lazy root was read from; pull in what is still on disk first
+        if os.path.isfile(fp):
+            self.loadFrom(fp)
         with h5py.File(fp, "w") as f:
             #print("Root:", self.id)
             # Write attributes
@@ -105,4 +253,4 @@ class HDFRoot:
                 #f.attrs[k+"__GLOSDS"] = np.string_(self.attributes[k])
             # Write groups
             for gp in self.groups:
-                gp.write(f)
+                gp.write(f, compression, compressionLevel, shuffle)
@@ -55,3 +55,7 @@ class MainConfig:
         # MainConfig.settings["metFile"] = ""
         MainConfig.settings["ancFile"] = ""
         MainConfig.settings["popQuery"] = 0
+        # HDF5 output storage: "none", "gzip" or "lzf" (all lossless)
+        MainConfig.settings["hdfCompression"] = "none"
+        MainConfig.settings["hdfCompressionLevel"] = 4 # gzip only, 1-9
+        MainConfig.settings["hdfShuffle"] = 0 # byte shuffle works on whole records for compound types; rarely helps
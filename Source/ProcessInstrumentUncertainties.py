@@ -1007,21 +1007,17 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
         ZEN_avg_coserror[i2:, :] = 0
         return ZEN_avg_coserror
 
+    @staticmethod
+    def Asym_Coserr(coserror, coserror_90):
+        # std across the 4 measurements azi_0, azi_90, zen, -zen of each pixel and zenith. Column -j is the mirrored
+        # zenith, so zenith index 0 is paired with itself
+        mirror = -np.arange(coserror.shape[1]) % coserror.shape[1]
+        return np.std(np.stack([coserror, coserror_90, coserror[:, mirror], coserror_90[:, mirror]], axis=-1), axis=-1)
+
     @staticmethod
     def FHemi_Coserr(ZEN_avg_coserror, zenith_ang):
         # Compute full hemisperical coserror
-        zen0 = np.argmin(np.abs(zenith_ang))
-        zen90 = np.argmin(np.abs(zenith_ang - 90))
-        deltaZen = (zenith_ang[1::] - zenith_ang[:-1])
-
-        full_hemi_coserror = np.zeros(ZEN_avg_coserror.shape[0])
-
-        for i in range(ZEN_avg_coserror.shape[0]):
-            full_hemi_coserror[i] = np.sum(
-                ZEN_avg_coserror[i, zen0:zen90]*np.sin(2*np.pi*zenith_ang[zen0:zen90]/180)*deltaZen[
-                                                                                           zen0:zen90]*np.pi/180)
-
-        return full_hemi_coserror
+        return ProcessL1b_FRMCal.FHemi_Coserr(ZEN_avg_coserror, zenith_ang)
 
     @staticmethod
     def cosine_corr(avg_coserror, full_hemi_coserror, zenith_ang, thermal_corr_mesure, sol_zen, dir_rat):
@@ -1438,14 +1434,8 @@ class HyperOCR(BaseInstrument):
                 # comparing cos_error for symetric zenith (ideally would be 0)
                 zen_avg_coserr = (azi_avg_coserr + azi_avg_coserr[:, ::-1]) / 2.
 
-                # get total error due to asymmetry  todo: find a smart way to do this without for loops
-                tot_asymmetry_err = np.zeros(coserror.shape, float)
-                for i in range(255):
-                    for j in range(45):
-                        tot_asymmetry_err[i, j] = np.std(
-                            [coserror[i, j], coserror_90[i, j],
-                             coserror[i, -j], coserror_90[i, -j]]
-                        )  # get std across the 4 measurements azi_0, azi_90, zen, -zen
+                # get total error due to asymmetry, std across the 4 measurements azi_0, azi_90, zen, -zen
+                tot_asymmetry_err = self.Asym_Coserr(coserror, coserror_90)
 
                 # PDF of total error in cosine, combines TU uncertainties from lab characterisation and asymmetry in
                 # cosine response
@@ -1464,20 +1454,12 @@ class HyperOCR(BaseInstrument):
                 zen0 = np.argmin(np.abs(zenith_ang))
                 zen90 = np.argmin(np.abs(zenith_ang - 90))
                 deltaZen = (zenith_ang[1::] - zenith_ang[:-1])
-                full_hemi_coserror = np.zeros(zen_avg_coserr.shape[0])
-                sensitivity_coeff = np.zeros(zen_avg_coserr.shape[0])
-                zen_unc_sum = np.zeros(zen_avg_coserr.shape[0])
-                for i in range(zen_avg_coserr.shape[0]):
-                    full_hemi_coserror[i] = np.sum(
-                        zen_avg_coserr[i, zen0:zen90] *
-                        np.sin(2 * np.pi * zenith_ang[zen0:zen90] / 180) * deltaZen[zen0:zen90] * np.pi / 180
-                    )
-                    # calculate the sensitivity coefficient from the LPU
-                    sensitivity_coeff[i] = np.sum(
-                        np.cos(2 * np.pi * zenith_ang[zen0:zen90] / 180) * deltaZen[zen0:zen90] * np.pi / 180
-                    )  # sin(x) differentiates to cos(x)
-
-                    zen_unc_sum[i] = np.sum(zen_unc[i, zen0:zen90])
+                full_hemi_coserror = self.FHemi_Coserr(zen_avg_coserr, zenith_ang)
+                # calculate the sensitivity coefficient from the LPU, the same for every pixel
+                sensitivity_coeff = np.full(zen_avg_coserr.shape[0], np.sum(
+                    np.cos(2 * np.pi * zenith_ang[zen0:zen90] / 180) * deltaZen[zen0:zen90] * np.pi / 180
+                ))  # sin(x) differentiates to cos(x)
+                zen_unc_sum = ProcessL1b_FRMCal.rowSum(zen_unc[:, zen0:zen90])
 
                 # get full hemispherical uncertainty using the LPU
                 fhemi_unc = np.sqrt(sensitivity_coeff**2 * zen_unc_sum**2)
@@ -1918,14 +1900,8 @@ class Trios(BaseInstrument):
                 # comparing cos_error for symetric zenith (ideally would be 0)
                 zen_avg_coserr = (azi_avg_coserr + azi_avg_coserr[:, ::-1]) / 2.
 
-                # get total error due to asymmetry  todo: find a smart way to do this without for loops
-                tot_asymmetry_err = np.zeros(coserror.shape, float)
-                for i in range(255):
-                    for j in range(45):
-                        tot_asymmetry_err[i, j] = np.std(
-                            [coserror[i, j], coserror_90[i, j],
-                             coserror[i, -j], coserror_90[i, -j]]
-                        )  # get std across the 4 measurements azi_0, azi_90, zen, -zen
+                # get total error due to asymmetry, std across the 4 measurements azi_0, azi_90, zen, -zen
+                tot_asymmetry_err = self.Asym_Coserr(coserror, coserror_90)
 
                 # PDF of total error in cosine, combines TU uncertainties from lab characterisation and asymmetry in
                 # cosine response
@@ -1944,20 +1920,12 @@ class Trios(BaseInstrument):
                 zen0 = np.argmin(np.abs(zenith_ang))
                 zen90 = np.argmin(np.abs(zenith_ang - 90))
                 deltaZen = (zenith_ang[1::] - zenith_ang[:-1])
-                full_hemi_coserror = np.zeros(zen_avg_coserr.shape[0])
-                sensitivity_coeff = np.zeros(zen_avg_coserr.shape[0])
-                zen_unc_sum = np.zeros(zen_avg_coserr.shape[0])
-                for i in range(zen_avg_coserr.shape[0]):
-                    full_hemi_coserror[i] = np.sum(
-                        zen_avg_coserr[i, zen0:zen90] *
-                        np.sin(2 * np.pi * zenith_ang[zen0:zen90] / 180) * deltaZen[zen0:zen90] * np.pi / 180
-                    )
-                    # calculate the sensitivity coefficient from the LPU
-                    sensitivity_coeff[i] = np.sum(
-                        np.cos(2 * np.pi * zenith_ang[zen0:zen90] / 180) * deltaZen[zen0:zen90] * np.pi / 180
-                    )  # sin(x) differentiates to cos(x)
-
-                    zen_unc_sum[i] = np.sum(zen_unc[i, zen0:zen90])
+                full_hemi_coserror = self.FHemi_Coserr(zen_avg_coserr, zenith_ang)
+                # calculate the sensitivity coefficient from the LPU, the same for every pixel
+                sensitivity_coeff = np.full(zen_avg_coserr.shape[0], np.sum(
+                    np.cos(2 * np.pi * zenith_ang[zen0:zen90] / 180) * deltaZen[zen0:zen90] * np.pi / 180
+                ))  # sin(x) differentiates to cos(x)
+                zen_unc_sum = ProcessL1b_FRMCal.rowSum(zen_unc[:, zen0:zen90])
 
                 # get full hemispherical uncertainty using the LPU
                 fhemi_unc = np.sqrt(sensitivity_coeff ** 2 * zen_unc_sum ** 2)
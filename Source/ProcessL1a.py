@@ -14,6 +14,31 @@ from Source.ConfigFile import ConfigFile
 
 class ProcessL1a:
     '''Process L1A'''
+    @staticmethod
+    def gpggaDateTags(gpsTime, esDateTag):
+        ''' DATETAG and TIMETAG2 lists for GPGGA UTC (HHMMSS.ds) times, which carry no date.
+            Records take the first Es Datetag, or the last one from the first ~24 hr drop in UTC
+            onward when the file crosses UTC 00:00. '''
+        utc = np.asarray(gpsTime, dtype=np.float64)
+        hhmmss = np.trunc(utc).astype(np.int64)
+        h, mmss = np.divmod(hhmmss, 10000)
+        m, s = np.divmod(mmss, 100)
+        # As utcToDateTime, the decimal digits of the UTC are read as hundredths
+        # (i.e., .55 is 550 ms, but .5 is 50 ms)
+        cs = np.round((utc - hhmmss)*100).astype(np.int64)
+        ms = np.where(cs % 10 == 0, cs, cs*10)
+        gpsTimeTag2 = h*10**7 + m*10**5 + s*1000 + ms
+
+        if esDateTag[0] != esDateTag[-1]:
+            # Test for a change of ~24 hrs between each sample and the last sample
+            # Once triggered the first time, this remains true for the remainder of file
+            gpsSec = (h*60 + m)*60 + s
+            newDay = np.logical_or.accumulate(np.diff(gpsSec, prepend=gpsSec[:1]) < -86000)
+            gpsDateTag = np.where(newDay, esDateTag[-1], esDateTag[0])
+        else:
+            gpsDateTag = np.full(len(utc), esDateTag[0])
+        return gpsDateTag.tolist(), gpsTimeTag2.tolist()
+
     @staticmethod
     def processL1a(fp, calibrationMap):
         (_, fileName) = os.path.split(fp)
@@ -116,10 +141,6 @@ class ProcessL1a:
             # Need year-gang and sometimes Datetag from one of the sensors
             if gp.id.startswith("HSE"):
                 esDateTag = gp.datasets["DATETAG"].columns["NONE"]
-                esTimeTag2 = gp.datasets["TIMETAG2"].columns["NONE"]
-                esSec = []
-                for time in esTimeTag2:
-                    esSec.append(Utilities.timeTag2ToSec(time))
 
         if gps == 1:
             gpsGroup.addDataset("DATETAG")
@@ -145,38 +166,11 @@ class ProcessL1a:
                 # on whether UTC 00:00 was crossed.
                 # If the date does not change in Es, then no problem, use the Datetag of Es first element.
                 # Otherwise, change the datetag at midnight by one day
-                gpsDateTag = []
-                gpsTimeTag2 = []
-
                 if esDateTag[0] != esDateTag[-1]:
                     msg = "ProcessL1a.processL1a: Warning: File crosses UTC 00:00. Adjusting timestamps for matchup of Datetag."
                     print(msg)
                     Utilities.writeLogFile(msg)
-                    newDay = False
-                    for time in gpsTime:
-                        gpsSec = Utilities.utcToSec(time)
-                        if 'gpsSecPrior' not in locals():
-                            gpsSecPrior = gpsSec
-                        # Test for a change of ~24 hrs between this sample and the last sample
-                        # To cross 0, gpsSecPrior would need to be approaching 86400 seconds
-                        # In that case, take the final Es Datetag
-                        if (gpsSecPrior - gpsSec) > 86000:
-                            # Once triggered the first time, this will remain true for remainder of file
-                            newDay = True
-                        if newDay is True:
-                            gpsDateTag.append(esDateTag[-1])
-                            dtDate = Utilities.dateTagToDateTime(esDateTag[-1])
-                            gpsTimeTag2.append(Utilities.datetime2TimeTag2(Utilities.utcToDateTime(dtDate,time)))
-                        else:
-                            gpsDateTag.append(esDateTag[0])
-                            dtDate = Utilities.dateTagToDateTime(esDateTag[0])
-                            gpsTimeTag2.append(Utilities.datetime2TimeTag2(Utilities.utcToDateTime(dtDate,time)))
-                        gpsSecPrior = gpsSec
-                else:
-                    for time in gpsTime:
-                        gpsDateTag.append(esDateTag[0])
-                        dtDate = Utilities.dateTagToDateTime(esDateTag[0])
-                        gpsTimeTag2.append(Utilities.datetime2TimeTag2(Utilities.utcToDateTime(dtDate,time)))
+                gpsDateTag, gpsTimeTag2 = ProcessL1a.gpggaDateTags(gpsTime, esDateTag)
 
                 gpsGroup.datasets["DATETAG"].columns["NONE"] = gpsDateTag
                 gpsGroup.datasets["TIMETAG2"].columns["NONE"] = gpsTimeTag2
@@ -206,7 +200,7 @@ class ProcessL1a:
                 if 'FrameTag' in gp.attributes:
                     if gp.attributes["FrameTag"].startswith("SATNAV") or gp.attributes["FrameTag"].startswith("UMTWR"):
                         elevData = gp.getDataset("ELEVATION")
-                        elevation = elevData.data.tolist()
+                        elevation = elevData.toArray()
                         szaLimit = float(ConfigFile.settings["fL1aCleanSZAMax"])
 
                         # NOTE: It would be good to add local time as a printed output with SZA
@@ -1,5 +1,4 @@
 ''' Process L1A to L1AQC '''
-import math
 import datetime
 import copy
 import numpy as np
@@ -28,41 +27,20 @@ class ProcessL1aqc:
         print(msg)
         Utilities.writeLogFile(msg)
 
-        # Delete the records in badTime ranges from each dataset in the group
-        finalCount = 0
+        # Delete the records in badTime ranges from each dataset in the group at once
         originalLength = len(timeStamp)
-        for dateTime in badTimes:
-            # Need to reinitialize for each loop
-            startLength = len(timeStamp)
-            newTimeStamp = []
-
-            start = dateTime[0]
-            stop = dateTime[1]
-
-            # msg = f'Eliminate data between: {dateTime}'
-            # print(msg)
-            # Utilities.writeLogFile(msg)
-
-            if startLength > 0:
-                rowsToDelete = []
-                for i in range(startLength):
-                    if start <= timeStamp[i] and stop >= timeStamp[i]:
-                        rowsToDelete.append(i)
-                        finalCount += 1
-                    else:
-                        newTimeStamp.append(timeStamp[i])
-                group.datasetDeleteRow(rowsToDelete)
-            else:
-                msg = 'Data group is empty. Continuing.'
-                print(msg)
-                Utilities.writeLogFile(msg)
-            timeStamp = newTimeStamp.copy()
+        if originalLength == 0 and len(badTimes) > 0:
+            msg = 'Data group is empty. Continuing.'
+            print(msg)
+            Utilities.writeLogFile(msg)
+        finalCount = group.datasetKeepRows(Utilities.badTimesMask(timeStamp, badTimes),
+                                           Utilities.characterizationDatasets(group))
 
         msg = f'   Length of records removed from dataset: {finalCount}'
         print(msg)
         Utilities.writeLogFile(msg)
 
-        return finalCount/originalLength
+        return finalCount/originalLength if originalLength > 0 else 1.0
 
     @staticmethod
     def filterData_ADJUSTED(group, badTimes):
@@ -80,41 +58,65 @@ class ProcessL1aqc:
         print(msg)
         Utilities.writeLogFile(msg)
 
-        # Delete the records in badTime ranges from each dataset in the group
-        finalCount = 0
+        # Delete the records in badTime ranges from each dataset in the group at once
         originalLength = len(timeStamp)
-        for dateTime in badTimes:
-            # Need to reinitialize for each loop
-            startLength = len(timeStamp)
-            newTimeStamp = []
-
-            start = dateTime[0]
-            stop = dateTime[1]
-
-            # msg = f'Eliminate data between: {dateTime}'
-            # print(msg)
-            # Utilities.writeLogFile(msg)
-
-            if startLength > 0:
-                rowsToDelete = []
-                for i in range(startLength):
-                    if start <= timeStamp[i] and stop >= timeStamp[i]:
-                        rowsToDelete.append(i)
-                        finalCount += 1
-                    else:
-                        newTimeStamp.append(timeStamp[i])
-                group.datasetDeleteRow(rowsToDelete)
-            else:
-                msg = 'Data group is empty. Continuing.'
-                print(msg)
-                Utilities.writeLogFile(msg)
-            timeStamp = newTimeStamp.copy()
+        if originalLength == 0 and len(badTimes) > 0:
+            msg = 'Data group is empty. Continuing.'
+            print(msg)
+            Utilities.writeLogFile(msg)
+        finalCount = group.datasetKeepRows(Utilities.badTimesMask(timeStamp, badTimes),
+                                           Utilities.characterizationDatasets(group))
 
         msg = f'   Length of records removed from dataset: {finalCount}'
         print(msg)
         Utilities.writeLogFile(msg)
 
-        return finalCount/originalLength
+        return finalCount/originalLength if originalLength > 0 else 1.0
+
+    @staticmethod
+    def flagBadTimes(timeStamp, bad):
+        ''' Contiguous runs of records flagged in the boolean mask bad, as [start, stop]
+            timestamp pairs for badTimes '''
+        spans = []
+        for start, stop in zip(*Utilities.maskRuns(bad)):
+            startstop = [timeStamp[start],timeStamp[stop]]
+            msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
+            # print(msg)
+            Utilities.writeLogFile(msg)
+            spans.append(startstop)
+        return spans
+
+    @staticmethod
+    def rotatorKickouts(timeStamp, rotator, delay):
+        ''' Boolean mask of records from each rotator move until delay seconds after it.
+            A run still open at the next move or at the end of the file is not flagged,
+            apart from the record of the move itself. Returns (records counted, flagged). '''
+        rotator = np.asarray(rotator, dtype=float)
+        counted = np.zeros(len(rotator), dtype=bool)
+        flagged = np.zeros(len(rotator), dtype=bool)
+
+        # A move is a change of more than 0.05 deg from the angle at the last move
+        moves = []
+        if len(rotator) > 0:
+            lastAngle = rotator[0]
+            for index, rotatori in enumerate(rotator.tolist()):
+                if index > 0 and (rotatori > (lastAngle + 0.05) or rotatori < (lastAngle - 0.05)):
+                    moves.append(index)
+                    lastAngle = rotatori
+
+        times = np.empty(len(timeStamp), dtype=object)
+        times[:] = list(timeStamp)
+        for k, move in enumerate(moves):
+            nextMove = moves[k+1] if k+1 < len(moves) else len(rotator)
+            # First record past the delay before the next move closes the span
+            past = np.flatnonzero(times[move+1:nextMove] > (times[move] + datetime.timedelta(0,delay)))
+            if len(past) > 0:
+                end = move + 1 + past[0]
+                counted[move:end] = True
+                flagged[move:end] = True
+            else:
+                counted[move:nextMove] = True
+        return counted, flagged
 
     @staticmethod
     def renameGroup(gp, cf):
@@ -198,8 +200,8 @@ class ProcessL1aqc:
                 gpsLon = gp.getDataset('LONPOS')
                 lonHemiData = gp.getDataset('LONHEMI')
 
-                ancTimeTag2 = [Utilities.datetime2TimeTag2(dt) for dt in gpsDateTime]
-                ancDateTag = [Utilities.datetime2DateTag(dt) for dt in gpsDateTime]
+                ancDateTime64 = Utilities.datetimeToDatetime64(gpsDateTime)
+                ancDateTag, ancTimeTag2 = Utilities.datetime64ToTags(ancDateTime64)
 
                 latAnc = []
                 lonAnc = []
@@ -266,15 +268,11 @@ class ProcessL1aqc:
             ancDateTime = ancData.columns["DATETIME"][0].copy()
 
             print('Removing non-pertinent ancillary data.')
-            # lower = bisect.bisect_left(ancDateTime, min(esDateTime))
-            # First ancillary element during radiometry
-            # lower = np.abs([d-min(esDateTime) for d in ancDateTime]).argmin()
-            lower = Utilities.find_nearest(ancDateTime,min(esDateTime))
+            # First and last ancillary elements during radiometry
+            esDateTime64 = Utilities.datetimeToDatetime64(esDateTime)
+            lower, upper = Utilities.nearestTimeIndex(Utilities.datetimeToDatetime64(ancDateTime),
+                                                      [esDateTime64.min(), esDateTime64.max()])
             lower = list(range(0,lower-1)) # keep one before that
-            # upper = bisect.bisect_right(ancDateTime, max(esDateTime))+1
-            # Last ancillary element during radiometry
-            # upper = np.abs([d-max(esDateTime) for d in ancDateTime]).argmin()
-            upper = Utilities.find_nearest(ancDateTime,max(esDateTime))
             upper = list(range(upper+2,len(ancDateTime))) # keep one after that
             ancData.colDeleteRow(upper)
             ancData.colDeleteRow(lower)
@@ -294,8 +292,8 @@ class ProcessL1aqc:
             #    compass (e.g., SATTHS) as a last resort
 
             timeStamp = ancData.columns["DATETIME"][0]
-            ancTimeTag2 = [Utilities.datetime2TimeTag2(dt) for dt in timeStamp]
-            ancDateTag = [Utilities.datetime2DateTag(dt) for dt in timeStamp]
+            ancDateTime64 = Utilities.datetimeToDatetime64(timeStamp)
+            ancDateTag, ancTimeTag2 = Utilities.datetime64ToTags(ancDateTime64)
             latAnc = ancData.columns["LATITUDE"][0]
             lonAnc = ancData.columns["LONGITUDE"][0]
 
@@ -419,40 +417,15 @@ class ProcessL1aqc:
             print(msg)
             Utilities.writeLogFile(msg)
 
-            i = 0
-            start = -1
-            stop =[]
-            for index, status in enumerate(gpsStatus.data["NONE"]):
-                # "V" for GPRMC, "0" for GPGGA
-                if status == b'V' or status == 0:
-                    i += 1
-                    if start == -1:
-                        start = index
-                    stop = index
-                else:
-                    if start != -1:
-                        startstop = [timeStamp[start],timeStamp[stop]]
-                        msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-                        # print(msg)
-                        Utilities.writeLogFile(msg)
-                        badTimes.append(startstop)
-                        start = -1
-                endex = index
-            msg = f'Percentage of data failed on GPS Status: {round(100*i/len(timeStamp))} %'
+            # "V" for GPRMC, "0" for GPGGA
+            status = gpsStatus.data["NONE"]
+            bad = status == b'V' if status.dtype.kind == 'S' else status == 0
+            badTimes += ProcessL1aqc.flagBadTimes(timeStamp, bad)
+            msg = f'Percentage of data failed on GPS Status: {round(100*np.count_nonzero(bad)/len(timeStamp))} %'
             print(msg)
             Utilities.writeLogFile(msg)
 
-            if start != -1 and stop == endex: # Records from a mid-point to the end are bad
-                startstop = [timeStamp[start],timeStamp[stop]]
-                msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]} (HHMMSSMSS)'
-                # print(msg)
-                Utilities.writeLogFile(msg)
-                if badTimes is None: # only one set of records
-                    badTimes = [startstop]
-                else:
-                    badTimes.append(startstop)
-
-            if start==0 and stop==endex: # All records are bad
+            if bad.all(): # All records are bad
                 return None
 
 
@@ -508,40 +481,15 @@ class ProcessL1aqc:
             pitchMax = float(ConfigFile.settings["fL1aqcPitchRollPitch"])
             rollMax = float(ConfigFile.settings["fL1aqcPitchRollRoll"])
 
-            i = 0
-            start = -1
-            stop =[]
-            for index, pitchi in enumerate(pitch):
-                if abs(pitchi) > pitchMax or abs(roll[index]) > rollMax:
-                    i += 1
-                    if start == -1:
-                        # print('Pitch or roll angle outside bounds. Pitch: ' + str(round(pitch[index])) + ' Roll: ' +str(round(pitch[index])))
-                        start = index
-                    stop = index
-                else:
-                    if start != -1:
-                        # print('Pitch or roll angle passed. Pitch: ' + str(round(pitch[index])) + ' Roll: ' +str(round(pitch[index])))
-                        startstop = [timeStamp[start],timeStamp[stop]]
-                        msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-                        # print(msg)
-                        Utilities.writeLogFile(msg)
-                        badTimes.append(startstop)
-                        start = -1
-            msg = f'Percentage of data out of Pitch/Roll bounds: {round(100*i/len(timeStamp))} %'
+            pitch = np.asarray(pitch, dtype=float)
+            roll = np.asarray(roll, dtype=float)[:len(pitch)]
+            bad = (np.abs(pitch) > pitchMax) | (np.abs(roll) > rollMax)
+            badTimes += ProcessL1aqc.flagBadTimes(timeStamp, bad)
+            msg = f'Percentage of data out of Pitch/Roll bounds: {round(100*np.count_nonzero(bad)/len(timeStamp))} %'
             print(msg)
             Utilities.writeLogFile(msg)
 
-            if start != -1 and stop == index: # Records from a mid-point to the end are bad
-                startstop = [timeStamp[start],timeStamp[stop]]
-                msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]} (HHMMSSMSS)'
-                # print(msg)
-                Utilities.writeLogFile(msg)
-                if badTimes is None: # only one set of records
-                    badTimes = [startstop]
-                else:
-                    badTimes.append(startstop)
-
-            if start==0 and stop==index: # All records are badJM
+            if bad.all(): # All records are bad
                 return None
 
 
@@ -570,36 +518,10 @@ class ProcessL1aqc:
                     print(msg)
                     Utilities.writeLogFile(msg)
 
-                    kickout = 0
-                    i = 0
-                    for index, rotatori in enumerate(rotator):
-                        if index == 0:
-                            lastAngle = rotatori
-                        else:
-                            if rotatori > (lastAngle + 0.05) or rotatori < (lastAngle - 0.05):
-                                i += 1
-                                # Detect angle changed
-                                start = timeStamp[index]
-                                # print('Rotator delay kick-out. ' + str(timeInt) )
-                                startIndex = index
-                                lastAngle = rotatori
-                                kickout = 1
-
-                            else:
-                                # Test if this is fL1aqcRotatorDelay seconds past a kick-out start
-                                time = timeStamp[index]
-                                if kickout==1 and time > (start + datetime.timedelta(0,delay)):
-                                    # startstop = [timeStampTuple[startIndex],timeStampTuple[index-1]]
-                                    startstop = [timeStamp[startIndex],timeStamp[index-1]]
-                                    msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-                                    # print(msg)
-                                    Utilities.writeLogFile(msg)
-                                    badTimes.append(startstop)
-                                    kickout = 0
-                                elif kickout ==1:
-                                    i += 1
-
-                    msg = f'Percentage of Tracker data out of Rotator Delay bounds: {round(100*i/len(timeStamp))} %'
+                    counted, bad = ProcessL1aqc.rotatorKickouts(timeStamp, rotator, delay)
+                    badTimes += ProcessL1aqc.flagBadTimes(timeStamp, bad)
+
+                    msg = f'Percentage of Tracker data out of Rotator Delay bounds: {round(100*np.count_nonzero(counted)/len(timeStamp))} %'
                     print(msg)
                     Utilities.writeLogFile(msg)
 
@@ -623,7 +545,6 @@ class ProcessL1aqc:
             print(msg)
             Utilities.writeLogFile(msg)
 
-            i = 0
             gp = None
             for group in node.groups:
                 if group.id == "SOLARTRACKER" or group.id == "SOLARTRACKER_pySAS":
@@ -641,40 +562,13 @@ class ProcessL1aqc:
                     absRotatorMin = float(ConfigFile.settings["fL1aqcRotatorAngleMin"])
                     absRotatorMax = float(ConfigFile.settings["fL1aqcRotatorAngleMax"])
 
-                    start = -1
-                    stop = []
-                    for index, rotatori in enumerate(rotator):
-                        if rotatori + home > absRotatorMax or rotatori + home < absRotatorMin or math.isnan(rotatori):
-                            i += 1
-                            if start == -1:
-                                # print('Absolute rotator angle outside bounds. ' + str(round(rotatori + home)))
-                                start = index
-                            stop = index
-                        else:
-                            if start != -1:
-                                # print('Absolute rotator angle passed: ' + str(round(rotatori + home)))
-                                startstop = [timeStamp[start],timeStamp[stop]]
-                                msg = ('   Flag data from TT2: ' + str(startstop[0]) + ' to ' + str(startstop[1]))
-                                # print(msg)
-                                Utilities.writeLogFile(msg)
-
-                                badTimes.append(startstop)
-                                start = -1
-                    msg = f'Percentage of Tracker data out of Absolute Rotator bounds: {round(100*i/len(timeStamp))} %'
+                    bad = (rotator + home > absRotatorMax) | (rotator + home < absRotatorMin) | np.isnan(rotator)
+                    badTimes += ProcessL1aqc.flagBadTimes(timeStamp, bad)
+                    msg = f'Percentage of Tracker data out of Absolute Rotator bounds: {round(100*np.count_nonzero(bad)/len(timeStamp))} %'
                     print(msg)
                     Utilities.writeLogFile(msg)
 
-                    if start != -1 and stop == index: # Records from a mid-point to the end are bad
-                        startstop = [timeStamp[start],timeStamp[stop]]
-                        msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-                        # print(msg)
-                        Utilities.writeLogFile(msg)
-                        if badTimes is None: # only one set of records
-                            badTimes = [startstop]
-                        else:
-                            badTimes.append(startstop)
-
-                    if start==0 and stop==index: # All records are bad
+                    if bad.all(): # All records are bad
                         return None
                 else:
                     msg = 'No rotator data found. Filtering on absolute rotator angle failed.'
@@ -763,22 +657,18 @@ class ProcessL1aqc:
         ancGroup.addDataset("DATETAG")
         ancGroup.datasets["DATETAG"].data = np.array(ancDateTag, dtype=[('NONE', '<f8')])
 
-        # Add datetime to Anc group
+        # Add datetime to Anc group: the ancillary times at the TT2 (hhmmssmss. UTC) resolution
         dateTime = ancGroup.addDataset("DATETIME")
-        timeData = ancGroup.getDataset("TIMETAG2").data["NONE"].tolist()
-        dateTag = ancGroup.getDataset("DATETAG").data["NONE"].tolist()
-        timeStampAnc = []
-        for i, time in enumerate(timeData):
-            # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-            # Filter for aberrant Datetags
-            if str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20"):
-                dt = Utilities.dateTagToDateTime(dateTag[i])
-                timeStampAnc.append(Utilities.timeTag2ToDateTime(dt, time))
-            else:
-                ancGroup.datasetDeleteRow(i)
-                msg = "Bad Datetag found in ancillary. Eliminating record"
-                print(msg)
-                Utilities.writeLogFile(msg)
+        # Filter for aberrant Datetags
+        valid = (ancDateTag >= 1900000) & (ancDateTag < 2100000)
+        badCount = np.count_nonzero(~valid)
+        if badCount:
+            msg = f"Bad Datetag found in ancillary. Eliminating {badCount} record(s)"
+            print(msg)
+            Utilities.writeLogFile(msg)
+            ancGroup.datasetKeepRows(valid)
+        # Truncated to milliseconds, as when rebuilt from TIMETAG2 and DATETAG
+        timeStampAnc = Utilities.datetime64ToDateTime(ancDateTime64[valid].astype('datetime64[ms]'))
         dateTime.data = timeStampAnc
 
         # For non-SolarTracker datasets, define the timeStamp around the ancillary data
@@ -836,50 +726,20 @@ class ProcessL1aqc:
             print(msg)
             Utilities.writeLogFile(msg)
 
-            i = 0
             relAzimuthMin = float(ConfigFile.settings["fL1aqcSunAngleMin"])
             relAzimuthMax = float(ConfigFile.settings["fL1aqcSunAngleMax"])
 
-            start = -1
-            stop = []
-            # The length of relAz (and therefore the value of i) depends on whether ancillary
-            #  data are used or SolarTracker data
+            # The length of relAz depends on whether ancillary data are used or SolarTracker data
             # relAz and timeStamp are 1:1, but could be TRACKER or ANCILLARY
-            for index, relAzi in enumerate(relAz):
-                relAzimuthAngle = relAzi
-
-                if abs(relAzimuthAngle) > relAzimuthMax or abs(relAzimuthAngle) < relAzimuthMin or math.isnan(relAzimuthAngle):
-                    i += 1
-                    if start == -1:
-                        # print('Relative solar azimuth angle outside bounds. ' + str(round(relAzimuthAngle,2)))
-                        start = index
-                    stop = index
-                else:
-                    if start != -1:
-                        # print('Relative solar azimuth angle passed: ' + str(round(relAzimuthAngle,2)))
-                        startstop = [timeStamp[start],timeStamp[stop]]
-                        msg = f'   Flag data from: {startstop[0]}  to {startstop[1]}'
-                        # print(msg)
-                        Utilities.writeLogFile(msg)
-
-                        badTimes.append(startstop)
-                        start = -1
+            relAzimuthAngle = np.abs(np.asarray(relAz, dtype=float))
+            bad = (relAzimuthAngle > relAzimuthMax) | (relAzimuthAngle < relAzimuthMin) | np.isnan(relAzimuthAngle)
+            badTimes += ProcessL1aqc.flagBadTimes(timeStamp, bad)
 
-            msg = f'Percentage of data out of Relative Solar Azimuth bounds: {round(100*i/len(relAz))} %'
+            msg = f'Percentage of data out of Relative Solar Azimuth bounds: {round(100*np.count_nonzero(bad)/len(relAz))} %'
             print(msg)
             Utilities.writeLogFile(msg)
 
-            if start != -1 and stop == index: # Records from a mid-point to the end are bad
-                startstop = [timeStamp[start],timeStamp[stop]]
-                msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]} (HHMMSSMSS)'
-                # print(msg)
-                Utilities.writeLogFile(msg)
-                if badTimes is None: # only one set of records
-                    badTimes = [startstop]
-                else:
-                    badTimes.append(startstop)
-
-            if start==0 and stop==index: # All records are bad
+            if bad.all(): # All records are bad
                 msg = "All records out of bounds. Aborting."
                 print(msg)
                 Utilities.writeLogFile(msg)
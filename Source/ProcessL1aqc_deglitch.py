@@ -1,7 +1,6 @@
 
 import datetime as dt
 import numpy as np
-import pandas as pd
 
 from Source.HDFRoot import HDFRoot
 from Source.ConfigFile import ConfigFile
@@ -14,6 +13,15 @@ class ProcessL1aqc_deglitch:
     # More information can be found in AnomalyDetection.py
     '''
 
+    @staticmethod
+    def deglitchWindow(data):
+        ''' Names and (band x time) radiometry of the bands inside the deglitching window.
+            With no band inside the window the radiometry has no rows, so nothing is flagged. '''
+        names = [k for k in data.columns if ConfigFile.minDeglitchBand < float(k) < ConfigFile.maxDeglitchBand]
+        if not names:
+            return names, np.empty((0, len(data.data)))
+        return names, data.toArray(names).T
+
     @staticmethod
     def darkDataDeglitching(darkData, windowSize, sigma):
         ''' Dark deglitching is now based on double-pass discrete linear convolution of the residual
@@ -23,99 +31,24 @@ class ProcessL1aqc_deglitch:
             the test. This is why the percentages in the logs appear much higher than the knockouts in any
             given band (as seen in the plots). Could be revisited. '''
 
-        minBand = ConfigFile.minDeglitchBand
-        maxBand = ConfigFile.maxDeglitchBand
-
         darkData.datasetToColumns()
-        columns = darkData.columns
-
-        badIndex = [False] * len(darkData.data)
-        for key,timeSeries in columns.items():   # Loop over all wavebands
-            if float(key) > minBand and float(key) < maxBand:
-                # Note: the moving average is not tolerant to 2 or fewer records
-                avg = Utilities.movingAverage(timeSeries, windowSize).tolist()
-                residual = np.array(timeSeries) - np.array(avg)
-                stdData = np.std(residual)
-
-                # First pass
-                badIndex1 = Utilities.darkConvolution(timeSeries,avg,stdData,sigma)
-
-                # Second pass
-                timeSeries2 = np.array(timeSeries[:])
-                timeSeries2[badIndex1] = np.nan # BEWARE: NaNs introduced
-                timeSeries2 = timeSeries2.tolist()
-                avg2 = Utilities.movingAverage(timeSeries2, windowSize).tolist()
-                residual = np.array(timeSeries2) - np.array(avg2)
-                stdData = np.nanstd(residual)
-
-                badIndex2 = Utilities.darkConvolution(timeSeries2,avg2,stdData,sigma)
-
-                for i in range(len(badIndex)):
-                    if badIndex1[i] is True or badIndex2[i] is True or badIndex[i] is True:
-                        badIndex[i] = True
-                    else:
-                        badIndex[i] = False # this is redundant
-        return badIndex
+        names, radiometry = ProcessL1aqc_deglitch.deglitchWindow(darkData)
+        # Note: the moving average is not tolerant to 2 or fewer records
+        badIndex1, badIndex2, _ = Utilities.deglitchBands([float(k) for k in names], radiometry,
+                                                          windowSize, sigma, 'Dark', None, None, None)
+        return np.any(badIndex1 | badIndex2, 0).tolist()
 
     @staticmethod
     def lightDataDeglitching(lightData, windowSize, sigma):
         ''' Light deglitching is now based on double-pass discrete linear convolution of the residual
         with a ROLLING std over a rolling average'''
 
-        minBand = ConfigFile.minDeglitchBand
-        maxBand = ConfigFile.maxDeglitchBand
-
         lightData.datasetToColumns()
-        columns = lightData.columns
-
-        badIndex = [False] * len(lightData.data)
-        for key,timeSeries in columns.items():   # Loop over all wavebands
-            if float(key) > minBand and float(key) < maxBand:
-                # Note: the moving average is not tolerant to 2 or fewer records
-                avg = Utilities.movingAverage(timeSeries, windowSize).tolist()
-                residual = np.array(timeSeries) - np.array(avg)
-
-                # Calculate the variation in the distribution of the residual
-                residualDf = pd.DataFrame(residual)
-                testing_std_as_df = residualDf.rolling(windowSize).std()
-                rolling_std = testing_std_as_df.replace(np.nan,
-                    testing_std_as_df.iloc[windowSize - 1]).round(3).iloc[:,0].tolist()
-                # This rolling std on the residual has a tendancy to blow up for extreme outliers,
-                # replace it with the median residual std when that happens
-                y = np.array(rolling_std)
-                y[y > np.median(y)+3*np.std(y)] = np.median(y)
-                rolling_std = y.tolist()
-
-                # First pass
-                badIndex1 = Utilities.lightConvolution(timeSeries,avg,rolling_std,sigma)
-
-                # Second pass
-                timeSeries2 = np.array(timeSeries[:])
-                timeSeries2[badIndex1] = np.nan
-                timeSeries2 = timeSeries2.tolist()
-                avg2 = Utilities.movingAverage(timeSeries2, windowSize).tolist()
-                residual2 = np.array(timeSeries2) - np.array(avg2)
-                # Calculate the variation in the distribution of the residual
-                residualDf2 = pd.DataFrame(residual2)
-                testing_std_as_df2 = residualDf2.rolling(windowSize).std()
-                rolling_std2 = testing_std_as_df2.replace(np.nan,
-                    testing_std_as_df2.iloc[windowSize - 1]).round(3).iloc[:,0].tolist()
-                # This rolling std on the residual has a tendancy to blow up for extreme outliers,
-                # replace it with the median residual std when that happens
-                y = np.array(rolling_std2)
-                y[np.isnan(y)] = np.nanmedian(y)
-                y[y > np.nanmedian(y)+3*np.nanstd(y)] = np.nanmedian(y)
-                rolling_std2 = y.tolist()
-
-                badIndex2 = Utilities.lightConvolution(timeSeries2,avg2,rolling_std2,sigma)
-
-                for i in range(len(badIndex)):
-                    if badIndex1[i] is True or badIndex2[i] is True or badIndex[i] is True:
-                        badIndex[i] = True
-                    else:
-                        badIndex[i] = False # this is redundant
-
-        return badIndex
+        names, radiometry = ProcessL1aqc_deglitch.deglitchWindow(lightData)
+        # Note: the moving average is not tolerant to 2 or fewer records
+        badIndex1, badIndex2, _ = Utilities.deglitchBands([float(k) for k in names], radiometry,
+                                                          windowSize, sigma, 'Light', None, None, None)
+        return np.any(badIndex1 | badIndex2, 0).tolist()
 
     @staticmethod
     def processDataDeglitching(node, sensorType):
@@ -181,37 +114,17 @@ class ProcessL1aqc_deglitch:
             columns = darkData.columns
             dateTime = darkDateTime
 
-            globalBadIndex = []
-
-            index = 0
-            # Loop over bands to populate globBads
-            for timeSeries in columns.items():
-                if index==0:
-                    # Initialize boolean lists for capturing global badIndex conditions across all wavebands
-                    globBad = [False]*len(timeSeries[1])
-                    globBad2 = [False]*len(timeSeries[1])
-                    globBad3 = [False]*len(timeSeries[1])
-                band = float(timeSeries[0])
-                if band > ConfigFile.minDeglitchBand and band < ConfigFile.maxDeglitchBand:
-                    # if index % step == 0:
-                    radiometry1D = timeSeries[1]
-                    badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(band,radiometry1D, windowDark, sigmaDark, lightDark, minDark, maxDark,minMaxBandDark)
+            # Deglitch every band inside the deglitching window at once
+            names, radiometry = ProcessL1aqc_deglitch.deglitchWindow(darkData)
+            badIndex, badIndex2, badIndex3 = Utilities.deglitchBands([float(k) for k in names], radiometry, windowDark, sigmaDark, lightDark, minDark, maxDark, minMaxBandDark)
 
-                    # for the plotting routine:
-                    globBad[:] = (True if val2 else val1 for (val1,val2) in zip(globBad,badIndex))
-                    globBad2[:] = (True if val2 else val1 for (val1,val2) in zip(globBad2,badIndex2))
-                    globBad3[:] = (True if val2 else val1 for (val1,val2) in zip(globBad3,badIndex3))
+            # For the plotting routine: flagged in any band, per pass
+            globBad = np.any(badIndex, 0).tolist()
+            globBad2 = np.any(badIndex2, 0).tolist()
+            globBad3 = np.any(badIndex3, 0).tolist()
 
-                    # For the deletion routine:
-                    globalBadIndex.append(badIndex) # First pass
-                    globalBadIndex.append(badIndex2) # Second pass
-                    globalBadIndex.append(badIndex3) # Thresholds
-
-                index +=1
-
-            # Collapse the badIndexes from all wavebands into one timeseries
-            # Convert to an array and test along the columns (i.e. each timestamp)
-            gIndex = np.any(np.array(globalBadIndex), 0)
+            # Collapse the badIndexes from all wavebands and passes into one timeseries
+            gIndex = np.any(badIndex | badIndex2 | badIndex3, 0)
             percentLoss = 100*(sum(gIndex)/len(gIndex))
             # badIndexDark = ProcessL1aqc.darkDataDeglitching(darkData, sensorType, windowDark, sigmaDark)
             msg = f'Data reduced by {sum(gIndex)} ({round(percentLoss)}%)'
@@ -242,35 +155,17 @@ class ProcessL1aqc_deglitch:
             lightDark = 'Light'
             dateTime = lightDateTime
 
-            globalBadIndex = []
+            # Deglitch every band inside the deglitching window at once
+            names, radiometry = ProcessL1aqc_deglitch.deglitchWindow(lightData)
+            badIndex, badIndex2, badIndex3 = Utilities.deglitchBands([float(k) for k in names], radiometry, windowLight, sigmaLight, lightDark, minLight, maxLight, minMaxBandLight)
 
-            index = 0
-            # Loop over bands to populate globBads
-            for timeSeries in columns.items():
-                if index==0:
-                    # Initialize boolean lists for capturing global badIndex conditions across all wavebands
-                    globBad = [False]*len(timeSeries[1])
-                    globBad2 = [False]*len(timeSeries[1])
-                    globBad3 = [False]*len(timeSeries[1])
-                band = float(timeSeries[0])
-                if band > ConfigFile.minDeglitchBand and band < ConfigFile.maxDeglitchBand:
-                    radiometry1D = timeSeries[1]
-                    badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(band,radiometry1D, windowLight, sigmaLight, lightDark, minLight, maxLight,minMaxBandLight)
-
-                    # For plotting:
-                    globBad[:] = (True if val2 else val1 for (val1,val2) in zip(globBad,badIndex))
-                    globBad2[:] = (True if val2 else val1 for (val1,val2) in zip(globBad2,badIndex2))
-                    globBad3[:] = (True if val2 else val1 for (val1,val2) in zip(globBad3,badIndex3))
-
-                    # For deletion:
-                    globalBadIndex.append(badIndex)
-                    globalBadIndex.append(badIndex2)
-                    globalBadIndex.append(badIndex3)
-                index +=1
+            # For the plotting routine: flagged in any band, per pass
+            globBad = np.any(badIndex, 0).tolist()
+            globBad2 = np.any(badIndex2, 0).tolist()
+            globBad3 = np.any(badIndex3, 0).tolist()
 
-            # Collapse the badIndexes from all wavebands into one timeseries
-            # Convert to an array and test along the columns (i.e. each timestamp)
-            gIndex = np.any(np.array(globalBadIndex), 0)
+            # Collapse the badIndexes from all wavebands and passes into one timeseries
+            gIndex = np.any(badIndex | badIndex2 | badIndex3, 0)
             percentLoss = 100*(sum(gIndex)/len(gIndex))
             # NOTE: if you similarly collapse globBads 1-3, you should get the same result as gIndex
             # NOTE: Confirmed that plotted AnomAnal deletions correspond to gIndex
@@ -460,8 +460,7 @@ class ProcessL1b:
 
         # Correct light data by subtracting interpolated dark data from light data
         for k in lightData.data.dtype.fields.keys():
-            for x in range(lightData.data.shape[0]):
-                lightData.data[k][x] -= newDarkData[k][x]
+            lightData.data[k] -= newDarkData[k]
 
         if Utilities.hasNan(lightData):
             frameinfo = getframeinfo(currentframe())
@@ -1,6 +1,9 @@
 ''' L1AQC to L1B for Full-FRM or Class-based '''
+import collections
+import hashlib
 import logging
 import os
+import tempfile
 from datetime import datetime as dt
 import numpy as np
 import pandas as pd
@@ -9,12 +12,129 @@ import pytz
 from scipy import interpolate
 
 # internal files
+from Source import PATH_TO_DATA
 from Source.ConfigFile import ConfigFile
 from Source.Utilities import Utilities
 
 class ProcessL1b_FRMCal:
     ''' L1AQC to L1B for Full-FRM or Class-based '''
 
+    # Zong stray-light matrices are saved here, named by a hash of the LSF and wavelengths
+    ZONG_CACHE_DIR = os.path.join(PATH_TO_DATA, 'Cache', 'StrayLight')
+    # Bump when Zong_SL_correction_matrix changes so old matrices are ignored
+    ZONG_CACHE_VERSION = 1
+    # In-process copy of the matrices, and how often the cache saved an inversion
+    _zongMemo = {}
+    zongCacheStats = {'hits': 0, 'misses': 0}
+
+    # 6S results per bin are saved here, named by a hash of the quantised run inputs
+    PY6S_CACHE_DIR = os.path.join(PATH_TO_DATA, 'Cache', 'Py6S')
+    # Bump when the 6S set-up in py6s_cached changes so old results are ignored
+    PY6S_CACHE_VERSION = 1
+    # 6S is run on inputs rounded to these decimals, so a cached result is exactly what a new run would give
+    PY6S_ANGLE_DECIMALS = 2
+    PY6S_AOT_DECIMALS = 4
+    PY6S_OUTPUTS = ['percent_direct_solar_irradiance', 'percent_diffuse_solar_irradiance',
+                    'direct_solar_irradiance', 'diffuse_solar_irradiance', 'environmental_irradiance']
+    # In-process copy of the most recently used bins; older ones are read back from disk
+    PY6S_MEMO_SIZE = 1024
+    _py6sMemo = collections.OrderedDict()
+    py6sCacheStats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def saveCacheArray(cacheDir, key, array):
+        ''' Save array as cacheDir/key.npy, logging rather than failing if the cache is not writable '''
+        try:
+            os.makedirs(cacheDir, exist_ok=True)
+            # Write then rename, so concurrent workers never read a partial file
+            with tempfile.NamedTemporaryFile(dir=cacheDir, suffix='.tmp', delete=False) as f:
+                np.save(f, array)
+            os.replace(f.name, os.path.join(cacheDir, key + '.npy'))
+        except OSError as err:
+            msg = f'ProcessL1b_FRMCal: unable to write cache in {cacheDir}: {err}'
+            print(msg)
+            Utilities.writeLogFile(msg)
+
+    @staticmethod
+    def loadCacheArray(cacheDir, key, shape):
+        ''' Return the array saved as cacheDir/key.npy, or None if it is missing, unreadable or of another shape '''
+        fp = os.path.join(cacheDir, key + '.npy')
+        if not os.path.isfile(fp):
+            return None
+        try:
+            array = np.load(fp)
+        except Exception:
+            # Truncated or stale file; it is rewritten after the computation
+            return None
+        if array.shape != shape:
+            return None
+        return array
+
+    @staticmethod
+    def run_py6s(s, wavelengths):
+        ''' Run 6S at each wavelength (um), returning the Py6S outputs '''
+        n_cores = None
+        if os.name == 'nt':  # if system is windows do not do parallel processing to avoid potential error
+            n_cores = 1
+        _, res = Py6S.SixSHelpers.Wavelengths.run_wavelengths(s, wavelengths, n=n_cores)
+        return res
+
+    @staticmethod
+    def py6s_cached(month, day, solar_z, solar_a, view_a, aot550, wvl, runner=None):
+        ''' PY6S_OUTPUTS x wvl (nm) for one bin, reusing 6S results saved on disk
+
+            runner(s, wavelengths) runs 6S and defaults to run_py6s.
+        '''
+        decimals = ProcessL1b_FRMCal.PY6S_ANGLE_DECIMALS
+        solar_z, solar_a, view_a = [float(np.round(x, decimals)) for x in (solar_z, solar_a, view_a)]
+        aot550 = float(np.round(aot550, ProcessL1b_FRMCal.PY6S_AOT_DECIMALS))
+        wvl = np.ascontiguousarray(wvl, dtype=np.float64)
+
+        h = hashlib.sha256((f'py6s-v{ProcessL1b_FRMCal.PY6S_CACHE_VERSION}-MidlatitudeSummer-Maritime-sealevel'
+                            f'-{month}-{day}-{solar_z:.4f}-{solar_a:.4f}-{view_a:.4f}-180-{aot550:.6f}').encode('utf-8'))
+        h.update(wvl.tobytes())
+        key = h.hexdigest()
+        shape = (len(ProcessL1b_FRMCal.PY6S_OUTPUTS), len(wvl))
+
+        result = ProcessL1b_FRMCal._py6sMemo.get(key)
+        if result is None:
+            result = ProcessL1b_FRMCal.loadCacheArray(ProcessL1b_FRMCal.PY6S_CACHE_DIR, key, shape)
+        if result is not None:
+            ProcessL1b_FRMCal.py6sCacheStats['hits'] += 1
+            ProcessL1b_FRMCal.rememberPy6S(key, result)
+            return result.copy()
+
+        ProcessL1b_FRMCal.py6sCacheStats['misses'] += 1
+        s = Py6S.SixS()
+        s.atmos_profile = Py6S.AtmosProfile.PredefinedType(Py6S.AtmosProfile.MidlatitudeSummer)
+        s.aero_profile  = Py6S.AeroProfile.PredefinedType(Py6S.AeroProfile.Maritime)
+        s.month = month
+        s.day = day
+        s.geometry.solar_z = solar_z
+        s.geometry.solar_a = solar_a
+        s.geometry.view_a = view_a
+        s.geometry.view_z = 180
+        s.altitudes = Py6S.Altitudes()
+        s.altitudes.set_target_sea_level()
+        s.altitudes.set_sensor_sea_level()
+        s.aot550 = aot550
+        res = (runner or ProcessL1b_FRMCal.run_py6s)(s, 1e-3*wvl)
+
+        result = np.array([[res[x].values[name] for x in range(len(wvl))] for name in ProcessL1b_FRMCal.PY6S_OUTPUTS],
+                          dtype=np.float64)
+        ProcessL1b_FRMCal.rememberPy6S(key, result.copy())
+        ProcessL1b_FRMCal.saveCacheArray(ProcessL1b_FRMCal.PY6S_CACHE_DIR, key, result)
+        return result
+
+    @staticmethod
+    def rememberPy6S(key, result):
+        ''' Keep result in the in-process memo, dropping the least recently used bins beyond PY6S_MEMO_SIZE '''
+        memo = ProcessL1b_FRMCal._py6sMemo
+        memo[key] = result
+        memo.move_to_end(key)
+        while len(memo) > ProcessL1b_FRMCal.PY6S_MEMO_SIZE:
+            memo.popitem(last=False)
+
     @staticmethod
     def get_direct_irradiance_ratio(node: object, sensortype: object, called_L2: bool = False) -> object:
         ''' Used for both SeaBird and TriOS L1b
@@ -96,32 +216,11 @@ class ProcessL1b_FRMCal:
         for n in range(n_bin):
             # find ancillary point that match the 1st mesure of the 3min ensemble
             ind_anc = np.argmin(np.abs(np.array(anc_datetime)-datetime[n*n_min]))
-            s = Py6S.SixS()
-            s.atmos_profile = Py6S.AtmosProfile.PredefinedType(Py6S.AtmosProfile.MidlatitudeSummer)
-            s.aero_profile  = Py6S.AeroProfile.PredefinedType(Py6S.AeroProfile.Maritime)
-            s.month = datetime[ind_anc].month
-            s.day = datetime[ind_anc].day
-            s.geometry.solar_z = sun_zenith[ind_anc]
-            s.geometry.solar_a = sun_azimuth[ind_anc]
-            s.geometry.view_a = rel_az[ind_anc]
-            s.geometry.view_z = 180
-            s.altitudes = Py6S.Altitudes()
-            s.altitudes.set_target_sea_level()
-            s.altitudes.set_sensor_sea_level()
-            s.aot550 = aod[ind_anc]
-            n_cores = None
-            if os.name == 'nt':  # if system is windows do not do parallel processing to avoid potential error
-                n_cores = 1
-            _, res = Py6S.SixSHelpers.Wavelengths.run_wavelengths(s, 1e-3*wvl, n=n_cores)
-
-            # extract value from Py6s
-            # total_gaseous_transmittance[n,:] = np.array([res[x].values['total_gaseous_transmittance'] for x in range(nband)])
-            # env[n,:]  = np.array([res[x].values['percent_environmental_irradiance'] for x in range(nband)])
-            direct[n,:]  = np.array([res[x].values['percent_direct_solar_irradiance'] for x in range(nband)])
-            diffuse[n,:]  = np.array([res[x].values['percent_diffuse_solar_irradiance'] for x in range(nband)])
-            irr_direct[n,:]  = np.array([res[x].values['direct_solar_irradiance'] for x in range(nband)])
-            irr_diffuse[n,:]  = np.array([res[x].values['diffuse_solar_irradiance'] for x in range(nband)])
-            irr_env[n,:]  = np.array([res[x].values['environmental_irradiance'] for x in range(nband)])
+            res = ProcessL1b_FRMCal.py6s_cached(datetime[ind_anc].month, datetime[ind_anc].day, sun_zenith[ind_anc],
+                                                sun_azimuth[ind_anc], rel_az[ind_anc], aod[ind_anc], wvl)
+
+            # extract value from Py6s, in PY6S_OUTPUTS order
+            direct[n,:], diffuse[n,:], irr_direct[n,:], irr_diffuse[n,:], irr_env[n,:] = res
             solar_zenith[n] = sun_zenith[ind_anc]
 
 
@@ -263,16 +362,24 @@ class ProcessL1b_FRMCal:
         ZEN_avg_coserror[0:i1,:] = 0
         ZEN_avg_coserror[i2:,:] = 0
 
-        # Compute full hemisperical coserror
+        full_hemi_coserror = ProcessL1b_FRMCal.FHemi_Coserr(ZEN_avg_coserror, zenith_ang)
+
+        return ZEN_avg_coserror, full_hemi_coserror, zenith_ang
+
+    @staticmethod
+    def FHemi_Coserr(ZEN_avg_coserror, zenith_ang):
+        ''' Full hemispherical cosine error of each pixel from the (pixel x zenith) average cosine error '''
         zen0 = np.argmin(np.abs(zenith_ang))
         zen90 = np.argmin(np.abs(zenith_ang-90))
         deltaZen = (zenith_ang[1::]-zenith_ang[:-1])
-        full_hemi_coserror = np.zeros(255)
+        return ProcessL1b_FRMCal.rowSum(
+            ZEN_avg_coserror[:,zen0:zen90]*np.sin(2*np.pi*zenith_ang[zen0:zen90]/180)*deltaZen[zen0:zen90]*np.pi/180)
 
-        for i in range(255):
-            full_hemi_coserror[i] = np.sum(ZEN_avg_coserror[i,zen0:zen90]*np.sin(2*np.pi*zenith_ang[zen0:zen90]/180)*deltaZen[zen0:zen90]*np.pi/180 )
-
-        return ZEN_avg_coserror, full_hemi_coserror, zenith_ang
+    @staticmethod
+    def rowSum(array):
+        ''' Sum each row of a 2-D array as a per-row loop would. Characterisation arrays read through
+            pandas are F order, which numpy would reduce in another order, so sum a C-order copy '''
+        return np.sum(np.ascontiguousarray(array), axis=1)
 
     @staticmethod
     def Zong_SL_correction_matrix(LSF, n_IB: int = 3):
@@ -298,6 +405,37 @@ class ProcessL1b_FRMCal:
 
         return C
 
+    @staticmethod
+    def zongCacheKey(LSF, wavelengths, n_IB):
+        ''' Hash the LSF, wavelength grid and in-band width, with the cache version '''
+        h = hashlib.sha256(f'zong-v{ProcessL1b_FRMCal.ZONG_CACHE_VERSION}-{n_IB}'.encode('utf-8'))
+        for array in (LSF, wavelengths):
+            array = np.ascontiguousarray(array, dtype=np.float64)
+            h.update(str(array.shape).encode('utf-8') + b'\0')
+            h.update(array.tobytes())
+        return h.hexdigest()
+
+    @staticmethod
+    def Zong_SL_correction_matrix_cached(LSF, wavelengths, n_IB: int = 3):
+        ''' Zong_SL_correction_matrix for a characterisation LSF, reusing matrices saved on disk '''
+        # Clip in place as Zong_SL_correction_matrix does; callers reuse the clipped LSF
+        LSF[LSF<=0] = 0
+        key = ProcessL1b_FRMCal.zongCacheKey(LSF, wavelengths, n_IB)
+
+        C = ProcessL1b_FRMCal._zongMemo.get(key)
+        if C is None:
+            C = ProcessL1b_FRMCal.loadCacheArray(ProcessL1b_FRMCal.ZONG_CACHE_DIR, key, (len(LSF), len(LSF)))
+        if C is not None:
+            ProcessL1b_FRMCal.zongCacheStats['hits'] += 1
+            ProcessL1b_FRMCal._zongMemo[key] = C
+            return C.copy()
+
+        ProcessL1b_FRMCal.zongCacheStats['misses'] += 1
+        C = ProcessL1b_FRMCal.Zong_SL_correction_matrix(LSF, n_IB)
+        ProcessL1b_FRMCal._zongMemo[key] = C.copy()
+        ProcessL1b_FRMCal.saveCacheArray(ProcessL1b_FRMCal.ZONG_CACHE_DIR, key, C)
+        return C
+
     @staticmethod
     def Slaper_SL_correction(input_data, SL_matrix, n_iter=5):
         nband = len(input_data)
@@ -328,6 +466,34 @@ class ProcessL1b_FRMCal:
 
         return mX[n_iter-1,:]
 
+    @staticmethod
+    def FRM_chain(raw_data, int_time, ind_raw_data, ind_nocal, alpha, C_zong, cal_int, updated_radcal_gain, Ct,
+                  res_py6s=None, zenith_ang=None, avg_coserror=None, full_hemi_coserror=None):
+        ''' Calibrates the (measurement x pixel) raw counts of a HyperOCR in one pass, one row per
+            measurement. The cosine correction is applied when res_py6s is given (ES). '''
+        nmes = len(raw_data)
+        # raw data
+        FRM_mesure = raw_data[:, np.asarray(ind_raw_data)]
+        # Non-linearity
+        FRM_mesure = FRM_mesure*(1-alpha*FRM_mesure)
+        # Straylight
+        # data = ProcessL1b_FRMCal.Slaper_SL_correction(data, mZ, n_iter)
+        FRM_mesure = np.matmul(FRM_mesure, C_zong.T)
+        # Calibration
+        FRM_mesure = FRM_mesure * (cal_int/int_time.reshape(nmes, 1)) / updated_radcal_gain
+        # thermal
+        FRM_mesure = FRM_mesure * Ct
+        # Cosine correction
+        if res_py6s is not None:
+            # retrive py6s variables for given wvl
+            solar_zenith = np.asarray(res_py6s['solar_zenith']).reshape(nmes)
+            direct_ratio = res_py6s['direct_ratio'][:, np.asarray(ind_raw_data)]
+            ind_closest_zen = np.argmin(np.abs(zenith_ang[np.newaxis, :]-solar_zenith[:, np.newaxis]), axis=1)
+            cos_corr = (1-avg_coserror[:, ind_closest_zen].T/100)[:, np.asarray(ind_nocal==False)]
+            Fhcorr = (1-full_hemi_coserror/100)[ind_nocal==False]
+            FRM_mesure = (direct_ratio*FRM_mesure*cos_corr) + ((1-direct_ratio)*FRM_mesure*Fhcorr)
+        return FRM_mesure
+
     @staticmethod
     def processL1b_SeaBird(node, calibrationMap):
         # calibration of HyperOCR following the FRM processing of FRM4SOC2
@@ -398,7 +564,7 @@ class ProcessL1b_FRMCal:
             LAMP = np.asarray(pd.DataFrame(unc_grp.getDataset(sensortype+"_RADCAL_LAMP").data)['2'])
 
             # create Zong SDF straylight correction matrix
-            C_zong = ProcessL1b_FRMCal.Zong_SL_correction_matrix(mZ)
+            C_zong = ProcessL1b_FRMCal.Zong_SL_correction_matrix_cached(mZ, radcal_wvl)
 
             # Defined constants
             nband = len(radcal_wvl)
@@ -450,32 +616,13 @@ class ProcessL1b_FRMCal:
             updated_radcal_gain[ind_nocal==True] = 1
             updated_radcal_gain = updated_radcal_gain[ind_nocal==False]
 
-            FRM_mesure = np.zeros((nmes, len(updated_radcal_gain)))
-            for n in range(nmes):
-                # raw data
-                data = raw_data[n][ind_raw_data]
-                # Non-linearity
-                data = data*(1-alpha*data)
-                # Straylight
-                # data = ProcessL1b_FRMCal.Slaper_SL_correction(data, mZ, n_iter)
-                data = np.matmul(C_zong, data)
-                # Calibration
-                data = data * (cal_int/int_time[n]) / updated_radcal_gain
-                # thermal
-                data = data * Ct
-                # Cosine correction
-                if sensortype == "ES":
-                    # retrive py6s variables for given wvl
-                    solar_zenith = res_py6s['solar_zenith'][n]
-                    direct_ratio = res_py6s['direct_ratio'][n,ind_raw_data]
-                    diffuse_ratio = res_py6s['diffuse_ratio'][n,ind_raw_data]
-                    ind_closest_zen = np.argmin(np.abs(zenith_ang-solar_zenith))
-                    cos_corr = (1-avg_coserror[:,ind_closest_zen]/100)[ind_nocal==False]
-                    Fhcorr = (1-full_hemi_coserror/100)[ind_nocal==False]
-                    data = (direct_ratio*data*cos_corr) + ((1-direct_ratio)*data*Fhcorr)
-                    FRM_mesure[n,:] = data
-                else:
-                    FRM_mesure[n,:] = data
+            if sensortype == "ES":
+                FRM_mesure = ProcessL1b_FRMCal.FRM_chain(raw_data, int_time, ind_raw_data, ind_nocal, alpha, C_zong,
+                                                         cal_int, updated_radcal_gain, Ct, res_py6s, zenith_ang,
+                                                         avg_coserror, full_hemi_coserror)
+            else:
+                FRM_mesure = ProcessL1b_FRMCal.FRM_chain(raw_data, int_time, ind_raw_data, ind_nocal, alpha, C_zong,
+                                                         cal_int, updated_radcal_gain, Ct)
 
             # Remove wvl without calibration from the dataset
             filtered_mesure = FRM_mesure
@@ -1,5 +1,6 @@
 ''' Process L1AQC to L1B for SeaBird in Factory or Class regime '''
 import re
+import collections
 import datetime as dt
 import numpy as np
 import pandas as pd
@@ -12,121 +13,134 @@ class ProcessL1b_FactoryCal:
     # Used to calibrate raw data (convert from L1a to L1b)
     # Reference: "SAT-DN-00134_Instrument File Format.pdf"
     @staticmethod
-    def processDataset(ds, cd, inttime=None, immersed=False):
-        #print("FitType:", cd.fitType)
-        if cd.fitType == "OPTIC2":
-            ProcessL1b_FactoryCal.processOPTIC2(ds, cd, immersed)
-        # elif cd.fitType == "OPTIC1":
-        #     ProcessL1b_FactoryCal.processOPTIC1(ds, cd, immersed)
-        elif cd.fitType == "OPTIC3":
-            ProcessL1b_FactoryCal.processOPTIC3(ds, cd, immersed, inttime)
-        elif cd.fitType == "OPTIC4":
-            ProcessL1b_FactoryCal.processOPTIC4(ds, cd, immersed)
-        # elif cd.fitType == "THERM1":
-        #     ProcessL1b_FactoryCal.processTHERM1(ds, cd)
-        elif cd.fitType == "POW10":
-            ProcessL1b_FactoryCal.processPOW10(ds, cd, immersed)
-        elif cd.fitType == "POLYU":
-            ProcessL1b_FactoryCal.processPOLYU(ds, cd)
-        elif cd.fitType == "POLYF":
-            ProcessL1b_FactoryCal.processPOLYF(ds, cd)
-        # elif cd.fitType == "DDMM":
-        #     ProcessL1b_FactoryCal.processDDMM(ds, cd)
-        # elif cd.fitType == "HHMMSS":
-        #     ProcessL1b_FactoryCal.processHHMMSS(ds, cd)
-        # elif cd.fitType == "DDMMYY":
-        #     ProcessL1b_FactoryCal.processDDMMYY(ds, cd)
-        # elif cd.fitType == "TIME2":
-        #     ProcessL1b_FactoryCal.processTIME2(ds, cd)
-        elif cd.fitType == "COUNT":
+    def processDataset(ds, cds, inttime=None, immersed=False):
+        ''' Calibrate the bands (columns) of ds listed in cds, which share one fit type '''
+        fitType = cds[0].fitType
+        #print("FitType:", fitType)
+        if fitType == "OPTIC2":
+            ProcessL1b_FactoryCal.processOPTIC2(ds, cds, immersed)
+        # elif fitType == "OPTIC1":
+        #     ProcessL1b_FactoryCal.processOPTIC1(ds, cds, immersed)
+        elif fitType == "OPTIC3":
+            ProcessL1b_FactoryCal.processOPTIC3(ds, cds, immersed, inttime)
+        elif fitType == "OPTIC4":
+            ProcessL1b_FactoryCal.processOPTIC4(ds, cds, immersed)
+        # elif fitType == "THERM1":
+        #     ProcessL1b_FactoryCal.processTHERM1(ds, cds)
+        elif fitType == "POW10":
+            ProcessL1b_FactoryCal.processPOW10(ds, cds, immersed)
+        elif fitType == "POLYU":
+            ProcessL1b_FactoryCal.processPOLYU(ds, cds)
+        elif fitType == "POLYF":
+            ProcessL1b_FactoryCal.processPOLYF(ds, cds)
+        # elif fitType == "DDMM":
+        #     ProcessL1b_FactoryCal.processDDMM(ds, cds)
+        # elif fitType == "HHMMSS":
+        #     ProcessL1b_FactoryCal.processHHMMSS(ds, cds)
+        # elif fitType == "DDMMYY":
+        #     ProcessL1b_FactoryCal.processDDMMYY(ds, cds)
+        # elif fitType == "TIME2":
+        #     ProcessL1b_FactoryCal.processTIME2(ds, cds)
+        elif fitType == "COUNT":
             pass
-        elif cd.fitType == "NONE":
+        elif fitType == "NONE":
             pass
         else:
-            msg = f'ProcessL1b_FactoryCal.processDataset: Unknown Fit Type: {cd.fitType}'
-            print(msg)
-            Utilities.writeLogFile(msg)
+            msg = f'ProcessL1b_FactoryCal.processDataset: Unknown Fit Type: {fitType}'
+            for _ in cds:
+                print(msg)
+                Utilities.writeLogFile(msg)
+
+    # The kernels below apply one equation to a (time x band) array of the bands in cds (which
+    # share a number of coefficients), with per-band coefficient rows. Operations are kept in the
+    # order of the per-record equations; powers are array operations, so those results may differ
+    # from the scalar equations in the last bit.
+
+    @staticmethod
+    def coefficients(cds, i):
+        ''' Row (1 x band) of the i-th coefficient of each band '''
+        return np.array([[float(cd.coefficients[i]) for cd in cds]])
+
+    @staticmethod
+    def applyBands(ds, cds, func):
+        ''' Replace the bands of cds in ds with func((time x band) array) '''
+        names = [cd.id for cd in cds]
+        values = func(ds.toArray(names))
+        for j, k in enumerate(names):
+            ds.data[k] = values[:, j]
 
     # # Process OPTIC1 - not implemented
     # @staticmethod
-    # def processOPTIC1(ds, cd, immersed):
+    # def processOPTIC1(ds, cds, immersed):
     #     return
 
     @staticmethod
-    def processOPTIC2(ds, cd, immersed):
-        a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * a1 * (ds.data[k][x] - a0)
+    def processOPTIC2(ds, cds, immersed):
+        a0 = ProcessL1b_FactoryCal.coefficients(cds, 0)
+        a1 = ProcessL1b_FactoryCal.coefficients(cds, 1)
+        im = ProcessL1b_FactoryCal.coefficients(cds, 2) if immersed else 1.0
+        ProcessL1b_FactoryCal.applyBands(ds, cds, lambda data: im * a1 * (data - a0))
 
     @staticmethod
-    def processOPTIC3(ds, cd, immersed, inttime):
-        # a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        cint = float(cd.coefficients[3])
-        #print(inttime.data.shape[0], self.data.shape[0])
-        k = cd.id
-        #print(cint, aint)
-        #print(cd.id)
-        for x in range(ds.data.shape[0]):
-            aint = inttime.data[cd.type][x]
-            # ds.data[k][x] = im * a1 * (ds.data[k][x] - a0) * (cint/aint)
-            ##############################################################
-            #   When applying calibration to the dark current corrected
-            #   radiometry, a0 cancels (see ProSoftUserManual7.7 11.1.1.5 Eqns 5-6)
-            #   presuming light and dark factory cals are equivalent (which they are).
-            ##############################################################
-            ds.data[k][x] = im * a1 * (ds.data[k][x]) * (cint/aint)
+    def processOPTIC3(ds, cds, immersed, inttime):
+        # a0 = ProcessL1b_FactoryCal.coefficients(cds, 0)
+        a1 = ProcessL1b_FactoryCal.coefficients(cds, 1)
+        im = ProcessL1b_FactoryCal.coefficients(cds, 2) if immersed else 1.0
+        cint = ProcessL1b_FactoryCal.coefficients(cds, 3)
+        # Integration time of each record (column); the bands of cds share one type
+        aint = np.asarray(inttime.data[cds[0].type], dtype=np.float64)[:, None]
+        # data = im * a1 * (data - a0) * (cint/aint)
+        ##############################################################
+        #   When applying calibration to the dark current corrected
+        #   radiometry, a0 cancels (see ProSoftUserManual7.7 11.1.1.5 Eqns 5-6)
+        #   presuming light and dark factory cals are equivalent (which they are).
+        ##############################################################
+        ProcessL1b_FactoryCal.applyBands(ds, cds, lambda data: im * a1 * data * (cint/aint))
 
     @staticmethod
-    def processOPTIC4(ds, cd, immersed):
-        a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        cint = float(cd.coefficients[3])
-        k = cd.id
+    def processOPTIC4(ds, cds, immersed):
+        a0 = ProcessL1b_FactoryCal.coefficients(cds, 0)
+        a1 = ProcessL1b_FactoryCal.coefficients(cds, 1)
+        im = ProcessL1b_FactoryCal.coefficients(cds, 2) if immersed else 1.0
+        cint = ProcessL1b_FactoryCal.coefficients(cds, 3)
         aint = 1
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * a1 * (ds.data[k][x] - a0) * (cint/aint)
+        ProcessL1b_FactoryCal.applyBands(ds, cds, lambda data: im * a1 * (data - a0) * (cint/aint))
 
     # # Process THERM1 - not implemented
     # #   This is for optical thermal sensors like pyrometers, I believe.
     # #   This is not for thermal responsivity of OPTICS3 sensors
     # @staticmethod
-    # def processTHERM1(ds, cd):
+    # def processTHERM1(ds, cds):
     #     return
 
     @staticmethod
-    def processPOW10(ds, cd, immersed):
-        a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * pow(10, ((ds.data[k][x]-a0)/a1))
+    def processPOW10(ds, cds, immersed):
+        a0 = ProcessL1b_FactoryCal.coefficients(cds, 0)
+        a1 = ProcessL1b_FactoryCal.coefficients(cds, 1)
+        im = ProcessL1b_FactoryCal.coefficients(cds, 2) if immersed else 1.0
+        ProcessL1b_FactoryCal.applyBands(ds, cds,
+            lambda data: im * np.power(10.0, (data-a0)/a1))
 
     @staticmethod
-    def processPOLYU(ds, cd):
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            num = 0
-            for i, coeff in enumerate(cd.coefficients):
-                a = float(coeff)
-                num += a * pow(ds.data[k][x],i)
-            ds.data[k][x] = num
+    def processPOLYU(ds, cds):
+        def polyu(data):
+            # Terms in the order of the equation, each power one multiplication on from the last
+            num = ProcessL1b_FactoryCal.coefficients(cds, 0) * np.ones_like(data)
+            power = np.ones_like(data)
+            for i in range(1, len(cds[0].coefficients)):
+                power *= data
+                num += ProcessL1b_FactoryCal.coefficients(cds, i) * power
+            return num
+        ProcessL1b_FactoryCal.applyBands(ds, cds, polyu)
 
     @staticmethod
-    def processPOLYF(ds, cd):
-        a0 = float(cd.coefficients[0])
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            num = a0
-            for a in cd.coefficients[1:]:
-                num *= (ds.data[k][x] - float(a))
-            ds.data[k][x] = num
+    def processPOLYF(ds, cds):
+        def polyf(data):
+            num = ProcessL1b_FactoryCal.coefficients(cds, 0) * np.ones_like(data)
+            for i in range(1, len(cds[0].coefficients)):
+                num *= (data - ProcessL1b_FactoryCal.coefficients(cds, i))
+            return num
+        ProcessL1b_FactoryCal.applyBands(ds, cds, polyf)
 
     # @staticmethod
     # def processDDMM(ds, cd):
@@ -165,15 +179,29 @@ class ProcessL1b_FactoryCal:
             if cd.type == "INTTIME":
                 #print("Process INTTIME")
                 ds = gp.getDataset("INTTIME")
-                ProcessL1b_FactoryCal.processDataset(ds, cd)
+                ProcessL1b_FactoryCal.processDataset(ds, [cd])
                 inttime = ds
 
+        # Process each dataset in the cal file list of data, except INTTIME
+        types = collections.OrderedDict()
         for cd in cf.data:
-            # process each dataset in the cal file list of data, except INTTIME
             if gp.getDataset(cd.type) and cd.type != "INTTIME":
-                #print("Dataset:", cd.type)
-                ds = gp.getDataset(cd.type)
-                ProcessL1b_FactoryCal.processDataset(ds, cd, inttime)
+                types.setdefault(cd.type, []).append(cd)
+
+        for dsType, cds in types.items():
+            #print("Dataset:", dsType)
+            ds = gp.getDataset(dsType)
+            if len({cd.id for cd in cds}) == len(cds):
+                # Calibrate the bands sharing a fit type (and number of coefficients) together
+                batches = collections.OrderedDict()
+                for cd in cds:
+                    batches.setdefault((cd.fitType, len(cd.coefficients)), []).append(cd)
+                batches = list(batches.values())
+            else:
+                # A band calibrated more than once must be calibrated in file order
+                batches = [[cd] for cd in cds]
+            for batch in batches:
+                ProcessL1b_FactoryCal.processDataset(ds, batch, inttime)
 
     @staticmethod
     def get_cal_file_lines(calibrationMap):
@@ -249,17 +249,16 @@ class ProcessL1bqc:
         ancGroup = None
         pyrGroup = None
         py6sGroup = None
-        for gp in node.groups:
-            if gp.id.startswith("SOLARTRACKER"):
-                if gp.id != "SOLARTRACKER_STATUS":
-                    satnavGroup = gp
-            if gp.id.startswith("ANCILLARY"):
-                ancGroup = gp
-                ancGroup.id = "ANCILLARY" # shift back from ANCILLARY_METADATA
-            if gp.id.startswith("PYROMETER"):
-                pyrGroup = gp
-            if gp.id.startswith("PY6S"):
-                py6sGroup = gp
+        for gp in node.getGroupsByPrefix("SOLARTRACKER"):
+            if gp.id != "SOLARTRACKER_STATUS":
+                satnavGroup = gp
+        for gp in node.getGroupsByPrefix("ANCILLARY"):
+            ancGroup = gp
+            ancGroup.id = "ANCILLARY" # shift back from ANCILLARY_METADATA
+        for gp in node.getGroupsByPrefix("PYROMETER"):
+            pyrGroup = gp
+        for gp in node.getGroupsByPrefix("PY6S"):
+            py6sGroup = gp
 
 
         # # Regardless of whether SolarTracker/pySAS is used, Ancillary data will have been already been
@@ -795,9 +794,8 @@ class ProcessL1bqc:
 
         # Py6S model
         py6sGroup = None
-        for gp in node.groups:
-            if gp.id.startswith("PY6S"):
-                py6sGroup = gp
+        for gp in node.getGroupsByPrefix("PY6S"):
+            py6sGroup = gp
         if py6sGroup is not None:
             gp = node.getGroup('PY6S_MODEL')
             gp.attributes['Irradiance Units'] = 'W/m^2/um' # See ProcessL1b
@@ -614,41 +614,13 @@ class ProcessL2:
         print(msg)
         Utilities.writeLogFile(msg)
 
-        # Delete the records in badTime ranges from each dataset in the group
-        finalCount = 0
+        # Delete the records in badTime ranges from each dataset in the group at once
         originalLength = len(timeStamp)
-        for dateTime in badTimes:
-            # Need to reinitialize for each loop
-            startLength = len(timeStamp)
-            newTimeStamp = []
-
-            # msg = f'Eliminate data between: {dateTime}'
-            # print(msg)
-            # Utilities.writeLogFile(msg)
-
-            start = dateTime[0]
-            stop = dateTime[1]
-
-            if startLength > 0:
-                rowsToDelete = []
-                for i in range(startLength):
-                    if start <= timeStamp[i] and stop >= timeStamp[i]:
-                        try:
-                            rowsToDelete.append(i)
-                            finalCount += 1
-                        except Exception:
-                            print('error')
-                    else:
-                        newTimeStamp.append(timeStamp[i])
-                group.datasetDeleteRow(rowsToDelete)
-            else:
-                msg = 'Data group is empty. Continuing.'
-                print(msg)
-                Utilities.writeLogFile(msg)
-            timeStamp = newTimeStamp.copy()
-
-        if badTimes == []:
-            startLength = 1 # avoids div by zero below when finalCount is 0
+        if originalLength == 0 and len(badTimes) > 0:
+            msg = 'Data group is empty. Continuing.'
+            print(msg)
+            Utilities.writeLogFile(msg)
+        finalCount = group.datasetKeepRows(Utilities.badTimesMask(timeStamp, badTimes))
 
         for ds in group.datasets:
             # if ds != "STATION":
@@ -2074,11 +2046,9 @@ class ProcessL2:
         rootCopy.getGroup('RADIANCE').copy(root.getGroup('RADIANCE'))
 
         py6s_available = False
-        for gp in root.groups:
-            if gp.id == 'PY6S_MODEL':
-                py6s_available = True
-                rootCopy.getGroup('PY6S_MODEL').copy(root.getGroup('PY6S_MODEL'))
-                break
+        if root.getGroup('PY6S_MODEL') is not None:
+            py6s_available = True
+            rootCopy.getGroup('PY6S_MODEL').copy(root.getGroup('PY6S_MODEL'))
 
         if ConfigFile.settings['SensorType'].lower() == 'seabird':
             rootCopy.addGroup("ES_DARK_L1AQC")
@@ -1,14 +1,18 @@
 """Read raw Sea-Bird file"""
+import collections
+import mmap
+import os
+import re
 import sys
 
+import numpy as np
+
 from Source.Utilities import Utilities
 
 class RawFileReader:
     """Read raw Sea-Bird file"""
-    MAX_TAG_READ = 32
     MAX_BLOCK_READ = 1024
     SATHDR_READ = 128
-    RESET_TAG_READ = MAX_TAG_READ-16
 
     # Function for reading SATHDR (Header) messages
     # Messages are in format: SATHDR <Value> (<Name>)\r\n
@@ -37,9 +41,30 @@ class RawFileReader:
             str1 = "Missing"
         return (str2, str1)
 
+    @staticmethod
+    def framePattern(calibrationMap):
+        ''' Compiles one case-insensitive search over SATHDR and every instrument frame tag.
+            Returns the pattern and the calibrationMap key for each alternative (None for
+            SATHDR). Alternatives are tried in calibrationMap order, so the first matching key
+            wins, as it always has. '''
+        keys = [None]
+        tags = [re.escape(b"SATHDR")]
+        for key in calibrationMap:
+            tag = calibrationMap[key].id.upper().encode("utf-8")
+            if len(tag) == 0:
+                continue
+            keys.append(key)
+            tags.append(re.escape(tag))
+        pattern = re.compile(b"|".join(b"(" + tag + b")" for tag in tags), re.IGNORECASE)
+        return pattern, keys
+
     # Reads a raw file
     @staticmethod
     def readRawFile(filepath, calibrationMap, contextMap, root):
+        ''' Memory maps the raw file and finds frame headers with a single compiled search,
+            resuming after each frame. Fixed width binary frames are decoded per frame type in
+            one pass at the end; ASCII/variable frames are parsed as they are found.
+            Returns the frame offset table as a list of (offset, calibrationMap key, frame length). '''
 
         posframe = 1
 
@@ -50,79 +75,112 @@ class RawFileReader:
         #ds.appendColumn(u"COUNT", posframe)
         posframe += 1
 
+        frameTable = []
+        pending = collections.OrderedDict()
+        # POSFRAME numbers of located frames that then failed to decode
+        dropped = []
+        pattern, keys = RawFileReader.framePattern(calibrationMap)
+
         with open(filepath, 'rb') as f:
-            while 1:
-                # Reads binary file to find message frame tag
-                pos = f.tell()
-                b = f.read(RawFileReader.MAX_TAG_READ)
-                f.seek(pos)
-
-                if "SATHSE" in str(b):
-                    pass
-                if not b:
-                    break
-
-                #print b
-                for i in range(0, RawFileReader.MAX_TAG_READ):
-                    testString = b[i:].upper()
-                    #print("test: ", testString[:6])
-
-                    # Reset file position on max read
-                    if i == RawFileReader.MAX_TAG_READ-1:
-                        #f.read(RawFileReader.MAX_TAG_READ)
-                        f.read(RawFileReader.RESET_TAG_READ)
+            if os.fstat(f.fileno()).st_size == 0:
+                return frameTable
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = 0
+                while 1:
+                    # Finds the next message frame tag
+                    match = pattern.search(mm, pos)
+                    if match is None:
                         break
+                    start = match.start()
+                    key = keys[match.lastindex - 1]
 
-                    # Detects message type from frame tag
-                    if testString.startswith(b"SATHDR"):
-                        #print("SATHDR")
-                        if i > 0:
-                            f.read(i)
-                        hdr = f.read(RawFileReader.SATHDR_READ)
+                    if key is None:
+                        # SATHDR
+                        hdr = mm[start:start + RawFileReader.SATHDR_READ]
                         (k,v) = RawFileReader.readSATHDR(hdr)
                         root.attributes[k] = v
+                        pos = start + len(hdr)
+                        continue
+
+                    cf = calibrationMap[key]
+                    gp = contextMap[cf.id]
+                    # Only the first time through
+                    if len(gp.attributes) == 0:
+                        #gp.id += "_" + cf.id
+                        gp.id = key
+                        gp.attributes["CalFileName"] = key
+                        gp.attributes["FrameTag"] = cf.id
+
+                    # Fixed width binary frames are only located here, then decoded per frame type below
+                    frameLength = cf.getFrameDtype()[1]
+                    if frameLength is not None and start + frameLength <= len(mm):
+                        offsets, posframes = pending.setdefault(key, ([], []))
+                        offsets.append(start)
+                        posframes.append(posframe)
+                        posframe += 1
+                        frameTable.append((start, key, frameLength))
+                        pos = start + frameLength
+                        continue
+
+                    # Keep columns in file order if this type also has frames waiting to be decoded
+                    dropped.extend(RawFileReader.convertPending(mm, pending, key, calibrationMap, contextMap))
+                    msg = mm[start:start + RawFileReader.MAX_BLOCK_READ]
+                    num = 0
+                    try:
+                        num = cf.convertRaw(msg, gp)
+                    except Exception:
+                        pmsg = f'Unable to convert the following raw message: {msg}'
+                        print(pmsg)
+                        Utilities.writeLogFile(pmsg)
+
+                    if num >= 0:
+                        # Generate POSFRAME
+                        ds = gp.getDataset("POSFRAME")
+                        if ds is None:
+                            ds = gp.addDataset("POSFRAME")
+                        ds.appendColumn("COUNT", posframe)
+                        posframe += 1
+                        frameTable.append((start, key, num))
+
+                    # Skip past the frame, or past this tag if nothing was read
+                    pos = start + num if num > 0 else start + 1
+
+                for key in list(pending):
+                    dropped.extend(RawFileReader.convertPending(mm, pending, key, calibrationMap, contextMap))
+
+        if dropped:
+            frameTable = RawFileReader.dropFrames(frameTable, dropped, contextMap)
+        return frameTable
 
-                        break
-                    else:
-                        num = 0
-                        for key in calibrationMap:
-                            cf = calibrationMap[key]
-                            if testString.startswith(cf.id.upper().encode("utf-8")):
-                                if i > 0:
-                                    f.read(i)
-
-                                pos = f.tell()
-                                msg = f.read(RawFileReader.MAX_BLOCK_READ)
-                                f.seek(pos)
-
-                                gp = contextMap[cf.id]
-                                # Only the first time through
-                                if len(gp.attributes) == 0:
-                                    #gp.id += "_" + cf.id
-                                    gp.id = key
-                                    gp.attributes["CalFileName"] = key
-                                    gp.attributes["FrameTag"] = cf.id
-
-                                # if key.startswith('SATPYR'):
-                                #     print('curious...')
-
-                                try:
-                                    num = cf.convertRaw(msg, gp)
-                                except Exception:
-                                    pmsg = f'Unable to convert the following raw message: {msg}'
-                                    print(pmsg)
-                                    Utilities.writeLogFile(pmsg)
-
-                                if num >= 0:
-                                    # Generate POSFRAME
-                                    ds = gp.getDataset("POSFRAME")
-                                    if ds is None:
-                                        ds = gp.addDataset("POSFRAME")
-                                    ds.appendColumn("COUNT", posframe)
-                                    posframe += 1
-                                    f.read(num)
-
-                                break
-                        if num > 0:
-                            break
-                        
\ No newline at end of file
+    @staticmethod
+    def dropFrames(frameTable, dropped, contextMap):
+        ''' Removes frames that failed to decode from the offset table and renumbers POSFRAME
+            consecutively, as if those frames had never been counted. Frame i of the table has
+            POSFRAME i+2. '''
+        dropped = np.sort(np.asarray(dropped, dtype=np.int64))
+        keep = np.ones(len(frameTable), dtype=bool)
+        keep[dropped - 2] = False
+        for gp in contextMap.values():
+            ds = gp.getDataset("POSFRAME")
+            if ds is not None and "COUNT" in ds.columns:
+                count = np.asarray(ds.columns["COUNT"], dtype=np.int64)
+                ds.columns["COUNT"] = (count - np.searchsorted(dropped, count)).tolist()
+        return [frame for frame, ok in zip(frameTable, keep) if ok]
+
+    @staticmethod
+    def convertPending(mm, pending, key, calibrationMap, contextMap):
+        ''' Decodes the frames of one type located so far with a single np.frombuffer pass.
+            Returns the POSFRAME numbers of the frames that failed to decode. '''
+        if key not in pending:
+            return []
+        offsets, posframes = pending.pop(key)
+        cf = calibrationMap[key]
+        gp = contextMap[cf.id]
+        good = cf.convertRawFrames(mm, offsets, gp)
+        posframes = np.asarray(posframes)
+        # Generate POSFRAME, only for the frames that were stored
+        ds = gp.getDataset("POSFRAME")
+        if ds is None:
+            ds = gp.addDataset("POSFRAME")
+        ds.extendColumn("COUNT", posframes[good].tolist())
+        return posframes[~good].tolist()
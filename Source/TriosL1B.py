@@ -45,7 +45,7 @@ class TriosL1B:
         LAMP = np.asarray(pd.DataFrame(unc_grp.getDataset(sensortype+"_RADCAL_LAMP").data)['2'])
 
         # create Zong SDF straylight correction matrix
-        C_zong = ProcessL1b_FRMCal.Zong_SL_correction_matrix(mZ)
+        C_zong = ProcessL1b_FRMCal.Zong_SL_correction_matrix_cached(mZ, radcal_wvl)
 
         # Defined constants
         nband = len(B0)
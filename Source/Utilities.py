@@ -1,5 +1,6 @@
 """ A cornucopia of addition methods """
 import os
+import atexit
 import datetime
 import collections
 from collections import Counter
@@ -12,6 +13,7 @@ import pytz
 import matplotlib.pyplot as plt
 from matplotlib.pyplot import cm
 import numpy as np
+from numpy.lib import recfunctions
 import scipy.interpolate
 from scipy.interpolate import splev, splrep
 import scipy as sp
@@ -282,14 +284,55 @@ class Utilities:
         returnValue = msgBox.exec_()
         return returnValue
 
+    # Log lines are buffered and written through one open handle; see writeLogFile
+    LOG_BUFFER_LINES = 512
+    _logFile = None
+    _logPath = None
+    _logPid = None
+    _logBuffer = []
+
     @staticmethod
     def writeLogFile(logText, mode='a'):
-        if not os.path.exists('Logs'):
-            import logging
-            logging.getLogger().warning('Made directory: Logs/')
-            os.mkdir('Logs')
-        with open('Logs/' + os.environ["LOGFILE"], mode, encoding="utf-8") as logFile:
-            logFile.write(logText + "\n")
+        ''' Append a line to Logs/<LOGFILE>. The handle stays open until LOGFILE changes and lines are
+            written in batches; call flushLogFile before reading the log. mode='w' starts a new log. '''
+        logPath = 'Logs/' + os.environ["LOGFILE"]
+        if os.getpid() != Utilities._logPid:
+            # Forked (e.g. pool) worker: the buffer and handle belong to the parent process
+            Utilities._logFile = None
+            Utilities._logPath = None
+            Utilities._logBuffer = []
+            Utilities._logPid = os.getpid()
+        if mode == 'w' or logPath != Utilities._logPath:
+            Utilities.closeLogFile()
+            if not os.path.exists('Logs'):
+                import logging
+                logging.getLogger().warning('Made directory: Logs/')
+                os.makedirs('Logs', exist_ok=True)
+            Utilities._logFile = open(logPath, mode, encoding="utf-8")
+            Utilities._logPath = logPath
+
+        Utilities._logBuffer.append(logText + "\n")
+        if len(Utilities._logBuffer) >= Utilities.LOG_BUFFER_LINES:
+            Utilities.flushLogFile()
+
+    @staticmethod
+    def flushLogFile():
+        ''' Write buffered log lines to disk '''
+        if Utilities._logFile is None or os.getpid() != Utilities._logPid:
+            return
+        if Utilities._logBuffer:
+            Utilities._logFile.writelines(Utilities._logBuffer)
+            Utilities._logBuffer = []
+        # Keep the file object's own buffer empty too, so a forked worker inherits nothing unwritten
+        Utilities._logFile.flush()
+
+    @staticmethod
+    def closeLogFile():
+        Utilities.flushLogFile()
+        if Utilities._logFile is not None and os.getpid() == Utilities._logPid:
+            Utilities._logFile.close()
+        Utilities._logFile = None
+        Utilities._logPath = None
 
     # Converts degrees minutes to decimal degrees format
     @staticmethod
@@ -428,6 +471,103 @@ class Utilities:
         mon = int(date[2:4])
         return datetime.datetime(year,mon,day,0,0,0,0,tzinfo=datetime.timezone.utc)
 
+    # Converts arrays of Datetag (YYYYDOY) and TimeTag2 (HHMMSSmmm) to datetime64[us] (UTC)
+    @staticmethod
+    def tagsToDatetime64(dateTag, timeTag2):
+        ''' Decode DATETAG and TIMETAG2 arithmetically. Returns (datetime64[us] array, valid mask).
+            Invalid rows (NaN or zero TIMETAG2, DATETAG outside 1900-2099, out of range
+            fields) are NaT in the array and False in the mask. '''
+        dateTag = np.asarray(dateTag, dtype=np.float64)
+        timeTag2 = np.asarray(timeTag2, dtype=np.float64)
+
+        valid = np.isfinite(dateTag) & np.isfinite(timeTag2) & (timeTag2 > 0) & (timeTag2 < 1e9) \
+            & (dateTag >= 1900000) & (dateTag < 2100000)
+        dateInt = np.where(valid, dateTag, 1970001).astype(np.int64)
+        timeInt = np.where(valid, timeTag2, 0).astype(np.int64)
+
+        year, doy = np.divmod(dateInt, 1000)
+        hour, rest = np.divmod(timeInt, 10**7)
+        minute, rest = np.divmod(rest, 10**5)
+        sec, ms = np.divmod(rest, 1000)
+        # As strptime('%Y%j'), day 366 of a non-leap year rolls over to 1 January
+        valid &= (doy >= 1) & (doy <= 366) & (hour < 24) & (minute < 60) & (sec < 60)
+
+        days = (year - 1970).astype('datetime64[Y]').astype('datetime64[D]') + (doy - 1)
+        micro = ((hour*60 + minute)*60 + sec)*10**6 + ms*1000
+        dt64 = days.astype('datetime64[us]') + micro.astype('timedelta64[us]')
+        dt64[~valid] = np.datetime64('NaT')
+        return dt64, valid
+
+    # Converts datetime64 array to a list of timezone aware (UTC) datetimes
+    @staticmethod
+    def datetime64ToDateTime(dt64):
+        utc = datetime.timezone.utc
+        return [dt.replace(tzinfo=utc) for dt in np.asarray(dt64, dtype='datetime64[us]').astype(object)]
+
+    @staticmethod
+    def tagsToDateTime(dateTag, timeTag2):
+        ''' Datetimes for the valid rows of DATETAG/TIMETAG2, and the indices of bad rows (logged) '''
+        dt64, valid = Utilities.tagsToDatetime64(dateTag, timeTag2)
+        badRows = np.flatnonzero(~valid)
+        for i in badRows:
+            msg = f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timeTag2[i]}"
+            print(msg)
+            Utilities.writeLogFile(msg)
+        return Utilities.datetime64ToDateTime(dt64[valid]), badRows.tolist()
+
+    # Converts a list of datetimes (naive or timezone aware) to datetime64[us] (UTC)
+    @staticmethod
+    def datetimeToDatetime64(dateTime):
+        utc = datetime.timezone.utc
+        return np.array([dt if dt.tzinfo is None else dt.astimezone(utc).replace(tzinfo=None)
+                         for dt in dateTime], dtype='datetime64[us]')
+
+    # Converts datetime64 to arrays of Datetag (YYYYDOY) and TimeTag2 (HHMMSSmmm), as datetime2DateTag/TimeTag2
+    @staticmethod
+    def datetime64ToTags(dt64):
+        dt64 = np.asarray(dt64, dtype='datetime64[us]')
+        days = dt64.astype('datetime64[D]')
+        years = days.astype('datetime64[Y]')
+        doy = (days - years).astype(np.int64) + 1
+        micro = (dt64 - days).astype(np.int64)
+        sec, us = np.divmod(micro, 10**6)
+        hour, sec = np.divmod(sec, 3600)
+        minute, sec = np.divmod(sec, 60)
+        dateTag = (years.astype(np.int64) + 1970)*1000 + doy
+        timeTag2 = hour*10**7 + minute*10**5 + sec*1000 + us//1000
+        return dateTag.astype(np.float64), timeTag2.astype(np.float64)
+
+    @staticmethod
+    def nearestTimeIndex(reference, values, tolerance=None, direction='nearest'):
+        ''' Join values onto sorted reference times (datetime64 arrays) with a binary search.
+            Returns the index of the nearest reference time for each value ('nearest', ties to
+            the first of the earlier times, as find_nearest), or of the last at or before it
+            ('backward') or the first at or after it ('forward'), as in an asof join.
+            Values with no match, or farther than tolerance (seconds or timedelta64), get -1. '''
+        reference = np.asarray(reference, dtype='datetime64[us]')
+        values = np.asarray(values, dtype='datetime64[us]')
+        index = np.full(values.shape, -1, dtype=np.int64)
+        if len(reference) == 0:
+            return index
+
+        after = np.searchsorted(reference, values, side='left')
+        if direction == 'forward':
+            found = after < len(reference)
+            index[found] = after[found]
+        elif direction == 'backward':
+            index = np.searchsorted(reference, values, side='right') - 1
+        else:
+            before = np.searchsorted(reference, reference[np.maximum(after - 1, 0)], side='left')
+            after = np.minimum(after, len(reference) - 1)
+            index = np.where(np.abs(reference[after] - values) < np.abs(values - reference[before]), after, before)
+
+        if tolerance is not None:
+            if not isinstance(tolerance, np.timedelta64):
+                tolerance = np.timedelta64(int(round(float(tolerance)*10**6)), 'us')
+            found = index >= 0
+            found[found] = np.abs(reference[index[found]] - values[found]) <= tolerance
+            index[~found] = -1
+        return index
 
     @staticmethod
     def rootAddDateTime(node):
@@ -438,28 +578,13 @@ class Utilities:
         for gp in node.groups:
             # print(gp.id)
             if gp.id != "SOLARTRACKER_STATUS" and "UNCERT" not in gp.id and gp.id != "SATMSG.tdf": # No valid timestamps in STATUS
-                timeData = gp.getDataset("TIMETAG2").data["NONE"].tolist()
-                dateTag = gp.getDataset("DATETAG").data["NONE"].tolist()
-                timeStamp = []
-                for i, timei in enumerate(timeData):
-                    # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-                    # Filter for aberrant Datetags
-                    t = str(int(timei)).zfill(9)
-                    h = int(t[:2])
-                    m = int(t[2:4])
-                    s = int(t[4:6])
-
-                    if (str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20")) \
-                        and timei != 0.0 and not np.isnan(timei) \
-                            and h < 60 and m < 60 and s < 60:
-
-                        dt = Utilities.dateTagToDateTime(dateTag[i])
-                        timeStamp.append(Utilities.timeTag2ToDateTime(dt, timei))
-                    else:
-                        msg = f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timei}"
-                        print(msg)
-                        Utilities.writeLogFile(msg)
-                        gp.datasetDeleteRow(i)
+                timeData = gp.getDataset("TIMETAG2").data["NONE"]
+                dateTag = gp.getDataset("DATETAG").data["NONE"]
+                # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
+                # Filter for aberrant Datetags
+                timeStamp, badRows = Utilities.tagsToDateTime(dateTag, timeData)
+                if badRows:
+                    gp.datasetDeleteRows(badRows, len(timeData))
 
                 dateTime = gp.addDataset("DATETIME")
                 dateTime.data = timeStamp
@@ -475,28 +600,13 @@ class Utilities:
         # for gp in node.groups:
         # print(gp.id)
         if gp.id != "SOLARTRACKER_STATUS" and "UNCERT" not in gp.id and gp.id != "SATMSG.tdf": # No valid timestamps in STATUS
-            timeData = gp.getDataset("TIMETAG2").data["NONE"].tolist()
-            dateTag = gp.getDataset("DATETAG").data["NONE"].tolist()
-            timeStamp = []
-            for i, timei in enumerate(timeData):
-                # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-                # Filter for aberrant Datetags
-                t = str(int(timei)).zfill(9)
-                h = int(t[:2])
-                m = int(t[2:4])
-                s = int(t[4:6])
-
-                if (str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20")) \
-                    and timei != 0.0 and not np.isnan(timei) \
-                        and h < 60 and m < 60 and s < 60:
-
-                    dt = Utilities.dateTagToDateTime(dateTag[i])
-                    timeStamp.append(Utilities.timeTag2ToDateTime(dt, timei))
-                else:
-                    msg = f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timei}"
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    gp.datasetDeleteRow(i)
+            timeData = gp.getDataset("TIMETAG2").data["NONE"]
+            dateTag = gp.getDataset("DATETAG").data["NONE"]
+            # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
+            # Filter for aberrant Datetags
+            timeStamp, badRows = Utilities.tagsToDateTime(dateTag, timeData)
+            if badRows:
+                gp.datasetDeleteRows(badRows, len(timeData))
 
             dateTime = gp.addDataset("DATETIME")
             dateTime.data = timeStamp
@@ -524,20 +634,13 @@ class Utilities:
                                 timeData = gp.datasets[ds].columns["Timetag2"]
                                 dateTag = gp.datasets[ds].columns["Datetag"]
 
-                                timeStamp = []
-                                for i, timei in enumerate(timeData):
-                                    # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-                                    # Filter for aberrant Datetags
-                                    if (str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20")) \
-                                        and timei != 0.0 and not np.isnan(timei):
-
-                                        dt = Utilities.dateTagToDateTime(dateTag[i])
-                                        timeStamp.append(Utilities.timeTag2ToDateTime(dt, timei))
-                                    else:
-                                        gp.datasetDeleteRow(i)
-                                        msg = f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timei}"
-                                        print(msg)
-                                        Utilities.writeLogFile(msg)
+                                # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
+                                # Filter for aberrant Datetags
+                                timeStamp, badRows = Utilities.tagsToDateTime(dateTag, timeData)
+                                if badRows:
+                                    gp.datasetDeleteRows(badRows, len(timeData))
+                                    # Columns must match the compacted data before adding Datetime
+                                    gp.datasets[ds].datasetToColumns()
                                 gp.datasets[ds].columns["Datetime"] = timeStamp
                                 gp.datasets[ds].columns.move_to_end('Datetime', last=False)
                                 gp.datasets[ds].columnsToDataset()
@@ -556,20 +659,12 @@ class Utilities:
                     gp.datasets['Timestamp'].columns['Timetag2'] = timeData
                     gp.datasets['Timestamp'].columnsToDataset()
 
-                    timeStamp = []
-                    for i, timei in enumerate(timeData):
-                        # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-                        # Filter for aberrant Datetags
-                        if (str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20")) \
-                            and timei != 0.0 and not np.isnan(timei):
-
-                            dt = Utilities.dateTagToDateTime(dateTag[i])
-                            timeStamp.append(Utilities.timeTag2ToDateTime(dt, timei))
-                        else:
-                            gp.datasetDeleteRow(i) # L1AQC datasets all have the same i
-                            msg = f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timei}"
-                            print(msg)
-                            Utilities.writeLogFile(msg)
+                    # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
+                    # Filter for aberrant Datetags. L1AQC datasets all have the same rows.
+                    timeStamp, badRows = Utilities.tagsToDateTime(dateTag, timeData)
+                    if badRows:
+                        gp.datasetDeleteRows(badRows, len(timeData))
+                        gp.datasets['Timestamp'].datasetToColumns()
                     # This will be the only dataset structure like a higher level with time/date columns
                     gp.datasets['Timestamp'].columns["Datetime"] = timeStamp
                     gp.datasets['Timestamp'].columns.move_to_end('Datetime', last=False)
@@ -584,28 +679,13 @@ class Utilities:
     def rawDataAddDateTime(node):
         for gp in node.groups:
             if "L1AQC" in gp.id:
-                timeData = gp.getDataset("TIMETAG2").data["NONE"].tolist()
-                dateTag = gp.getDataset("DATETAG").data["NONE"].tolist()
-                timeStamp = []
-                for i, timei in enumerate(timeData):
-                    # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-                    # Filter for aberrant Datetags
-                    t = str(int(timei)).zfill(9)
-                    h = int(t[:2])
-                    m = int(t[2:4])
-                    s = int(t[4:6])
-
-                    if (str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20")) \
-                        and timei != 0.0 and not np.isnan(timei) \
-                            and h < 60 and m < 60 and s < 60:
-
-                        dt = Utilities.dateTagToDateTime(dateTag[i])
-                        timeStamp.append(Utilities.timeTag2ToDateTime(dt, timei))
-                    else:
-                        msg = f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timei}"
-                        print(msg)
-                        Utilities.writeLogFile(msg)
-                        gp.datasetDeleteRow(i)
+                timeData = gp.getDataset("TIMETAG2").data["NONE"]
+                dateTag = gp.getDataset("DATETAG").data["NONE"]
+                # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
+                # Filter for aberrant Datetags
+                timeStamp, badRows = Utilities.tagsToDateTime(dateTag, timeData)
+                if badRows:
+                    gp.datasetDeleteRows(badRows, len(timeData))
 
                 dateTime = gp.addDataset("DATETIME")
                 dateTime.data = timeStamp
@@ -620,51 +700,43 @@ class Utilities:
         # Test for strictly ascending values
         # Not sensitive to UTC midnight (i.e. in datetime format)
         total = len(dateTime)
-        globalTotal = total
-        if total >= 2:
-            # Check the first element prior to looping over rest
-            i = 0
-            if dateTime[i+1] <= dateTime[i]:
-                gp.datasetDeleteRow(i)
-                # del dateTime[i] # I'm fuzzy on why this is necessary; not a pointer?
-                dateTime = gp.getDataset("DATETIME").data
-                total = total - 1
-                msg = f'Out of order timestamp deleted at {i}'
-                print(msg)
-                Utilities.writeLogFile(msg)
-
-                #In case we went from 2 to 1 element on the first element,
-                if total == 1:
-                    msg = f'************Too few records ({total}) to test for ascending timestamps. Exiting.'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    return False
-
-            i = 1
-            while i < total:
-
-                if dateTime[i] <= dateTime[i-1]:
-
-                    # BUG?:Same values of consecutive TT2s are shockingly common. Confirmed
-                    #   that 1) they exist from L1A, and 2) sensor data changes while TT2 stays the same
-                    #
-
-                    gp.datasetDeleteRow(i)
-                    # del dateTime[i] # I'm fuzzy on why this is necessary; not a pointer?
-                    dateTime = gp.getDataset("DATETIME").data
-                    total = total - 1
-                    msg = f'Out of order TIMETAG2 row deleted at {i}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    continue # goto while test skipping i incrementation. dateTime[i] is now the next value.
-                i += 1
-        else:
+        if total < 2:
             msg = f'************Too few records ({total}) to test for ascending timestamps. Exiting.'
             print(msg)
             Utilities.writeLogFile(msg)
             return False
-        if (globalTotal - total) > 0:
-            msg = f'Data eliminated for non-increasing timestamps: {100*(globalTotal - total)/globalTotal:3.1f}%'
+
+        # Object array so numpy compares the datetimes themselves
+        values = np.empty(total, dtype=object)
+        values[:] = list(dateTime)
+
+        # The first element goes if it is not below the second; otherwise every later record must
+        # exceed all records before it (i.e. the last one kept). Duplicate TT2s are shockingly
+        # common; confirmed that 1) they exist from L1A, and 2) sensor data changes while TT2 stays the same
+        start = 1 if values[1] <= values[0] else 0
+        if start == 1 and total == 2:
+            # Deleted as in the loop over records, leaving a single one
+            gp.datasetKeepRows(np.array([False, True]))
+            msg = 'Out of order timestamp deleted at 0'
+            print(msg)
+            Utilities.writeLogFile(msg)
+            msg = f'************Too few records ({total - 1}) to test for ascending timestamps. Exiting.'
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return False
+        keep = np.zeros(total, dtype=bool)
+        keep[start] = True
+        runningMax = np.maximum.accumulate(values[start:])
+        keep[start+1:] = np.asarray(values[start+1:] > runningMax[:-1], dtype=bool)
+
+        badRows = np.flatnonzero(~keep)
+        for i in badRows:
+            msg = f'Out of order timestamp deleted at {i}'
+            print(msg)
+            Utilities.writeLogFile(msg)
+        if len(badRows) > 0:
+            gp.datasetKeepRows(keep)
+            msg = f'Data eliminated for non-increasing timestamps: {100*len(badRows)/total:3.1f}%'
             print(msg)
             Utilities.writeLogFile(msg)
 
@@ -683,23 +755,20 @@ class Utilities:
     # Check if dataset contains NANs
     @staticmethod
     def hasNan(ds):
+        ''' True if any value outside the Datetime column is NaN, for a dataset or its columns '''
         try:
-            keys = ds.data.dtype.fields.keys()
+            keys = [k for k in ds.data.dtype.fields.keys() if k != 'Datetime']
+            # One reduction over a float view of the numpy array when the columns share a dtype
+            if ds.isHomogeneous(keys) and not ds.data.dtype.hasobject:
+                return bool(np.isnan(ds.toArray(keys)).any())
             data = ds.data
-            length = ds.data.shape[0]
         except AttributeError:
-            keys = ds.keys()  # for if columns passed directly
+            keys = [k for k in ds.keys() if k != 'Datetime']  # for if columns passed directly
             data = ds
-            length = np.asarray(list(ds.values())).shape[1]
 
         for k in keys:
-            for x in range(length):
-                if k != 'Datetime':
-                    if np.isnan(data[k][x]):
-                        return True
-                # else:
-                #     if np.isnan(ds.data[k][x]):
-                #         return True
+            if np.isnan(np.asarray(data[k], dtype=np.float64)).any():
+                return True
         return False
 
     @staticmethod
@@ -774,36 +843,28 @@ class Utilities:
 
     @staticmethod
     def darkConvolution(data,avg,std,sigma):
-        badIndex = []
-        for i, dat in enumerate(data):
-            if i < 1 or i > len(data)-2:
-                # First and last avg values from convolution are not to be trusted
-                badIndex.append(True)
-            elif np.isnan(dat):
-                badIndex.append(False)
-            else:
-                # Use stationary standard deviation anomaly (from rolling average) detection for dark data
-                if (dat > avg[i] + (sigma*std)) or (dat < avg[i] - (sigma*std)):
-                    badIndex.append(True)
-                else:
-                    badIndex.append(False)
+        ''' Flag records outside avg +/- sigma*std, with std stationary (one value per series).
+            Works along the last axis of 1-D or (band x time) arrays; std broadcasts against data.
+            Returns a boolean array shaped like data. '''
+        data = np.asarray(data, dtype=np.float64)
+        # Use stationary standard deviation anomaly (from rolling average) detection for dark data
+        # NaN records compare False, i.e. are not flagged
+        badIndex = (data > np.add(avg, sigma*std)) | (data < np.subtract(avg, sigma*std))
+        if data.shape[-1] > 0:
+            # First and last avg values from convolution are not to be trusted
+            badIndex[..., [0, -1]] = True
         return badIndex
 
     @staticmethod
     def lightConvolution(data,avg,rolling_std,sigma):
-        badIndex = []
-        for i, dat in enumerate(data):
-            if i < 1 or i > len(data)-2:
-                # First and last avg values from convolution are not to be trusted
-                badIndex.append(True)
-            elif np.isnan(dat):
-                badIndex.append(False)
-            else:
-                # Use rolling standard deviation anomaly (from rolling average) detection for dark data
-                if (dat > avg[i] + (sigma*rolling_std[i])) or (dat < avg[i] - (sigma*rolling_std[i])):
-                    badIndex.append(True)
-                else:
-                    badIndex.append(False)
+        ''' As darkConvolution, but with a rolling std (one value per record) '''
+        data = np.asarray(data, dtype=np.float64)
+        rolling_std = np.asarray(rolling_std, dtype=np.float64)
+        # Use rolling standard deviation anomaly (from rolling average) detection for light data
+        badIndex = (data > np.add(avg, sigma*rolling_std)) | (data < np.subtract(avg, sigma*rolling_std))
+        if data.shape[-1] > 0:
+            # First and last avg values from convolution are not to be trusted
+            badIndex[..., [0, -1]] = True
         return badIndex
 
     @staticmethod
@@ -944,7 +1005,9 @@ class Utilities:
 
     @staticmethod
     def interpFill(x, y, newXList, fillValue=np.nan):
-        ''' Used where fill is needed instead of interpolation, e.g., STATIONS in L1B.'''
+        ''' Used where fill is needed instead of interpolation, e.g., STATIONS in L1B.
+            Each newX within the x range of a value of y takes that value (the largest, where
+            ranges overlap), found by binary search on the sorted newX; otherwise fillValue. '''
 
         y = np.array(y)
         x = np.array(x)
@@ -952,25 +1015,29 @@ class Utilities:
         y = np.delete(y,whrNan)
         x = np.delete(x,whrNan)
 
-        yUnique = np.unique(y) #.tolist()
-
-        newYList = []
-        # Populate with nans first, then replace to guarantee value regardless of any or multiple matches
-        for newX in newXList:
-            newYList.append(fillValue)
-
-        for value in yUnique:
-            minX = min(x[y==value])
-            maxX = max(x[y==value])
-
-            for i, newX in enumerate(newXList):
-                if (newX >= minX) and (newX <= maxX):
-                    newYList[i] = value
-
-        return newYList
-
-    @staticmethod
-    def fixDarkTimes(darkGroup,lightGroup):        
+        # First and last x of each unique value
+        yUnique, inverse = np.unique(y, return_inverse=True)
+        minX = np.full(len(yUnique), np.inf)
+        maxX = np.full(len(yUnique), -np.inf)
+        np.minimum.at(minX, inverse, x)
+        np.maximum.at(maxX, inverse, x)
+
+        # Index of the matching value of each newX, replaced in increasing order of value so the largest match wins
+        newX = np.asarray(newXList, dtype=np.float64)
+        order = np.argsort(newX, kind='stable')
+        sortedX = newX[order]
+        match = np.full(len(newX), -1)
+        lower = np.searchsorted(sortedX, minX, side='left')
+        upper = np.searchsorted(sortedX, maxX, side='right')
+        for k, (lo, hi) in enumerate(zip(lower, upper)):
+            match[order[lo:hi]] = k
+
+        # Matched values keep the type of y (e.g. integer STATIONS); the rest are fillValue as given
+        values = yUnique[np.maximum(match, 0)].tolist() if len(yUnique) else [fillValue]*len(newX)
+        return [fillValue if k < 0 else value for k, value in zip(match, values)]
+
+    @staticmethod
+    def fixDarkTimes(darkGroup,lightGroup):
         ''' Find the nearest timestamp in the light data to each dark measurements (Sea-Bird) '''
 
         darkDatetime = darkGroup.datasets["DATETIME"].data
@@ -980,19 +1047,14 @@ class Utilities:
         timeTagNew = darkGroup.addDataset('TIMETAG2_ADJUSTED')
         dateTimeNew = darkGroup.addDataset('DATETIME_ADJUSTED')
 
-        dateTag = []
-        timeTag = []
-        dateTime = []
-        for darkTime in darkDatetime:
-            iLight = Utilities.find_nearest(lightDatetime,darkTime)                 
+        # One binary search for all darks; sorted (stably) first in case light times step back
+        lightTimes = Utilities.datetimeToDatetime64(lightDatetime)
+        order = np.argsort(lightTimes, kind='stable')
+        iLight = order[Utilities.nearestTimeIndex(lightTimes[order], Utilities.datetimeToDatetime64(darkDatetime))]
 
-            dateTag.append(lightGroup.datasets['DATETAG'].data[iLight])
-            timeTag.append(lightGroup.datasets['TIMETAG2'].data[iLight])
-            dateTime.append(lightGroup.datasets['DATETIME'].data[iLight])
-
-        dateTagNew.data = dateTag
-        timeTagNew.data = timeTag
-        dateTimeNew.data = dateTime
+        dateTagNew.data = list(lightGroup.datasets['DATETAG'].data[iLight])
+        timeTagNew.data = list(lightGroup.datasets['TIMETAG2'].data[iLight])
+        dateTimeNew.data = [lightDatetime[i] for i in iLight]
 
         return darkGroup
 
@@ -1008,9 +1070,6 @@ class Utilities:
         msg = f'Remove {group.id} Data'
         print(msg)
         Utilities.writeLogFile(msg)
-        # internal switch to trigger the reset of CAL & BACK
-        # dataset that we have to delete to avoid conflict during filtering
-        do_reset = False
 
         if level != 'L1AQC':
             if group.id == "ANCILLARY":
@@ -1023,77 +1082,77 @@ class Utilities:
                 timeStamp = group.getDataset("solar_zenith").data["Datetime"]
         else:
             timeStamp = group.getDataset("Timestamp").data["Datetime"]
-            # TRIOS: copy CAL & BACK before filetering, and delete them 
-            # to avoid conflict when filtering more row than 255
-            if ConfigFile.settings['SensorType'].lower() == 'trios':
-                do_reset = True
-                raw_cal  = group.getDataset("CAL_"+group.id[0:2]).data
-                raw_back = group.getDataset("BACK_"+group.id[0:2]).data
-                raw_cal_att  = group.getDataset("CAL_"+group.id[0:2]).attributes
-                raw_back_att = group.getDataset("BACK_"+group.id[0:2]).attributes
-                del group.datasets['CAL_'+group.id[0:2]]
-                del group.datasets['BACK_'+group.id[0:2]]
-
-
-        startLength = len(timeStamp)
-        msg = f'   Length of dataset prior to removal {startLength} long'
+
+        originalLength = len(timeStamp)
+        msg = f'   Length of dataset prior to removal {originalLength} long'
         print(msg)
         Utilities.writeLogFile(msg)
 
-        # Delete the records in badTime ranges from each dataset in the group
-        finalCount = 0
-        originalLength = len(timeStamp)
-        for dateTime in badTimes:
-            # Need to reinitialize for each loop
-            startLength = len(timeStamp)
-            newTimeStamp = []
+        if originalLength == 0 and len(badTimes) > 0:
+            msg = 'Data group is empty. Continuing.'
+            print(msg)
+            Utilities.writeLogFile(msg)
 
-            # msg = f'Eliminate data between: {dateTime}'
-            # print(msg)
-            # Utilities.writeLogFile(msg)
+        # Flag the records in badTime ranges, then delete them from each dataset in the group at once
+        keep = Utilities.badTimesMask(timeStamp, badTimes)
+        finalCount = group.datasetKeepRows(keep, Utilities.characterizationDatasets(group))
 
-            start = dateTime[0]
-            stop = dateTime[1]
-
-            if startLength > 0:
-                rowsToDelete = []
-                for i in range(startLength):
-                    if start <= timeStamp[i] and stop >= timeStamp[i]:
-                        try:
-                            rowsToDelete.append(i)
-                            finalCount += 1
-                        except Exception:
-                            print('error')
-                    else:
-                        newTimeStamp.append(timeStamp[i])
-                group.datasetDeleteRow(rowsToDelete)
-            else:
-                msg = 'Data group is empty. Continuing.'
-                print(msg)
-                Utilities.writeLogFile(msg)
-                break
-            timeStamp = newTimeStamp.copy()
-
-        if ConfigFile.settings['SensorType'].lower() == 'trios':
-            # TRIOS: reset CAL and BACK as before filtering
-            if do_reset:
-                group.addDataset("CAL_"+group.id[0:2])
-                group.datasets["CAL_"+group.id[0:2]].data = raw_cal
-                group.datasets["CAL_"+group.id[0:2]].attributes = raw_cal_att
-                group.addDataset("BACK_"+group.id[0:2])
-                group.datasets["BACK_"+group.id[0:2]].data = raw_back
-                group.datasets["BACK_"+group.id[0:2]].attributes = raw_back_att
-
-            for ds in group.datasets:
-                group.datasets[ds].datasetToColumns()
-        else:
-            for ds in group.datasets:
-                group.datasets[ds].datasetToColumns()
+        for ds in group.datasets:
+            group.datasets[ds].datasetToColumns()
 
-        msg = f'   Length of dataset after removal {originalLength-finalCount} long: {(100*finalCount/originalLength):.1f}% removed'
+        # An empty group has nothing left to process: report it as entirely removed
+        fractionRemoved = finalCount/originalLength if originalLength > 0 else 1.0
+        msg = f'   Length of dataset after removal {originalLength-finalCount} long: {(100*fractionRemoved):.1f}% removed'
         print(msg)
         Utilities.writeLogFile(msg)
-        return finalCount/originalLength
+        return fractionRemoved
+
+    @staticmethod
+    def characterizationDatasets(group):
+        ''' TRIOS: BACK_ and CAL_ are nLambda x 2 and nLambda x 1, not timestamped, so never
+            filtered with the records (nLambda may equal the number of records) '''
+        if ConfigFile.settings['SensorType'].lower() != 'trios':
+            return []
+        return [ds for ds in group.datasets if ds.startswith('BACK_') or ds.startswith('CAL_')]
+
+    @staticmethod
+    def maskRuns(mask):
+        ''' Run-length encode a boolean mask: first and last index of each run of True '''
+        edges = np.diff(np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0])))
+        return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+    @staticmethod
+    def badTimesMask(timeStamp, badTimes):
+        ''' Boolean mask over timeStamp, False for records inside any [start, stop] of badTimes.
+            The intervals are sorted and merged once and each record is placed with a binary
+            search: O((n + k) log k) for n records and k intervals. Records need not be sorted. '''
+        keep = np.ones(len(timeStamp), dtype=bool)
+        intervals = sorted((start, stop) for start, stop in badTimes if start <= stop)
+        if len(timeStamp) == 0 or not intervals:
+            return keep
+
+        # Merge overlapping intervals so the starts and stops are both increasing
+        starts, stops = [intervals[0][0]], [intervals[0][1]]
+        for start, stop in intervals[1:]:
+            if start <= stops[-1]:
+                stops[-1] = max(stops[-1], stop)
+            else:
+                starts.append(start)
+                stops.append(stop)
+
+        # Object arrays so datetimes compare as python objects (timezone aware or not)
+        times = np.empty(len(timeStamp), dtype=object)
+        times[:] = list(timeStamp)
+        startArray = np.empty(len(starts), dtype=object)
+        startArray[:] = starts
+        stopArray = np.empty(len(stops), dtype=object)
+        stopArray[:] = stops
+
+        # Last interval starting at or before each record; bad if the record is not past its stop
+        index = np.searchsorted(startArray, times, side='right') - 1
+        inside = index >= 0
+        keep[inside] = ~np.asarray(times[inside] <= stopArray[index[inside]], dtype=bool)
+        return keep
 
 
     @staticmethod
@@ -2047,6 +2106,100 @@ class Utilities:
 
         return badIndex, badIndex2, badIndex3
 
+    @staticmethod
+    def movingAverageBands(data, window_size):
+        ''' movingAverage along the last axis of a (band x time) array, for all bands at once.
+            Window sums accumulate in time order, as np.convolve does for deglitching-sized windows,
+            so results match movingAverage band for band. '''
+        data = np.asarray(data, dtype=np.float64)
+        mask = np.isnan(data)
+        pad = [(0, 0)]*(data.ndim-1) + [(window_size-1, window_size-1)]
+        values = np.pad(np.where(mask, 0, data), pad)
+        counts = np.pad((~mask).astype(int), pad)
+
+        # Full convolution with a window of ones: one shifted add per window element
+        length = values.shape[-1] - window_size + 1
+        total = values[..., :length].copy()
+        denom = counts[..., :length].copy()
+        for k in range(1, window_size):
+            total += values[..., k:k+length]
+            denom += counts[..., k:k+length]
+        denom = np.where(denom != 0, denom, 1) # replace the 0s with 1s to block div0 error; the numerator will be zero anyway
+
+        out = total/denom
+        # Slice out one half window on either side; this requires an odd-sized window
+        return out[..., int(np.floor(window_size/2)):-int(np.floor(window_size/2))]
+
+    @staticmethod
+    def rollingResidualStd(residual, windowSize):
+        ''' Rolling std of the residual for each band (row), leading values back-filled with the first
+            full window and rounded as in deglitchBand '''
+        residualDf = pd.DataFrame(residual.T)
+        testing_std_as_df = residualDf.rolling(windowSize).std()
+        rolling_std = testing_std_as_df.replace(np.nan, testing_std_as_df.iloc[windowSize - 1]).round(3)
+        return np.ascontiguousarray(rolling_std.to_numpy(dtype=np.float64).T)
+
+    @staticmethod
+    def deglitchBands(bands, radiometry, windowSize, sigma, lightDark, minRad, maxRad, minMaxBand):
+        ''' deglitchBand for every band at once. radiometry is (band x time); bands holds the
+            wavelength of each row. Returns the first pass, second pass and threshold flags as
+            boolean (band x time) arrays, identical to deglitchBand row by row. '''
+        # Rows contiguous in time, so per-band reductions sum in the same order as on 1-D series
+        radiometry = np.ascontiguousarray(radiometry, dtype=np.float64)
+        if radiometry.shape[0] == 0:
+            # No band to deglitch, nothing is flagged
+            return tuple(np.zeros(radiometry.shape, dtype=bool) for _ in range(3))
+
+        if lightDark == 'Dark':
+            # For Darks, calculate the moving average and residual vectors
+            #   and the OVERALL standard deviation of the residual over the entire file
+
+            # First pass
+            avg = Utilities.movingAverageBands(radiometry, windowSize)
+            stdData = np.std(radiometry - avg, axis=1, keepdims=True)
+            badIndex = Utilities.darkConvolution(radiometry, avg, stdData, sigma)
+
+            # Second pass
+            radiometry2 = np.where(badIndex, np.nan, radiometry)
+            avg2 = Utilities.movingAverageBands(radiometry2, windowSize)
+            stdData = np.nanstd(radiometry2 - avg2, axis=1, keepdims=True)
+            badIndex2 = Utilities.darkConvolution(radiometry2, avg2, stdData, sigma)
+
+        else:
+            # For Lights, calculate the moving average and residual vectors
+            #   and the ROLLING standard deviation of the residual
+
+            # First pass
+            avg = Utilities.movingAverageBands(radiometry, windowSize)
+            y = Utilities.rollingResidualStd(radiometry - avg, windowSize)
+            # This rolling std on the residual has a tendancy to blow up for extreme outliers,
+            # replace it with the median residual std when that happens
+            median = np.median(y, axis=1, keepdims=True)
+            y = np.where(y > median + 3*np.std(y, axis=1, keepdims=True), median, y)
+            badIndex = Utilities.lightConvolution(radiometry, avg, y, sigma)
+
+            # Second pass
+            radiometry2 = np.where(badIndex, np.nan, radiometry)
+            avg2 = Utilities.movingAverageBands(radiometry2, windowSize)
+            y = Utilities.rollingResidualStd(radiometry2 - avg2, windowSize)
+            y = np.where(np.isnan(y), np.nanmedian(y, axis=1, keepdims=True), y)
+            median = np.nanmedian(y, axis=1, keepdims=True)
+            y = np.where(y > median + 3*np.nanstd(y, axis=1, keepdims=True), median, y)
+            badIndex2 = Utilities.lightConvolution(radiometry2, avg2, y, sigma)
+
+        # Threshold pass, only on the pre-selected waveband
+        # Tolerates "None" for min or max Rad. ConfigFile.setting updated directly from checkbox
+        badIndex3 = np.zeros(radiometry.shape, dtype=bool)
+        if ConfigFile.settings["bL1aqcThreshold"]:
+            for i, band in enumerate(bands):
+                if band == minMaxBand:
+                    if minRad or minRad==0: # beware falsy zeros...
+                        badIndex3[i] |= radiometry[i] < minRad
+                    if maxRad or maxRad==0:
+                        badIndex3[i] |= radiometry[i] > maxRad
+
+        return badIndex, badIndex2, badIndex3
+
 
     @staticmethod
     def saveDeglitchPlots(fileName,timeSeries,dateTime,sensorType,lightDark,windowSize,sigma,badIndex,badIndex2,badIndex3):#,\
@@ -2866,12 +3019,23 @@ class Utilities:
 
     @staticmethod
     def datasetNan2Zero(inputArray):
-        ''' Workaround nans within a Group.Dataset '''
-        # There must be a better way...
-        for ens, row in enumerate(inputArray):
-            for i, value in enumerate(row):
-                if np.isnan(value):
-                    inputArray[ens][i] = 0.0
+        ''' Workaround nans within a Group.Dataset (numpy array), in place '''
+        names = inputArray.dtype.names
+        if names is None:
+            inputArray[np.isnan(inputArray)] = 0.0
+            return inputArray
+
+        dtypes = {inputArray.dtype.fields[k][0] for k in names}
+        if len(dtypes) == 1 and np.issubdtype(dtypes.pop(), np.floating):
+            # Masked assignment through a (rows x columns) view of the whole array
+            values = recfunctions.structured_to_unstructured(inputArray, copy=False)
+            if np.shares_memory(values, inputArray):
+                values[np.isnan(values)] = 0.0
+                return inputArray
+        for k in names:
+            column = inputArray[k]
+            column[np.isnan(column)] = 0.0
         return inputArray
 
-   
\ No newline at end of file
+
+atexit.register(Utilities.closeLogFile)
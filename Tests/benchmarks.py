@@ -0,0 +1,257 @@
+""" Timing benchmarks for HyperCP performance work. These are not unit tests and are not
+    collected by the test runner.
+
+    Usage (from the repository root):
+        python -m Tests.benchmarks <name> [args]
+    Run without a name to list the available benchmarks.
+"""
+import os
+import sys
+import glob
+import time
+import tempfile
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+
+def timeit(func, *args, repeat=3, **kwargs):
+    ''' Best wall time of repeat calls, and the last return value '''
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def bench_hdf(*files):
+    ''' HDF5 write time, read-back time and file size for each storage option.
+        Defaults to every HDF level file under Data/Sample_Data (run the sample data first). '''
+    from Source.HDFRoot import HDFRoot
+
+    if not files:
+        files = sorted(glob.glob(os.path.join(root, 'Data', 'Sample_Data', '**', '*.hdf'), recursive=True))
+    if not files:
+        print('No HDF files found. Process the sample data (Tests/test_sample_data.py) first.')
+        return
+
+    options = [('none', None, False), ('gzip', 4, False), ('gzip', 4, True),
+               ('gzip', 9, True), ('lzf', None, False), ('lzf', None, True)]
+    totals = {opt: [0.0, 0.0, 0] for opt in options}
+    with tempfile.TemporaryDirectory() as tmp:
+        outPath = os.path.join(tmp, 'bench.hdf')
+        for fp in files:
+            node = HDFRoot.readHDF5(fp)
+            for opt in options:
+                compression, level, shuffle = opt
+                tWrite, _ = timeit(node.writeHDF5, outPath, compression, level, shuffle)
+                tRead, _ = timeit(HDFRoot.readHDF5, outPath)
+                totals[opt][0] += tWrite
+                totals[opt][1] += tRead
+                totals[opt][2] += os.path.getsize(outPath)
+
+    print(f'{len(files)} file(s)')
+    print(f'{"codec":<8}{"level":>6}{"shuffle":>9}{"write s":>10}{"read s":>10}{"size MB":>10}{"ratio":>8}')
+    baseSize = totals[options[0]][2]
+    for opt, (tWrite, tRead, size) in totals.items():
+        compression, level, shuffle = opt
+        print(f'{compression:<8}{str(level or "-"):>6}{str(shuffle):>9}{tWrite:>10.3f}{tRead:>10.3f}'
+              f'{size / 1e6:>10.2f}{baseSize / size:>8.2f}')
+
+
+def syntheticGroup(rows=20000, bands=180):
+    ''' An HDFGroup shaped like an L1AQC radiometer group: one wide spectral dataset plus
+        single-column DATETAG/TIMETAG2 datasets '''
+    import numpy as np
+    from Source.HDFGroup import HDFGroup
+
+    gp = HDFGroup()
+    gp.id = 'ES_LIGHT'
+    rng = np.random.default_rng(0)
+    ds = gp.addDataset('ES')
+    ds.fromArray(rng.random((rows, bands)), [f'{350 + 3.3*i:.1f}' for i in range(bands)])
+    seconds = np.arange(rows) * 0.5
+    timeTag2 = (seconds // 3600) * 1e7 + (seconds % 3600 // 60) * 1e5 + (seconds % 60) * 1e3
+    gp.addDataset('TIMETAG2').data = np.array(timeTag2, dtype=[('NONE', '<f8')])
+    gp.addDataset('DATETAG').data = np.full(rows, 2022200.0, dtype=[('NONE', '<f8')])
+    return gp
+
+
+def bench_delete_rows(rows=20000, fraction=0.05):
+    ''' Removing a fraction of rows one at a time (datasetDeleteRow) vs. one pass (datasetKeepRows) '''
+    import numpy as np
+
+    rows, fraction = int(rows), float(fraction)
+    rng = np.random.default_rng(1)
+    bad = np.sort(rng.choice(rows, int(rows * fraction), replace=False))
+
+    def perRow():
+        gp = syntheticGroup(rows)
+        for i in bad[::-1]:
+            gp.datasetDeleteRow(i)
+        return gp
+
+    def onePass():
+        gp = syntheticGroup(rows)
+        gp.datasetDeleteRows(bad, rows)
+        return gp
+
+    tSetup, _ = timeit(syntheticGroup, rows)
+    tLoop, gpLoop = timeit(perRow, repeat=1)
+    tMask, gpMask = timeit(onePass)
+    assert np.array_equal(gpLoop.getDataset('ES').data, gpMask.getDataset('ES').data)
+    print(f'{rows} rows, {len(bad)} removed')
+    print(f'per-row datasetDeleteRow: {tLoop - tSetup:8.3f} s')
+    print(f'datasetDeleteRows       : {tMask - tSetup:8.3f} s')
+
+
+def bench_fix_datetime(rows=20000, glitches=200):
+    ''' Timestamp repair with injected clock reversals and duplicates: delete-and-rescan loop vs.
+        the single-pass mask in Utilities.fixDateTime '''
+    import datetime
+    import numpy as np
+    from Source.Utilities import Utilities
+    from Tests.test_utilities import fixDateTimeLoop
+
+    rows, glitches = int(rows), int(glitches)
+    rng = np.random.default_rng(2)
+    seconds = np.arange(rows) * 0.5
+    # Clock resets: a short run of records jumps back in time, plus repeated timestamps
+    for start in rng.choice(rows - 20, glitches, replace=False):
+        seconds[start:start + rng.integers(1, 20)] -= rng.uniform(0.1, 30)
+    dup = rng.choice(rows - 1, glitches, replace=False)
+    seconds[dup + 1] = seconds[dup]
+    t0 = datetime.datetime(2022, 7, 19, tzinfo=datetime.timezone.utc)
+    dateTime = [t0 + datetime.timedelta(seconds=float(sec)) for sec in seconds]
+
+    def group():
+        gp = syntheticGroup(rows)
+        gp.addDataset('DATETIME').data = list(dateTime)
+        return gp
+
+    def run(func):
+        gp = group()
+        func(gp)
+        return gp
+
+    # Silence the per-row deletion messages so the timing is of the repair itself
+    import builtins
+    builtinPrint, writeLogFile = builtins.print, Utilities.writeLogFile
+    builtins.print = lambda *args, **kwargs: None
+    Utilities.writeLogFile = staticmethod(lambda *args, **kwargs: None)
+    try:
+        tSetup, _ = timeit(group)
+        tLoop, gpLoop = timeit(run, fixDateTimeLoop, repeat=1)
+        tMask, gpMask = timeit(run, Utilities.fixDateTime)
+    finally:
+        builtins.print, Utilities.writeLogFile = builtinPrint, writeLogFile
+    assert list(gpLoop.getDataset('DATETIME').data) == list(gpMask.getDataset('DATETIME').data)
+    assert np.array_equal(gpLoop.getDataset('ES').data, gpMask.getDataset('ES').data)
+    removed = rows - len(gpMask.getDataset('DATETIME').data)
+    print(f'{rows} rows, {glitches} reversals + {glitches} duplicates, {removed} removed')
+    print(f'delete-and-rescan loop  : {tLoop - tSetup:8.3f} s')
+    print(f'Utilities.fixDateTime   : {tMask - tSetup:8.3f} s')
+
+
+def bench_convolution(rows=5000, bands=180, window=11, sigma=3.0):
+    ''' Deglitching anomaly tests: per-record loops vs. Utilities.dark/lightConvolution, band by band
+        (as AnomalyDetection) and for all bands at once (as L1AQC) '''
+    import numpy as np
+    import pandas as pd
+    from Source.Utilities import Utilities
+    from Tests.test_utilities import darkConvolutionLoop, lightConvolutionLoop
+
+    rows, bands, window, sigma = int(rows), int(bands), int(window), float(sigma)
+    rng = np.random.default_rng(3)
+    data = rng.lognormal(3, 0.2, (bands, rows))
+    data[rng.random(data.shape) < 0.01] *= 5
+    data[rng.random(data.shape) < 0.001] = np.nan
+    avg = Utilities.movingAverageBands(data, window)
+    std = np.nanstd(data - avg, axis=1, keepdims=True)
+    rollingStd = pd.DataFrame((data - avg).T).rolling(window).std().bfill().to_numpy().T
+    dataLists, avgLists = data.tolist(), avg.tolist()
+
+    for name, loop, vectorised, spread in [('dark', darkConvolutionLoop, Utilities.darkConvolution, std),
+                                           ('light', lightConvolutionLoop, Utilities.lightConvolution, rollingStd)]:
+        spreadLists = spread[:, 0].tolist() if spread.shape[1] == 1 else spread.tolist()
+        tLoop, ref = timeit(lambda: [loop(dataLists[b], avgLists[b], spreadLists[b], sigma) for b in range(bands)], repeat=1)
+        tBand, perBand = timeit(lambda: [vectorised(data[b], avg[b], spread[b] if spread.shape[1] > 1 else spread[b, 0], sigma)
+                                         for b in range(bands)])
+        tAll, allBands = timeit(vectorised, data, avg, spread, sigma)
+        assert np.array_equal(np.array(ref), np.array(perBand)) and np.array_equal(np.array(ref), allBands)
+        print(f'{name}: {bands} bands x {rows} records, {int(allBands.sum())} flagged')
+        print(f'  per-record loop     : {tLoop:8.3f} s')
+        print(f'  vectorised per band : {tBand:8.3f} s')
+        print(f'  vectorised all bands: {tAll:8.3f} s')
+
+
+def bench_time_join(fixes=50000, records=20000, sample=500):
+    ''' Aligning radiometry records to a 1 Hz ship track of GPS fixes: Utilities.find_nearest
+        per record (timed on a sample of records and scaled) vs. Utilities.nearestTimeIndex '''
+    import datetime
+    import numpy as np
+    from Source.Utilities import Utilities
+
+    fixes, records, sample = int(fixes), int(records), int(sample)
+    rng = np.random.default_rng(4)
+    t0 = datetime.datetime(2022, 7, 19, tzinfo=datetime.timezone.utc)
+    track = [t0 + datetime.timedelta(seconds=float(s)) for s in np.cumsum(rng.uniform(0.9, 1.1, fixes))]
+    span = (track[-1] - track[0]).total_seconds()
+    radiometry = [t0 + datetime.timedelta(seconds=float(s)) for s in np.sort(rng.uniform(0, span, records))]
+
+    tLoop, ref = timeit(lambda: [Utilities.find_nearest(track, dt) for dt in radiometry[:sample]], repeat=1)
+    tConvert, (track64, radiometry64) = timeit(lambda: (Utilities.datetimeToDatetime64(track),
+                                                        Utilities.datetimeToDatetime64(radiometry)))
+    tJoin, index = timeit(Utilities.nearestTimeIndex, track64, radiometry64, 5.0)
+    assert index[:sample].tolist() == ref
+    print(f'{fixes} GPS fixes, {records} radiometry records, {int((index < 0).sum())} beyond 5 s')
+    print(f'find_nearest per record  : {tLoop * records / sample:8.3f} s (scaled from {sample})')
+    print(f'to datetime64            : {tConvert:8.3f} s')
+    print(f'nearestTimeIndex         : {tJoin:8.3f} s')
+
+
+def bench_interp_fill(records=2000, stations=40, newRecords=200000):
+    ''' Carrying a station number onto radiometer timestamps (as L1B STATION): per-value loop over
+        every new timestamp vs. the binary search in Utilities.interpFill '''
+    import numpy as np
+    from Source.Utilities import Utilities
+    from Tests.test_utilities import interpFillLoop
+
+    records, stations, newRecords = int(records), int(stations), int(newRecords)
+    rng = np.random.default_rng(5)
+    x = np.sort(rng.uniform(0, 86400, records))
+    # Stations in consecutive blocks, with gaps (NaN) between them
+    y = np.repeat(np.arange(1, stations + 1, dtype=float), records // stations + 1)[:records]
+    y[rng.random(records) < 0.2] = np.nan
+    newX = np.sort(rng.uniform(-600, 87000, newRecords)).tolist()
+    xList, yList = x.tolist(), y.tolist()
+
+    tLoop, ref = timeit(interpFillLoop, xList, yList, newX, repeat=1)
+    tSearch, result = timeit(Utilities.interpFill, xList, yList, newX)
+    assert np.array_equal(np.array(ref, dtype=float), np.array(result), equal_nan=True)
+    print(f'{records} records, {stations} stations onto {newRecords} timestamps, '
+          f'{int(np.isnan(result).sum())} left unfilled')
+    print(f'per-value loop          : {tLoop:8.3f} s')
+    print(f'Utilities.interpFill    : {tSearch:8.3f} s')
+
+
+BENCHMARKS = {
+    'hdf': bench_hdf,
+    'delete_rows': bench_delete_rows,
+    'fix_datetime': bench_fix_datetime,
+    'convolution': bench_convolution,
+    'time_join': bench_time_join,
+    'interp_fill': bench_interp_fill,
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print('Benchmarks:', ', '.join(BENCHMARKS))
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
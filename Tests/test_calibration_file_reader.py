@@ -0,0 +1,105 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+
+from Source import PATH_TO_CONFIG
+from Source.CalibrationFileReader import CalibrationFileReader
+
+
+class TestCalibrationCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.calDir = os.path.join(self.tmp, 'cal')
+        os.makedirs(self.calDir)
+        src = os.path.join(PATH_TO_CONFIG, 'sample_SEABIRD_SOLARTRACKER_Calibration')
+        for name in ['HSE488B.cal', 'HLD385B.cal', 'SATMSG.tdf']:
+            shutil.copy(os.path.join(src, name), self.calDir)
+        for target, value in [('CACHE_DIR', os.path.join(self.tmp, 'cache')),
+                              ('_memo', {}),
+                              ('cacheStats', {'hits': 0, 'misses': 0})]:
+            patcher = mock.patch.object(CalibrationFileReader, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def pickles(self):
+        return glob.glob(os.path.join(CalibrationFileReader.CACHE_DIR, '*.pkl'))
+
+    def test_hit_miss_and_corrupt_pickle(self):
+        first = CalibrationFileReader.read(self.calDir)
+        self.assertEqual(CalibrationFileReader.cacheStats, {'hits': 0, 'misses': 1})
+        self.assertEqual(len(self.pickles()), 1)
+
+        # Read back from disk, not only from the in-process copy
+        CalibrationFileReader._memo.clear()
+        second = CalibrationFileReader.read(self.calDir)
+        self.assertEqual(CalibrationFileReader.cacheStats, {'hits': 1, 'misses': 1})
+        self.assertEqual(list(second.keys()), list(first.keys()))
+        self.assertEqual(second['HSE488B.cal'].instrumentType, first['HSE488B.cal'].instrumentType)
+        self.assertIsNot(second['HSE488B.cal'], first['HSE488B.cal'])
+
+        # Any change to a file's contents is a miss
+        with open(os.path.join(self.calDir, 'SATMSG.tdf'), 'ab') as f:
+            f.write(b'\n')
+        CalibrationFileReader.read(self.calDir)
+        self.assertEqual(CalibrationFileReader.cacheStats, {'hits': 1, 'misses': 2})
+        self.assertEqual(len(self.pickles()), 2)
+
+        # A truncated pickle is reparsed and rewritten
+        CalibrationFileReader._memo.clear()
+        for fp in self.pickles():
+            with open(fp, 'wb') as f:
+                f.write(b'\x80\x05truncated')
+        third = CalibrationFileReader.read(self.calDir)
+        self.assertEqual(CalibrationFileReader.cacheStats, {'hits': 1, 'misses': 3})
+        self.assertEqual(list(third.keys()), list(first.keys()))
+        CalibrationFileReader._memo.clear()
+        CalibrationFileReader.read(self.calDir)
+        self.assertEqual(CalibrationFileReader.cacheStats, {'hits': 2, 'misses': 3})
+
+    def test_class_change_is_a_miss(self):
+        CalibrationFileReader.read(self.calDir)
+        with mock.patch.object(CalibrationFileReader, '_classDigest', 'changed'):
+            CalibrationFileReader.read(self.calDir)
+        self.assertEqual(CalibrationFileReader.cacheStats, {'hits': 0, 'misses': 2})
+
+    def test_sip_hit_does_not_decompress(self):
+        sipDir = os.path.join(self.tmp, 'sip')
+        os.makedirs(sipDir)
+        sip = os.path.join(sipDir, 'SAS.sip')
+        with zipfile.ZipFile(sip, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name in sorted(os.listdir(self.calDir)):
+                zf.write(os.path.join(self.calDir, name), name)
+
+        first = CalibrationFileReader.readSip(sip)
+        self.assertEqual(sorted(first.keys()), sorted(os.listdir(self.calDir)))
+        for name in first:
+            self.assertTrue(os.path.isfile(os.path.join(sipDir, name)))
+
+        # The extracted copies match, so neither the parse nor the extraction reads a member
+        with mock.patch.object(zipfile.ZipFile, 'read', side_effect=AssertionError), \
+                mock.patch.object(zipfile.ZipFile, 'extract', side_effect=AssertionError):
+            second = CalibrationFileReader.readSip(sip)
+        self.assertEqual(list(second.keys()), list(first.keys()))
+        self.assertEqual(CalibrationFileReader.cacheStats, {'hits': 1, 'misses': 1})
+
+        # A stale extracted copy is replaced
+        with open(os.path.join(sipDir, 'SATMSG.tdf'), 'ab') as f:
+            f.write(b'x')
+        CalibrationFileReader.readSip(sip)
+        with open(os.path.join(sipDir, 'SATMSG.tdf'), 'rb') as f, \
+                open(os.path.join(self.calDir, 'SATMSG.tdf'), 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import unittest
+
+import numpy as np
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+
+
+class TestToArray(unittest.TestCase):
+    def test_view_and_columns_round_trip(self):
+        from Source.HDFDataset import HDFDataset
+        rng = np.random.default_rng(0)
+        names = [f'{350 + 3.3*i:.1f}' for i in range(40)]
+        values = rng.random((25, 40))
+        ds = HDFDataset()
+        ds.fromArray(values, names)
+        self.assertEqual(ds.getColumnNames(), names)
+        self.assertTrue(ds.isHomogeneous())
+
+        # The 2-D array is a view, so in-place changes reach the dataset
+        array = ds.toArray()
+        np.testing.assert_array_equal(array, values)
+        array[3, 7] = -1.0
+        self.assertEqual(ds.data[names[7]][3], -1.0)
+        self.assertTrue(np.shares_memory(ds.toArray(names[5:9]), ds.data))
+
+        # Columns built from the view, and back into one contiguous block
+        ds.datasetToColumns()
+        self.assertEqual(list(ds.columns.keys()), names)
+        self.assertEqual(ds.columns[names[7]], array[:, 7].tolist())
+        ds.data = None
+        self.assertTrue(ds.columnsToDataset())
+        np.testing.assert_array_equal(ds.toArray(), array)
+        self.assertTrue(np.shares_memory(ds.toArray(), ds.data))
+
+    def test_mixed_columns_are_copied(self):
+        from Source.HDFDataset import HDFDataset
+        ds = HDFDataset()
+        ds.data = np.array([(1, 2.5), (3, 4.5)], dtype=[('SZA', '<i4'), ('WINDSPEED', '<f8')])
+        self.assertFalse(ds.isHomogeneous())
+        array = ds.toArray()
+        self.assertEqual(array.dtype, np.float64)
+        self.assertEqual(array.tolist(), [[1, 2.5], [3, 4.5]])
+        self.assertFalse(np.shares_memory(array, ds.data))
+        self.assertFalse(ds.fromArray(np.zeros((2, 3)), ['a', 'b']))
+
+    def test_object_columns_raise(self):
+        import datetime
+        from Source.HDFDataset import HDFDataset
+        ds = HDFDataset()
+        ds.id = 'ANCILLARY'
+        ds.data = np.array([(1, 2.5, datetime.datetime(2020, 1, 1)), (3, 4.5, datetime.datetime(2020, 1, 2))],
+                           dtype=[('SZA', '<i4'), ('WINDSPEED', '<f8'), ('Datetime', 'O')])
+        self.assertEqual(ds.toArray(['SZA', 'WINDSPEED']).tolist(), [[1, 2.5], [3, 4.5]])
+        with self.assertRaisesRegex(TypeError, 'Datetime'):
+            ds.toArray()
+
+
+if __name__ == '__main__':
+    unittest.main()
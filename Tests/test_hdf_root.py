@@ -0,0 +1,190 @@
+import os
+import unittest
+
+import numpy as np
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+
+
+class TestGroupIndex(unittest.TestCase):
+    def test_lookup_follows_renames_of_own_groups_only(self):
+        from Source.HDFRoot import HDFRoot
+        from Source.HDFGroup import HDFGroup
+        node = HDFRoot()
+        for name in ['ES', 'ANCILLARY_METADATA', 'LI', 'ANCILLARY', 'LT']:
+            node.addGroup(name)
+        self.assertEqual([gp.id for gp in node.getGroupsByPrefix('ANCILLARY')], ['ANCILLARY_METADATA', 'ANCILLARY'])
+
+        # Groups built or renamed elsewhere leave this index alone
+        other = HDFRoot()
+        other.addGroup('ES').id = 'LI'
+        HDFGroup().id = 'ES'
+        self.assertIsNotNone(node.groups._byId)
+
+        # Renaming a member, or appending directly to the list, is seen by the next lookup
+        node.getGroup('ANCILLARY').id = 'SOLARTRACKER'
+        self.assertIsNone(node.getGroup('ANCILLARY'))
+        self.assertEqual(node.getGroup('SOLARTRACKER').id, 'SOLARTRACKER')
+        gp = HDFGroup()
+        node.groups.append(gp)
+        gp.id = 'PY6S_MODEL'
+        self.assertIs(node.getGroup('PY6S_MODEL'), gp)
+
+        # A group moved to another root keeps both lists up to date
+        other.groups.append(gp)
+        gp.id = 'PY6S'
+        self.assertIs(other.getGroup('PY6S'), gp)
+        self.assertIs(node.getGroupsByPrefix('PY6S')[0], gp)
+
+    def test_pickle_and_deepcopy(self):
+        import copy
+        import pickle
+        from Source.HDFRoot import HDFRoot
+        node = HDFRoot()
+        for name in ['ES', 'LI', 'ANCILLARY']:
+            node.addGroup(name).addDataset(name).data = np.arange(3.0).view([('NONE', '<f8')])
+        for other in [pickle.loads(pickle.dumps(node)), copy.deepcopy(node)]:
+            self.assertEqual([gp.id for gp in other.groups], ['ES', 'LI', 'ANCILLARY'])
+            self.assertEqual(other.getGroup('LI').getDataset('LI').data['NONE'].tolist(), [0, 1, 2])
+            # Renames are seen by the copy's own index, and leave the original's alone
+            node.getGroup('ES')
+            other.getGroup('ANCILLARY').id = 'ANCILLARY_METADATA'
+            self.assertIsNotNone(other.getGroup('ANCILLARY_METADATA'))
+            self.assertIsNotNone(node.groups._byId)
+            self.assertIsNotNone(node.getGroup('ANCILLARY'))
+
+
+class TestGroupRows(unittest.TestCase):
+    def test_delete_rows_skips_other_lengths(self):
+        from Source.HDFGroup import HDFGroup
+        gp = HDFGroup()
+        gp.id = 'ES'
+        gp.addDataset('ES').data = np.arange(6.0).view([('400.0', '<f8')])
+        gp.addDataset('DATETIME').data = list(range(6))
+        # Characterisation tables outnumber the time series
+        for name in ['CAL_ES', 'BACK_ES', 'RAW_ES']:
+            gp.addDataset(name).data = np.zeros(3, dtype=[('1', '<f8')])
+
+        self.assertEqual(gp.datasetDeleteRows([1, 4], 6), 2)
+        self.assertEqual(gp.getDataset('ES').data['400.0'].tolist(), [0, 2, 3, 5])
+        self.assertEqual(gp.getDataset('DATETIME').data, [0, 2, 3, 5])
+        self.assertEqual(len(gp.getDataset('CAL_ES').data), 3)
+
+
+class TestStorage(unittest.TestCase):
+    def test_compressed_round_trip(self):
+        import tempfile
+        import h5py
+        from Source.HDFRoot import HDFRoot
+        rng = np.random.default_rng(0)
+        names = [f'{350 + 3.3*i:.1f}' for i in range(120)]
+        values = rng.normal(1, 0.1, (400, 120))
+        node = HDFRoot()
+        gp = node.addGroup('ES')
+        gp.addDataset('ES').fromArray(values, names)
+        # Too small to be worth compressing
+        gp.addDataset('TIMETAG2').data = np.arange(5.0).view([('NONE', '<f8')])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for compression, shuffle in [('none', False), ('gzip', False), ('gzip', True), ('lzf', False), ('lzf', True)]:
+                fp = os.path.join(tmp, f'{compression}{int(shuffle)}.hdf')
+                node.writeHDF5(fp, compression=compression, compressionLevel=4, shuffle=shuffle)
+                with h5py.File(fp, 'r') as f:
+                    dset = f['ES/ES']
+                    self.assertEqual(dset.compression, None if compression == 'none' else compression)
+                    self.assertEqual(dset.shuffle, shuffle and compression != 'none')
+                    if compression == 'gzip':
+                        self.assertEqual(dset.compression_opts, 4)
+                    self.assertIsNone(f['ES/TIMETAG2'].compression)
+                again = HDFRoot.readHDF5(fp).getGroup('ES')
+                np.testing.assert_array_equal(again.getDataset('ES').toArray(), values)
+                self.assertEqual(again.getDataset('ES').getColumnNames(), names)
+                self.assertEqual(again.getDataset('TIMETAG2').data['NONE'].tolist(), [0, 1, 2, 3, 4])
+
+            # A bad setting is refused before an existing file is overwritten
+            fp = os.path.join(tmp, 'lzf0.hdf')
+            with self.assertRaisesRegex(ValueError, 'zstd'):
+                node.writeHDF5(fp, compression='zstd')
+            self.assertEqual(HDFRoot.readHDF5(fp).getGroup('ES').getDataset('ES').data.shape, (400,))
+
+
+class TestLazyRead(unittest.TestCase):
+    def write(self, fp, scale=1.0):
+        from Source.HDFRoot import HDFRoot
+        node = HDFRoot()
+        node.attributes['PROCESSING_LEVEL'] = '1b'
+        gp = node.addGroup('ES')
+        for n, name in enumerate(['ES', 'DATETAG', 'TIMETAG2']):
+            gp.addDataset(name).data = np.array(scale*np.arange(n, n + 5.0), dtype=[('NONE', '<f8')])
+        node.writeHDF5(fp)
+
+    def test_one_handle_and_write_back_to_same_path(self):
+        import tempfile
+        from unittest import mock
+        import h5py
+        from Source.HDFRoot import HDFRoot
+        with tempfile.TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, 'level.hdf')
+            self.write(fp)
+            node = HDFRoot.readHDF5(fp, lazy=True)
+            gp = node.getGroup('ES')
+
+            with mock.patch('Source.HDFDataset.h5py.File', wraps=h5py.File) as opened:
+                gp.getDataset('ES').data['NONE'] *= 2
+                gp.getDataset('DATETAG').data
+            self.assertEqual(opened.call_count, 1)
+
+            # TIMETAG2 is still on disk when the root is written back over its own file
+            gp.getDataset('DATETAG').data = np.array([7.0], dtype=[('NONE', '<f8')])
+            node.writeHDF5(fp)
+            again = HDFRoot.readHDF5(fp).getGroup('ES')
+            self.assertEqual(again.getDataset('ES').data['NONE'].tolist(), [0, 2, 4, 6, 8])
+            self.assertEqual(again.getDataset('DATETAG').data['NONE'].tolist(), [7])
+            self.assertEqual(again.getDataset('TIMETAG2').data['NONE'].tolist(), [2, 3, 4, 5, 6])
+
+    def test_copies_of_unloaded_root(self):
+        import copy
+        import pickle
+        import tempfile
+        from unittest import mock
+        import h5py
+        from Source.HDFRoot import HDFRoot
+        with tempfile.TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, 'level.hdf')
+            self.write(fp)
+            node = HDFRoot.readHDF5(fp, lazy=True)
+            copied = copy.deepcopy(node)
+            shallow = copy.copy(node.getGroup('ES').getDataset('TIMETAG2'))
+
+            # Loading the original leaves the handle open for the copies
+            with mock.patch('Source.HDFDataset.h5py.File', wraps=h5py.File) as opened:
+                for root in [node, copied]:
+                    gp = root.getGroup('ES')
+                    for n, name in enumerate(['ES', 'DATETAG', 'TIMETAG2']):
+                        self.assertEqual(gp.getDataset(name).data['NONE'].tolist(), list(range(n, n + 5)))
+                self.assertIsNotNone(node._loader._file)
+                self.assertEqual(shallow.data['NONE'].tolist(), [2, 3, 4, 5, 6])
+            self.assertEqual(opened.call_count, 1)
+            self.assertIsNone(node._loader._file)
+
+            # Pickling reads the data it carries
+            lazy = HDFRoot.readHDF5(fp, lazy=True).getGroup('ES').getDataset('ES')
+            self.assertEqual(pickle.loads(pickle.dumps(lazy)).data['NONE'].tolist(), [0, 1, 2, 3, 4])
+
+    def test_changed_file_raises(self):
+        import tempfile
+        import time
+        from Source.HDFRoot import HDFRoot
+        with tempfile.TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, 'level.hdf')
+            self.write(fp)
+            node = HDFRoot.readHDF5(fp, lazy=True)
+            time.sleep(0.05)
+            self.write(fp, scale=3.0)
+            with self.assertRaises(IOError):
+                node.getGroup('ES').getDataset('ES').data
+
+
+if __name__ == '__main__':
+    unittest.main()
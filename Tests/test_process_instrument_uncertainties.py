@@ -0,0 +1,46 @@
+import os
+import unittest
+
+import numpy as np
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+
+
+def cosineCharacterisation(seed=0):
+    ''' Random 255 pixel x 45 zenith cosine errors for both azimuths, on the -88 to 88 degree TU grid '''
+    rng = np.random.default_rng(seed)
+    zenith_ang = np.linspace(-88, 88, 45)
+    coserror = rng.normal(0, 3, (255, 45))
+    coserror_90 = coserror + rng.normal(0, 0.5, (255, 45))
+    # Fortran order, as np.asarray gives for the characterisation DataFrames
+    return np.asfortranarray(coserror), np.asfortranarray(coserror_90), zenith_ang
+
+
+class TestCosineError(unittest.TestCase):
+    def test_asymmetry_matches_loop(self):
+        from Source.ProcessInstrumentUncertainties import BaseInstrument
+        coserror, coserror_90, _ = cosineCharacterisation()
+        expected = np.zeros(coserror.shape, float)
+        for i in range(255):
+            for j in range(45):
+                expected[i, j] = np.std([coserror[i, j], coserror_90[i, j], coserror[i, -j], coserror_90[i, -j]])
+        np.testing.assert_array_equal(BaseInstrument.Asym_Coserr(coserror, coserror_90), expected)
+
+    def test_full_hemispherical_matches_loop(self):
+        from Source.ProcessInstrumentUncertainties import BaseInstrument
+        coserror, coserror_90, zenith_ang = cosineCharacterisation()
+        zen_avg_coserr = BaseInstrument.ZENAvg_Coserr(np.linspace(305, 1140, 255),
+                                                      BaseInstrument.AZAvg_Coserr(coserror, coserror_90))
+        zen0 = np.argmin(np.abs(zenith_ang))
+        zen90 = np.argmin(np.abs(zenith_ang - 90))
+        deltaZen = (zenith_ang[1::] - zenith_ang[:-1])
+        expected = np.zeros(255)
+        for i in range(255):
+            expected[i] = np.sum(zen_avg_coserr[i, zen0:zen90]*np.sin(2*np.pi*zenith_ang[zen0:zen90]/180)*deltaZen[
+                zen0:zen90]*np.pi/180)
+        np.testing.assert_array_equal(BaseInstrument.FHemi_Coserr(zen_avg_coserr, zenith_ang), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import glob
+import collections
+import unittest
+
+import numpy as np
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def gpggaDateTagsLoop(gpsTime, esDateTag):
+    ''' The per-row GPGGA date reconstruction ProcessL1a.gpggaDateTags replaced; kept as a reference '''
+    from Source.Utilities import Utilities
+    gpsDateTag = []
+    gpsTimeTag2 = []
+    if esDateTag[0] != esDateTag[-1]:
+        newDay = False
+        for time in gpsTime:
+            gpsSec = Utilities.utcToSec(time)
+            if 'gpsSecPrior' not in locals():
+                gpsSecPrior = gpsSec
+            if (gpsSecPrior - gpsSec) > 86000:
+                newDay = True
+            dateTag = esDateTag[-1] if newDay else esDateTag[0]
+            gpsDateTag.append(dateTag)
+            dtDate = Utilities.dateTagToDateTime(dateTag)
+            gpsTimeTag2.append(Utilities.datetime2TimeTag2(Utilities.utcToDateTime(dtDate,time)))
+            gpsSecPrior = gpsSec
+    else:
+        for time in gpsTime:
+            gpsDateTag.append(esDateTag[0])
+            dtDate = Utilities.dateTagToDateTime(esDateTag[0])
+            gpsTimeTag2.append(Utilities.datetime2TimeTag2(Utilities.utcToDateTime(dtDate,time)))
+    return gpsDateTag, gpsTimeTag2
+
+
+class TestGPGGADates(unittest.TestCase):
+    def test_sample_data(self):
+        ''' GPS UTC and Es Datetags of the SolarTracker sample files '''
+        from Source.CalibrationFileReader import CalibrationFileReader
+        from Source.RawFileReader import RawFileReader
+        from Source.HDFRoot import HDFRoot
+        from Source.HDFGroup import HDFGroup
+        from Source.ProcessL1a import ProcessL1a
+        calibrationMap = CalibrationFileReader.read(
+            os.path.join(root, 'Config', 'sample_SEABIRD_SOLARTRACKER_Calibration'))
+        files = sorted(glob.glob(os.path.join(root, 'Data', 'Sample_Data', 'SolarTracker', 'RAW', '*.RAW')))
+        self.assertTrue(files)
+        for fp in files:
+            contextMap = collections.OrderedDict()
+            for key in calibrationMap:
+                gp = HDFGroup()
+                gp.id = calibrationMap[key].instrumentType
+                contextMap[calibrationMap[key].id] = gp
+            RawFileReader.readRawFile(fp, calibrationMap, contextMap, HDFRoot())
+            groups = [gp for gp in contextMap.values() if gp.datasets]
+            gpsTime = [gp for gp in groups if 'UTCPOS' in gp.datasets][0].datasets['UTCPOS'].columns['NONE']
+            esDateTag = [gp for gp in groups if gp.attributes['CalFileName'].startswith('HSE')][0] \
+                .datasets['DATETAG'].columns['NONE']
+            self.assertEqual(ProcessL1a.gpggaDateTags(gpsTime, esDateTag), gpggaDateTagsLoop(gpsTime, esDateTag))
+
+    def test_midnight_crossing(self):
+        from Source.ProcessL1a import ProcessL1a
+        rng = np.random.default_rng(0)
+        sec = (np.cumsum(rng.uniform(0.5, 1.5, 4000)) + 84000) % 86400
+        # HHMMSS.ds with zero, one and two decimal digits
+        gpsTime = ((sec // 3600)*10000 + (sec % 3600 // 60)*100 + (sec % 60 // 1)
+                   + rng.choice([0, 5, 55, 7, 30], 4000)/100).tolist()
+        for esDateTag in ([2022200.0, 2022200.0], [2022200.0, 2022201.0]):
+            self.assertEqual(ProcessL1a.gpggaDateTags(gpsTime, esDateTag), gpggaDateTagsLoop(gpsTime, esDateTag))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import datetime
+import unittest
+
+import numpy as np
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+
+
+def rotatorDelayLoop(timeStamp, rotator, delay):
+    ''' The per-record rotator delay filter ProcessL1aqc.rotatorKickouts replaced; kept as a reference '''
+    badTimes = []
+    kickout = 0
+    i = 0
+    for index, rotatori in enumerate(rotator):
+        if index == 0:
+            lastAngle = rotatori
+        else:
+            if rotatori > (lastAngle + 0.05) or rotatori < (lastAngle - 0.05):
+                i += 1
+                start = timeStamp[index]
+                startIndex = index
+                lastAngle = rotatori
+                kickout = 1
+            else:
+                time = timeStamp[index]
+                if kickout==1 and time > (start + datetime.timedelta(0,delay)):
+                    badTimes.append([timeStamp[startIndex],timeStamp[index-1]])
+                    kickout = 0
+                elif kickout ==1:
+                    i += 1
+    return i, badTimes
+
+
+class TestAncillaryFilters(unittest.TestCase):
+    def test_rotator_kickouts_match_loop(self):
+        from Source.ProcessL1aqc import ProcessL1aqc
+        rng = np.random.default_rng(0)
+        n = 3000
+        t0 = datetime.datetime(2022, 7, 19, tzinfo=datetime.timezone.utc)
+        timeStamp = [t0 + datetime.timedelta(seconds=float(s)) for s in np.cumsum(rng.uniform(0.1, 1.5, n))]
+        # Piecewise constant angle with jitter below 0.05 deg, moves close together and a NaN
+        rotator = np.repeat(rng.uniform(-40, 60, 150), rng.integers(1, 40, 150))[:n]
+        rotator = np.pad(rotator, (0, n - len(rotator)), mode='edge') + rng.uniform(-0.02, 0.02, n)
+        rotator[1000] = np.nan
+
+        for delay in [0.5, 2.0, 10.0]:
+            counted, bad = ProcessL1aqc.rotatorKickouts(timeStamp, rotator, delay)
+            i, expected = rotatorDelayLoop(timeStamp, rotator.tolist(), delay)
+            self.assertEqual(np.count_nonzero(counted), i)
+            self.assertEqual(ProcessL1aqc.flagBadTimes(timeStamp, bad), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import unittest
+
+import numpy as np
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+
+
+def processDatasetLoop(ds, cd, inttime=None, immersed=False):
+    ''' The per-record, per-band calibration equations ProcessL1b_FactoryCal replaced; kept as a reference '''
+    k = cd.id
+    im = float(cd.coefficients[2]) if immersed and len(cd.coefficients) > 2 else 1.0
+    for x in range(ds.data.shape[0]):
+        if cd.fitType == "OPTIC2":
+            ds.data[k][x] = im * float(cd.coefficients[1]) * (ds.data[k][x] - float(cd.coefficients[0]))
+        elif cd.fitType == "OPTIC3":
+            aint = inttime.data[cd.type][x]
+            ds.data[k][x] = im * float(cd.coefficients[1]) * (ds.data[k][x]) * (float(cd.coefficients[3])/aint)
+        elif cd.fitType == "OPTIC4":
+            ds.data[k][x] = im * float(cd.coefficients[1]) * (ds.data[k][x] - float(cd.coefficients[0])) \
+                * (float(cd.coefficients[3])/1)
+        elif cd.fitType == "POW10":
+            ds.data[k][x] = im * pow(10, ((ds.data[k][x]-float(cd.coefficients[0]))/float(cd.coefficients[1])))
+        elif cd.fitType == "POLYU":
+            num = 0
+            for i, coeff in enumerate(cd.coefficients):
+                num += float(coeff) * pow(ds.data[k][x],i)
+            ds.data[k][x] = num
+        elif cd.fitType == "POLYF":
+            num = float(cd.coefficients[0])
+            for a in cd.coefficients[1:]:
+                num *= (ds.data[k][x] - float(a))
+            ds.data[k][x] = num
+
+
+class TestFactoryCal(unittest.TestCase):
+    def calibrationFile(self, rng):
+        from Source.CalibrationData import CalibrationData
+        from Source.CalibrationFile import CalibrationFile
+        cf = CalibrationFile()
+        cf.data = []
+
+        def add(dsType, name, fitType, coefficients):
+            cd = CalibrationData()
+            cd.type, cd.id, cd.fitType = dsType, name, fitType
+            cd.coefficients = [repr(float(c)) for c in coefficients]
+            cf.data.append(cd)
+
+        add('INTTIME', 'ES', 'POLYU', [0, 0.001])
+        for i in range(60):
+            fitType = ['OPTIC3', 'OPTIC3', 'OPTIC2', 'OPTIC4', 'POW10', 'COUNT'][i % 6]
+            add('ES', f'{350 + 3.3*i:.2f}', fitType,
+                [rng.uniform(2000, 3000), rng.uniform(1e-6, 1e-5), 1.35, 0.128] if fitType != 'POW10'
+                else [rng.uniform(0, 10), rng.uniform(1e4, 2e4), 1.0])
+        add('T', 'SAS', 'POLYU', [-50.0, 0.5, 1.3e-4, -2.2e-8])
+        add('T', 'IR', 'POLYU', [0, 0.03])
+        add('T', 'OBJ', 'POLYF', [8.72219107e-8, 2434092614, 1.5])
+        add('T', 'OBJ2', 'POLYF', [3.1])
+        return cf
+
+    def group(self, cf, rng, rows=300):
+        from Source.HDFGroup import HDFGroup
+        gp = HDFGroup()
+        for dsType in ['INTTIME', 'ES', 'T']:
+            names = [cd.id for cd in cf.data if cd.type == dsType]
+            values = rng.uniform(1000, 60000, (rows, len(names)))
+            values[rng.random(values.shape) < 0.01] = np.nan
+            gp.addDataset(dsType).fromArray(values, names)
+        return gp
+
+    def test_matches_per_record_loops(self):
+        from Source.ProcessL1b_FactoryCal import ProcessL1b_FactoryCal
+        cf = self.calibrationFile(np.random.default_rng(0))
+        expected = self.group(cf, np.random.default_rng(1))
+        gp = self.group(cf, np.random.default_rng(1))
+        # A polynomial of cancelling terms is only as exact as its largest term
+        atol = {}
+        for cd in cf.data:
+            if cd.fitType == 'POLYU':
+                x = np.abs(expected.getDataset(cd.type).data[cd.id])
+                terms = sum(abs(float(a)) * x**i for i, a in enumerate(cd.coefficients))
+                atol[cd.id] = 1e-15 * np.nanmax(terms)
+        inttime = expected.getDataset('INTTIME')
+        processDatasetLoop(inttime, cf.data[0])
+        for cd in cf.data[1:]:
+            processDatasetLoop(expected.getDataset(cd.type), cd, inttime)
+        ProcessL1b_FactoryCal.processGroup(gp, cf)
+
+        for dsType in ['INTTIME', 'ES', 'T']:
+            for name in gp.getDataset(dsType).data.dtype.names:
+                np.testing.assert_allclose(gp.getDataset(dsType).data[name],
+                                           expected.getDataset(dsType).data[name], rtol=1e-15, atol=atol.get(name, 0),
+                                           err_msg=f'{dsType} {name}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import collections
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+
+
+class TestZongCache(unittest.TestCase):
+    def setUp(self):
+        from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for target, value in [('ZONG_CACHE_DIR', self.tmp.name), ('_zongMemo', {}),
+                              ('zongCacheStats', {'hits': 0, 'misses': 0})]:
+            patcher = mock.patch.object(ProcessL1b_FRMCal, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cached_matrix_matches_and_counts(self):
+        from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
+        rng = np.random.default_rng(0)
+        wavelengths = np.linspace(305, 1140, 255)
+        LSF = rng.uniform(-1e-4, 1e-3, (255, 255)) + np.eye(255)
+        expected = ProcessL1b_FRMCal.Zong_SL_correction_matrix(LSF.copy())
+
+        results = []
+        for clearMemo in [False, False, True]:
+            if clearMemo:
+                # A fresh worker finds the matrix on disk
+                ProcessL1b_FRMCal._zongMemo.clear()
+            mZ = LSF.copy()
+            results.append(ProcessL1b_FRMCal.Zong_SL_correction_matrix_cached(mZ, wavelengths))
+            self.assertFalse((mZ < 0).any())
+        self.assertEqual(ProcessL1b_FRMCal.zongCacheStats, {'hits': 2, 'misses': 1})
+        for C in results:
+            np.testing.assert_array_equal(C, expected)
+
+        # A different wavelength grid is a different characterisation
+        ProcessL1b_FRMCal.Zong_SL_correction_matrix_cached(LSF.copy(), wavelengths + 0.1)
+        self.assertEqual(ProcessL1b_FRMCal.zongCacheStats['misses'], 2)
+        self.assertEqual(len(os.listdir(self.tmp.name)), 2)
+
+
+class TestCosineErrorCorrection(unittest.TestCase):
+    def test_full_hemispherical_matches_loop(self):
+        from Source.HDFRoot import HDFRoot
+        from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
+        rng = np.random.default_rng(0)
+        zenith_ang = np.linspace(-88, 88, 45)
+        node = HDFRoot()
+        unc_grp = node.addGroup('RAW_UNCERTAINTIES')
+        # Characterisation tables carry a header row, and the cosine tables two leading columns
+        ds = unc_grp.addDataset('ES_RADCAL_CAL')
+        ds.data = np.array(np.r_[0, np.linspace(305, 1140, 255)], dtype=[('1', '<f8')])
+        for name in ['ES_ANGDATA_COSERROR', 'ES_ANGDATA_COSERROR_AZ90']:
+            ds = unc_grp.addDataset(name)
+            ds.fromArray(rng.normal(0, 3, (256, 47)), [str(i) for i in range(47)])
+            ds.attributes['COLUMN_NAMES'] = '\t'.join(['a', 'b'] + [str(z) for z in zenith_ang])
+
+        avg_coserror, full_hemi_coserror, zen = ProcessL1b_FRMCal.cosine_error_correction(node, 'ES')
+        zen0 = np.argmin(np.abs(zen))
+        zen90 = np.argmin(np.abs(zen-90))
+        deltaZen = (zen[1::]-zen[:-1])
+        expected = np.zeros(255)
+        for i in range(255):
+            expected[i] = np.sum(avg_coserror[i,zen0:zen90]*np.sin(2*np.pi*zen[zen0:zen90]/180)*deltaZen[zen0:zen90]*np.pi/180 )
+        np.testing.assert_array_equal(full_hemi_coserror, expected)
+        self.assertTrue(expected.any())
+
+
+class TestPy6SCache(unittest.TestCase):
+    def setUp(self):
+        from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for target, value in [('PY6S_CACHE_DIR', self.tmp.name), ('_py6sMemo', collections.OrderedDict()),
+                              ('py6sCacheStats', {'hits': 0, 'misses': 0})]:
+            patcher = mock.patch.object(ProcessL1b_FRMCal, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        class Output:
+            def __init__(self, values):
+                self.values = values
+
+        self.calls = []
+        def runner(s, wavelengths):
+            # Stands in for the 6S executable, one call per bin
+            self.calls.append((s.geometry.solar_z, s.aot550))
+            return [Output({name: i + s.geometry.solar_z + w for i, name in enumerate(ProcessL1b_FRMCal.PY6S_OUTPUTS)})
+                    for w in wavelengths]
+
+        self.runner = runner
+
+    def test_repeated_bins_reuse_results(self):
+        from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
+        wvl = np.linspace(305, 1140, 255)
+        first = ProcessL1b_FRMCal.py6s_cached(7, 19, 35.123, 120.0, 135.0, 0.0812, wvl, self.runner)
+        self.assertEqual(first.shape, (5, 255))
+        np.testing.assert_array_equal(first[2], 2 + 35.12 + 1e-3*wvl)
+        # Within the quantisation step, and again from disk as a fresh worker would
+        ProcessL1b_FRMCal.py6s_cached(7, 19, 35.1249, 120.0, 135.0, 0.08121, wvl, self.runner)
+        ProcessL1b_FRMCal._py6sMemo.clear()
+        again = ProcessL1b_FRMCal.py6s_cached(7, 19, 35.123, 120.0, 135.0, 0.0812, wvl, self.runner)
+        np.testing.assert_array_equal(again, first)
+        self.assertEqual(self.calls, [(35.12, 0.0812)])
+
+        # Another geometry, date or wavelength grid runs 6S
+        ProcessL1b_FRMCal.py6s_cached(7, 19, 35.2, 120.0, 135.0, 0.0812, wvl, self.runner)
+        ProcessL1b_FRMCal.py6s_cached(7, 20, 35.123, 120.0, 135.0, 0.0812, wvl, self.runner)
+        ProcessL1b_FRMCal.py6s_cached(7, 19, 35.123, 120.0, 135.0, 0.0812, wvl[:200], self.runner)
+        self.assertEqual(len(self.calls), 4)
+        self.assertEqual(ProcessL1b_FRMCal.py6sCacheStats, {'hits': 2, 'misses': 4})
+
+    def test_memo_keeps_most_recent_bins(self):
+        from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
+        wvl = np.linspace(305, 1140, 10)
+        with mock.patch.object(ProcessL1b_FRMCal, 'PY6S_MEMO_SIZE', 2):
+            for solar_z in [10, 20, 10, 30]:
+                ProcessL1b_FRMCal.py6s_cached(7, 19, solar_z, 120.0, 135.0, 0.08, wvl, self.runner)
+            self.assertEqual(len(ProcessL1b_FRMCal._py6sMemo), 2)
+            # 20 was least recently used, so it comes back from disk, not 6S
+            ProcessL1b_FRMCal.py6s_cached(7, 19, 20, 120.0, 135.0, 0.08, wvl, self.runner)
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(ProcessL1b_FRMCal.py6sCacheStats, {'hits': 2, 'misses': 3})
+
+
+def FRMChainLoop(raw_data, int_time, ind_raw_data, ind_nocal, alpha, C_zong, cal_int, updated_radcal_gain, Ct,
+                 res_py6s=None, zenith_ang=None, avg_coserror=None, full_hemi_coserror=None):
+    ''' The per-measurement loop ProcessL1b_FRMCal.FRM_chain replaced; kept as a reference '''
+    nmes = len(raw_data)
+    FRM_mesure = np.zeros((nmes, len(updated_radcal_gain)))
+    for n in range(nmes):
+        data = raw_data[n][ind_raw_data]
+        data = data*(1-alpha*data)
+        data = np.matmul(C_zong, data)
+        data = data * (cal_int/int_time[n]) / updated_radcal_gain
+        data = data * Ct
+        if res_py6s is not None:
+            solar_zenith = res_py6s['solar_zenith'][n]
+            direct_ratio = res_py6s['direct_ratio'][n,ind_raw_data]
+            ind_closest_zen = np.argmin(np.abs(zenith_ang-solar_zenith))
+            cos_corr = (1-avg_coserror[:,ind_closest_zen]/100)[ind_nocal==False]
+            Fhcorr = (1-full_hemi_coserror/100)[ind_nocal==False]
+            data = (direct_ratio*data*cos_corr) + ((1-direct_ratio)*data*Fhcorr)
+        FRM_mesure[n,:] = data
+    return FRM_mesure
+
+
+class TestFRMChain(unittest.TestCase):
+    def test_matches_per_measurement_loop(self):
+        import pandas as pd
+        from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
+        rng = np.random.default_rng(0)
+        nmes, nband = 300, 255
+        radcal_wvl = np.linspace(305, 1140, nband)
+        # Integration time of the calibration first, as read from the characterisation table; no gain for two pixels
+        radcal_cal = pd.Series(np.r_[128, rng.uniform(0.5, 2, nband)])
+        radcal_cal[6], radcal_cal[201] = 0, np.nan
+        cal_int = radcal_cal.pop(0)
+        ind_nocal = (radcal_cal<=0) | np.isnan(radcal_cal)
+        ind_raw_data = (radcal_cal[radcal_wvl>0])>0
+        keep = ~np.asarray(ind_nocal)
+
+        raw_data = rng.uniform(1e3, 3e4, (nmes, nband))
+        int_time = rng.choice([64.0, 128.0, 256.0], (nmes, 1))
+        alpha = rng.uniform(1e-7, 1e-6, nband)[keep]
+        Ct = rng.uniform(0.99, 1.01, nband)[keep]
+        C_zong = (np.eye(nband) + rng.uniform(-1e-3, 1e-3, (nband, nband)))[keep][:, keep]
+        updated_radcal_gain = rng.uniform(0.5, 2, nband)[keep]
+        calibration = (raw_data, int_time, ind_raw_data, ind_nocal, alpha, C_zong, cal_int, updated_radcal_gain, Ct)
+
+        # LI/LT: no cosine correction
+        np.testing.assert_allclose(ProcessL1b_FRMCal.FRM_chain(*calibration), FRMChainLoop(*calibration), rtol=1e-10)
+
+        # ES, solar zeniths falling between and on the characterised zenith angles
+        zenith_ang = np.linspace(-88, 88, 45)
+        res_py6s = {'solar_zenith': np.r_[zenith_ang[25], rng.uniform(10, 80, nmes - 1)],
+                    'direct_ratio': rng.uniform(0, 1, (nmes, nband))}
+        cosine = (res_py6s, zenith_ang, rng.normal(0, 3, (nband, 45)), rng.normal(0, 2, nband))
+        np.testing.assert_allclose(ProcessL1b_FRMCal.FRM_chain(*calibration, *cosine),
+                                   FRMChainLoop(*calibration, *cosine), rtol=1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
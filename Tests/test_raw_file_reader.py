@@ -0,0 +1,159 @@
+import os
+import glob
+import collections
+import unittest
+
+import numpy as np
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def readRawFileSeek(filepath, calibrationMap, contextMap, root):
+    ''' The seek-and-compare reader RawFileReader.readRawFile replaced; kept as a reference '''
+    from Source.RawFileReader import RawFileReader
+    MAX_TAG_READ = 32
+    RESET_TAG_READ = MAX_TAG_READ-16
+
+    posframe = 2
+    with open(filepath, 'rb') as f:
+        while 1:
+            pos = f.tell()
+            b = f.read(MAX_TAG_READ)
+            f.seek(pos)
+            if not b:
+                break
+
+            for i in range(0, MAX_TAG_READ):
+                testString = b[i:].upper()
+                if i == MAX_TAG_READ-1:
+                    f.read(RESET_TAG_READ)
+                    break
+
+                if testString.startswith(b"SATHDR"):
+                    if i > 0:
+                        f.read(i)
+                    hdr = f.read(RawFileReader.SATHDR_READ)
+                    (k,v) = RawFileReader.readSATHDR(hdr)
+                    root.attributes[k] = v
+                    break
+                else:
+                    num = 0
+                    for key in calibrationMap:
+                        cf = calibrationMap[key]
+                        if testString.startswith(cf.id.upper().encode("utf-8")):
+                            if i > 0:
+                                f.read(i)
+                            pos = f.tell()
+                            msg = f.read(RawFileReader.MAX_BLOCK_READ)
+                            f.seek(pos)
+
+                            gp = contextMap[cf.id]
+                            if len(gp.attributes) == 0:
+                                gp.id = key
+                                gp.attributes["CalFileName"] = key
+                                gp.attributes["FrameTag"] = cf.id
+                            try:
+                                num = cf.convertRaw(msg, gp)
+                            except Exception:
+                                pass
+
+                            if num >= 0:
+                                ds = gp.getDataset("POSFRAME")
+                                if ds is None:
+                                    ds = gp.addDataset("POSFRAME")
+                                ds.appendColumn("COUNT", posframe)
+                                posframe += 1
+                                f.read(num)
+                            break
+                    if num > 0:
+                        break
+
+
+class TestRawFileReader(unittest.TestCase):
+    def setUp(self):
+        from Source.CalibrationFileReader import CalibrationFileReader
+        self.calibrationMap = CalibrationFileReader.read(
+            os.path.join(root, 'Config', 'sample_SEABIRD_SOLARTRACKER_Calibration'))
+        self.files = sorted(glob.glob(os.path.join(root, 'Data', 'Sample_Data', 'SolarTracker', 'RAW', '*.RAW')))
+
+    def read(self, reader, fp):
+        from Source.HDFRoot import HDFRoot
+        from Source.HDFGroup import HDFGroup
+        node = HDFRoot()
+        contextMap = collections.OrderedDict()
+        for key in self.calibrationMap:
+            gp = HDFGroup()
+            gp.id = self.calibrationMap[key].instrumentType
+            contextMap[self.calibrationMap[key].id] = gp
+        table = reader(fp, self.calibrationMap, contextMap, node)
+        return node, contextMap, table
+
+    def test_matches_seek_reader(self):
+        from Source.RawFileReader import RawFileReader
+        self.assertTrue(self.files)
+        for fp in self.files:
+            node, contextMap, table = self.read(RawFileReader.readRawFile, fp)
+            refNode, refContextMap, _ = self.read(readRawFileSeek, fp)
+
+            self.assertEqual(node.attributes, refNode.attributes)
+            self.assertEqual(list(contextMap), list(refContextMap))
+            for tag, gp in contextMap.items():
+                refGp = refContextMap[tag]
+                self.assertEqual(gp.id, refGp.id)
+                self.assertEqual(gp.attributes, refGp.attributes)
+                self.assertEqual(list(gp.datasets), list(refGp.datasets))
+                for name, ds in gp.datasets.items():
+                    # assert_equal treats NaN == NaN
+                    np.testing.assert_equal(ds.columns, refGp.datasets[name].columns, f'{tag} {name}')
+
+            # Offset table: increasing offsets, each pointing at its instrument's frame tag
+            with open(fp, 'rb') as f:
+                raw = f.read()
+            self.assertEqual(len(table), sum(len(gp.getDataset('POSFRAME').columns['COUNT'])
+                                             for gp in contextMap.values() if gp.getDataset('POSFRAME')))
+            offsets = [offset for offset, _, _ in table]
+            self.assertEqual(offsets, sorted(offsets))
+            for offset, key, _ in table[:500]:
+                tag = self.calibrationMap[key].id.upper().encode('utf-8')
+                self.assertEqual(raw[offset:offset+len(tag)].upper(), tag)
+
+    def test_corrupt_frame_is_dropped(self):
+        import tempfile
+        from Source.RawFileReader import RawFileReader
+        fp = self.files[0]
+        _, contextMap, table = self.read(RawFileReader.readRawFile, fp)
+        # Spoil the ASCII spectrometer temperature of the tenth frame of one light sensor
+        key = next(key for key in self.calibrationMap if self.calibrationMap[key].id == 'SATHSE0488')
+        cf = self.calibrationMap[key]
+        dtype, _ = cf.getFrameDtype()
+        field = next(i for i, cd in enumerate(cf.data) if cd.type == 'SPECTEMP')
+        frames = [i for i, (_, k, _) in enumerate(table) if k == key]
+        offset = table[frames[9]][0] + dtype.fields[f'f{field}'][1]
+        with open(fp, 'rb') as f:
+            raw = bytearray(f.read())
+        raw[offset:offset + 6] = b'xx.xxx'
+
+        with tempfile.TemporaryDirectory() as tmp:
+            corrupt = os.path.join(tmp, os.path.basename(fp))
+            with open(corrupt, 'wb') as f:
+                f.write(raw)
+            _, badContextMap, badTable = self.read(RawFileReader.readRawFile, corrupt)
+
+        self.assertEqual(badTable, table[:frames[9]] + table[frames[9] + 1:])
+        posframes = []
+        for tag, gp in badContextMap.items():
+            count = gp.getDataset('POSFRAME').columns['COUNT'] if gp.getDataset('POSFRAME') else []
+            for name, ds in gp.datasets.items():
+                if ds.columns:
+                    self.assertEqual(len(next(iter(ds.columns.values()))), len(count), f'{tag} {name}')
+            refCount = contextMap[tag].getDataset('POSFRAME').columns['COUNT'] if count else []
+            # Frames after the dropped one move up by one
+            self.assertEqual(count, [c - (c > frames[9] + 2) for c in refCount if c != frames[9] + 2], tag)
+            posframes.extend(count)
+        self.assertEqual(sorted(posframes), list(range(2, 2 + len(badTable))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,467 @@
+import os
+import unittest
+
+import numpy as np
+
+
+os.environ["HYPERINSPACE_CMD"] = "TRUE"
+
+
+def fixDateTimeLoop(gp):
+    ''' Utilities.fixDateTime as a delete-and-rescan loop, one datasetDeleteRow per out-of-order record '''
+    dateTime = gp.getDataset("DATETIME").data
+    total = len(dateTime)
+    if dateTime[1] <= dateTime[0]:
+        gp.datasetDeleteRow(0)
+        dateTime = gp.getDataset("DATETIME").data
+        total -= 1
+    i = 1
+    while i < total:
+        if dateTime[i] <= dateTime[i-1]:
+            gp.datasetDeleteRow(i)
+            dateTime = gp.getDataset("DATETIME").data
+            total -= 1
+            continue
+        i += 1
+    return True
+
+
+def darkConvolutionLoop(data, avg, std, sigma):
+    ''' Utilities.darkConvolution one record at a time '''
+    badIndex = []
+    for i, dat in enumerate(data):
+        if i < 1 or i > len(data)-2:
+            badIndex.append(True)
+        elif np.isnan(dat):
+            badIndex.append(False)
+        else:
+            badIndex.append(bool((dat > avg[i] + (sigma*std)) or (dat < avg[i] - (sigma*std))))
+    return badIndex
+
+
+def lightConvolutionLoop(data, avg, rolling_std, sigma):
+    ''' As darkConvolutionLoop, with one std per record '''
+    badIndex = []
+    for i, dat in enumerate(data):
+        if i < 1 or i > len(data)-2:
+            badIndex.append(True)
+        elif np.isnan(dat):
+            badIndex.append(False)
+        else:
+            badIndex.append(bool((dat > avg[i] + (sigma*rolling_std[i])) or (dat < avg[i] - (sigma*rolling_std[i]))))
+    return badIndex
+
+
+def interpFillLoop(x, y, newXList, fillValue=float('nan')):
+    ''' Utilities.interpFill as a scan over every newX for each value of y '''
+    y = np.array(y)
+    x = np.array(x)
+    whrNan = np.where(np.isnan(y))[0]
+    y = np.delete(y,whrNan)
+    x = np.delete(x,whrNan)
+    newYList = [fillValue for _ in newXList]
+    for value in np.unique(y):
+        minX = min(x[y==value])
+        maxX = max(x[y==value])
+        for i, newX in enumerate(newXList):
+            if (newX >= minX) and (newX <= maxX):
+                newYList[i] = value
+    return newYList
+
+
+class TestDateTimeTags(unittest.TestCase):
+    def test_tags_to_datetime64(self):
+        from Source.Utilities import Utilities
+        rng = np.random.default_rng(0)
+        seconds = rng.uniform(0, 86400, 5000)
+        timeTag2 = (seconds // 3600)*1e7 + (seconds % 3600 // 60)*1e5 + np.floor(seconds % 60 * 1000)
+        dateTag = (rng.integers(1995, 2030, 5000)*1000 + rng.integers(1, 366, 5000)).astype(float)
+        # Bad rows: zero and NaN TIMETAG2, minutes > 59, NaN and 19th century DATETAG, day 0
+        timeTag2[:3] = [0.0, np.nan, 125960000]
+        dateTag[3:6] = [np.nan, 1899100, 2021000]
+
+        dt64, valid = Utilities.tagsToDatetime64(dateTag, timeTag2)
+        self.assertEqual(np.flatnonzero(~valid).tolist(), [0, 1, 2, 3, 4, 5])
+        self.assertTrue(np.isnat(dt64[~valid]).all())
+
+        dateTime = Utilities.datetime64ToDateTime(dt64[valid])
+        expected = [Utilities.timeTag2ToDateTime(Utilities.dateTagToDateTime(d), t)
+                    for d, t in zip(dateTag[valid], timeTag2[valid])]
+        self.assertEqual(dateTime, expected)
+        self.assertEqual(dateTime[0].tzinfo, expected[0].tzinfo)
+
+
+class TestLogFile(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from Source.Utilities import Utilities
+        Utilities.closeLogFile()
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.logFile = os.environ.get('LOGFILE')
+        os.environ['LOGFILE'] = 'test.log'
+
+    def tearDown(self):
+        from Source.Utilities import Utilities
+        Utilities.closeLogFile()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        if self.logFile is None:
+            del os.environ['LOGFILE']
+        else:
+            os.environ['LOGFILE'] = self.logFile
+
+    def read(self):
+        with open(os.path.join('Logs', 'test.log'), encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_buffered_lines_flush_and_reopen(self):
+        from Source.Utilities import Utilities
+        Utilities.writeLogFile('first', mode='w')
+        for n in range(3):
+            Utilities.writeLogFile(f'line {n}')
+        self.assertLess(4, Utilities.LOG_BUFFER_LINES)
+        self.assertEqual(self.read(), [])
+        Utilities.flushLogFile()
+        self.assertEqual(self.read(), ['first', 'line 0', 'line 1', 'line 2'])
+
+        # Closed, the next line reopens the log and appends to it
+        Utilities.closeLogFile()
+        self.assertIsNone(Utilities._logFile)
+        Utilities.writeLogFile('after close')
+        Utilities.closeLogFile()
+        self.assertEqual(self.read(), ['first', 'line 0', 'line 1', 'line 2', 'after close'])
+
+    def test_forked_worker_starts_its_own_handle(self):
+        from Source.Utilities import Utilities
+        Utilities.writeLogFile('parent', mode='w')
+        Utilities.flushLogFile()
+        Utilities.writeLogFile('parent, unflushed')
+        parentFile = Utilities._logFile
+        # As seen from a forked worker: the handle and buffer are the parent's
+        Utilities._logPid = -1
+        try:
+            Utilities.writeLogFile('worker')
+            self.assertIsNot(Utilities._logFile, parentFile)
+            Utilities.flushLogFile()
+            self.assertEqual(self.read(), ['parent', 'worker'])
+        finally:
+            parentFile.close()
+
+
+class TestDeglitch(unittest.TestCase):
+    def test_deglitch_bands_matches_per_band(self):
+        from Source.Utilities import Utilities
+        from Source.ConfigFile import ConfigFile
+        rng = np.random.default_rng(0)
+        bands = [350 + 3.3*i for i in range(40)]
+        radiometry = rng.lognormal(3, 0.2, (len(bands), 600)) + np.linspace(0, 5, 600)
+        radiometry[rng.random(radiometry.shape) < 0.01] *= 5
+        radiometry[3, 50] = np.nan
+
+        threshold = ConfigFile.settings.get("bL1aqcThreshold")
+        ConfigFile.settings["bL1aqcThreshold"] = 1
+        try:
+            for lightDark, window, sigma in [('Dark', 11, 3.2), ('Light', 5, 2.3), ('Light', 13, 2.7)]:
+                flags = Utilities.deglitchBands(bands, radiometry, window, sigma, lightDark, 20, 25, bands[7])
+                for i, band in enumerate(bands):
+                    expected = Utilities.deglitchBand(band, radiometry[i].tolist(), window, sigma, lightDark, 20, 25, bands[7])
+                    for passFlags, passExpected in zip(flags, expected):
+                        np.testing.assert_array_equal(passFlags[i], passExpected, f'{lightDark} {band}')
+        finally:
+            ConfigFile.settings["bL1aqcThreshold"] = threshold
+
+    def test_no_band_in_deglitch_window(self):
+        from Source.HDFDataset import HDFDataset
+        from Source.ProcessL1aqc_deglitch import ProcessL1aqc_deglitch
+        from Source.Utilities import Utilities
+        rng = np.random.default_rng(0)
+        ds = HDFDataset()
+        ds.fromArray(rng.lognormal(3, 0.2, (200, 5)), ['300.1', '310.2', '900.3', '910.4', '920.5'])
+
+        self.assertEqual(ProcessL1aqc_deglitch.darkDataDeglitching(ds, 11, 3.2), [False]*200)
+        self.assertEqual(ProcessL1aqc_deglitch.lightDataDeglitching(ds, 5, 2.3), [False]*200)
+        flags = Utilities.deglitchBands([], np.empty((0, 200)), 5, 2.3, 'Light', 20, 25, 400.0)
+        self.assertEqual([f.shape for f in flags], [(0, 200)]*3)
+
+
+class TestTimeJoin(unittest.TestCase):
+    def test_nearest_time_index(self):
+        import datetime
+        from Source.Utilities import Utilities
+        rng = np.random.default_rng(0)
+        t0 = datetime.datetime(2022, 7, 19, tzinfo=datetime.timezone.utc)
+        # Whole seconds so ties and duplicate fixes occur
+        reference = [t0 + datetime.timedelta(seconds=int(s)) for s in np.sort(rng.integers(0, 600, 300))]
+        values = [t0 + datetime.timedelta(seconds=float(s)) for s in rng.integers(-20, 620, 500) + rng.choice([0, 0.5], 500)]
+
+        ref64, val64 = Utilities.datetimeToDatetime64(reference), Utilities.datetimeToDatetime64(values)
+        index = Utilities.nearestTimeIndex(ref64, val64)
+        self.assertEqual(index.tolist(), [Utilities.find_nearest(reference, v) for v in values])
+
+        backward = Utilities.nearestTimeIndex(ref64, val64, direction='backward')
+        forward = Utilities.nearestTimeIndex(ref64, val64, direction='forward', tolerance=2)
+        for v, b, f in zip(values, backward, forward):
+            before = [i for i, r in enumerate(reference) if r <= v]
+            after = [i for i, r in enumerate(reference) if v <= r and (r - v).total_seconds() <= 2]
+            self.assertEqual(b, before[-1] if before else -1)
+            self.assertEqual(f, after[0] if after else -1)
+
+    def test_tolerance(self):
+        import datetime
+        from Source.Utilities import Utilities
+        t0 = datetime.datetime(2022, 7, 19, tzinfo=datetime.timezone.utc)
+        reference = Utilities.datetimeToDatetime64([t0 + datetime.timedelta(seconds=s) for s in [0, 10, 20]])
+        values = Utilities.datetimeToDatetime64([t0 + datetime.timedelta(seconds=s) for s in [-3, 1.5, 7, 14.9, 26]])
+        self.assertEqual(Utilities.nearestTimeIndex(reference, values).tolist(), [0, 0, 1, 1, 2])
+        # Seconds or timedelta64, inclusive
+        self.assertEqual(Utilities.nearestTimeIndex(reference, values, tolerance=3).tolist(), [0, 0, 1, -1, -1])
+        self.assertEqual(Utilities.nearestTimeIndex(reference, values, tolerance=np.timedelta64(1500, 'ms')).tolist(),
+                         [-1, 0, -1, -1, -1])
+        self.assertEqual(Utilities.nearestTimeIndex(reference, values, tolerance=5, direction='backward').tolist(),
+                         [-1, 0, -1, 1, -1])
+        self.assertEqual(Utilities.nearestTimeIndex(reference[:0], values, tolerance=5).tolist(), [-1]*5)
+
+    def test_millisecond_truncation_matches_tags(self):
+        import datetime
+        from Source.Utilities import Utilities
+        rng = np.random.default_rng(2)
+        t0 = datetime.datetime(2022, 12, 31, 23, 59, tzinfo=datetime.timezone.utc)
+        dateTime = [t0 + datetime.timedelta(microseconds=int(us)) for us in rng.integers(0, 10**8, 2000)]
+        # The ancillary DATETIME as L1AQC used to rebuild it from the tags
+        expected = [Utilities.timeTag2ToDateTime(Utilities.dateTagToDateTime(Utilities.datetime2DateTag(dt)),
+                                                 Utilities.datetime2TimeTag2(dt)) for dt in dateTime]
+        dt64 = Utilities.datetimeToDatetime64(dateTime).astype('datetime64[ms]')
+        self.assertEqual(Utilities.datetime64ToDateTime(dt64), expected)
+
+    def test_datetime64_to_tags(self):
+        import datetime
+        from Source.Utilities import Utilities
+        rng = np.random.default_rng(1)
+        t0 = datetime.datetime(1999, 12, 31, tzinfo=datetime.timezone.utc)
+        dateTime = [t0 + datetime.timedelta(seconds=float(s)) for s in rng.uniform(0, 4e8, 2000)]
+        dateTag, timeTag2 = Utilities.datetime64ToTags(Utilities.datetimeToDatetime64(dateTime))
+        self.assertEqual(dateTag.tolist(), [Utilities.datetime2DateTag(dt) for dt in dateTime])
+        self.assertEqual(timeTag2.tolist(), [Utilities.datetime2TimeTag2(dt) for dt in dateTime])
+
+
+class TestFixDarkTimes(unittest.TestCase):
+    def test_matches_find_nearest(self):
+        import datetime
+        from Source.Utilities import Utilities
+        from Source.HDFGroup import HDFGroup
+        rng = np.random.default_rng(0)
+        t0 = datetime.datetime(2022, 7, 19, tzinfo=datetime.timezone.utc)
+
+        def group(seconds):
+            gp = HDFGroup()
+            dateTime = [t0 + datetime.timedelta(seconds=float(s)) for s in seconds]
+            dateTag, timeTag2 = Utilities.datetime64ToTags(Utilities.datetimeToDatetime64(dateTime))
+            gp.addDataset('DATETIME').data = dateTime
+            gp.addDataset('DATETAG').data = np.array(dateTag, dtype=[('NONE', '<f8')])
+            gp.addDataset('TIMETAG2').data = np.array(timeTag2, dtype=[('NONE', '<f8')])
+            return gp
+
+        # Sea-Bird: a dark every few lights, at times between and beyond the lights, some repeated
+        lightSeconds = np.round(np.cumsum(rng.uniform(0.1, 0.6, 2000)), 1)
+        lightSeconds[500] = lightSeconds[499]
+        darkSeconds = np.concatenate(([-3.0], np.sort(rng.uniform(0, lightSeconds[-1], 300)).round(2),
+                                      [lightSeconds[499], lightSeconds[-1] + 5]))
+        lightGroup, darkGroup = group(lightSeconds), group(darkSeconds)
+        Utilities.fixDarkTimes(darkGroup, lightGroup)
+
+        lightDatetime = lightGroup.datasets['DATETIME'].data
+        for name in ['DATETAG', 'TIMETAG2', 'DATETIME']:
+            expected = [lightGroup.datasets[name].data[Utilities.find_nearest(lightDatetime, darkTime)]
+                        for darkTime in darkGroup.datasets['DATETIME'].data]
+            self.assertEqual(list(darkGroup.datasets[f'{name}_ADJUSTED'].data), expected, name)
+
+
+class TestNan(unittest.TestCase):
+    def test_has_nan_and_nan2zero(self):
+        import datetime
+        from Source.Utilities import Utilities
+        from Source.HDFDataset import HDFDataset
+        rng = np.random.default_rng(0)
+        values = rng.random((40, 120))
+        ds = HDFDataset()
+        ds.fromArray(values, [f'{350 + 3.3*i:.1f}' for i in range(120)])
+        self.assertFalse(Utilities.hasNan(ds))
+        ds.data['399.5'][7] = np.nan
+        self.assertTrue(Utilities.hasNan(ds))
+
+        # Datetime is skipped, with the dataset mixed (object) or as columns
+        ds.datasetToColumns()
+        ds.columns['399.5'][7] = 1.0
+        ds.columns['Datetime'] = [datetime.datetime(2022, 7, 19)]*40
+        self.assertFalse(Utilities.hasNan(ds.columns))
+        ds.columnsToDataset()
+        self.assertFalse(Utilities.hasNan(ds))
+
+        data = np.zeros(40, dtype=[(f'{i}', '<f8') for i in range(120)])
+        data['3'][[1, 5]] = np.nan
+        data['119'][39] = np.nan
+        result = Utilities.datasetNan2Zero(data)
+        self.assertIs(result, data)
+        self.assertFalse(any(np.isnan(data[k]).any() for k in data.dtype.names))
+
+
+class TestFixDateTime(unittest.TestCase):
+    def test_matches_delete_and_rescan(self):
+        import datetime
+        from Source.Utilities import Utilities
+        from Source.HDFGroup import HDFGroup
+        rng = np.random.default_rng(0)
+        rows = 2000
+        seconds = np.arange(rows) * 0.5
+        # Clock resets (including at the first record) and repeated timestamps
+        for start in np.r_[0, rng.choice(rows - 20, 20, replace=False)]:
+            seconds[start:start + rng.integers(1, 20)] -= rng.uniform(0.1, 30)
+        dup = rng.choice(rows - 1, 20, replace=False)
+        seconds[dup + 1] = seconds[dup]
+        t0 = datetime.datetime(2022, 7, 19, tzinfo=datetime.timezone.utc)
+        values = rng.random((rows, 5))
+
+        groups = []
+        for func in [fixDateTimeLoop, Utilities.fixDateTime]:
+            gp = HDFGroup()
+            gp.addDataset('ES').fromArray(values, ['400.0', '410.0', '420.0', '430.0', '440.0'])
+            gp.addDataset('DATETIME').data = [t0 + datetime.timedelta(seconds=float(sec)) for sec in seconds]
+            self.assertTrue(func(gp))
+            groups.append(gp)
+        expected, result = groups
+        self.assertLess(len(result.getDataset('DATETIME').data), rows)
+        self.assertEqual(list(result.getDataset('DATETIME').data), list(expected.getDataset('DATETIME').data))
+        np.testing.assert_array_equal(result.getDataset('ES').data, expected.getDataset('ES').data)
+
+    def test_two_records_out_of_order(self):
+        import datetime
+        from Source.Utilities import Utilities
+        from Source.HDFGroup import HDFGroup
+        t0 = datetime.datetime(2022, 7, 19, tzinfo=datetime.timezone.utc)
+        gp = HDFGroup()
+        gp.addDataset('ES').fromArray(np.array([[1.0, 2.0], [3.0, 4.0]]), ['400.0', '410.0'])
+        gp.addDataset('DATETIME').data = [t0 + datetime.timedelta(seconds=1), t0]
+        # The first record is deleted before giving up on the single one left
+        self.assertFalse(Utilities.fixDateTime(gp))
+        self.assertEqual(gp.getDataset('DATETIME').data, [t0])
+        np.testing.assert_array_equal(gp.getDataset('ES').toArray(), [[3.0, 4.0]])
+
+
+class TestConvolution(unittest.TestCase):
+    def test_matches_per_record(self):
+        import pandas as pd
+        from Source.Utilities import Utilities
+        rng = np.random.default_rng(0)
+        data = rng.lognormal(3, 0.2, (20, 300))
+        data[rng.random(data.shape) < 0.02] *= 5
+        data[rng.random(data.shape) < 0.005] = np.nan
+        avg = Utilities.movingAverageBands(data, 11)
+        std = np.nanstd(data - avg, axis=1, keepdims=True)
+        rollingStd = pd.DataFrame((data - avg).T).rolling(11).std().bfill().to_numpy().T
+
+        dark = Utilities.darkConvolution(data, avg, std, 3.0)
+        light = Utilities.lightConvolution(data, avg, rollingStd, 2.5)
+        for b in range(len(data)):
+            self.assertEqual(dark[b].tolist(), darkConvolutionLoop(data[b].tolist(), avg[b].tolist(), std[b, 0], 3.0))
+            self.assertEqual(light[b].tolist(), lightConvolutionLoop(data[b].tolist(), avg[b].tolist(),
+                                                                     rollingStd[b].tolist(), 2.5))
+        self.assertTrue(dark[:, 1:-1].any() and light[:, 1:-1].any())
+
+
+class TestInterpFill(unittest.TestCase):
+    def test_interp_fill(self):
+        from Source.Utilities import Utilities
+        x = [0, 1, 2, 3, 4, 5, 6, 7, 8]
+        # Station 1 resumes after station 2, so its range covers station 2's; the larger value wins
+        y = [1, 1, 2, np.nan, 2, 1, np.nan, np.nan, 3]
+        newX = [8.5, -1, 0.5, 2.5, 3.9, 4.5, 7.9, 8, 1.5]
+        self.assertEqual(Utilities.interpFill(x, y, newX, fillValue=-9),
+                         [-9, -9, 1, 2, 2, 1, -9, 3, 1])
+
+    def test_keeps_type_of_y(self):
+        from Source.Utilities import Utilities
+        x, newX = [0, 1, 2, 3], [-1, 0.5, 2.5, 4]
+        result = Utilities.interpFill(x, [4, 4, 7, 7], newX, fillValue=-1)
+        self.assertEqual(result, [-1, 4, 7, -1])
+        self.assertEqual([type(v) for v in result], [int]*4)
+        result = Utilities.interpFill(x, [4.0, 4.0, 7.0, 7.0], newX)
+        self.assertEqual([type(v) for v in result], [float]*4)
+        self.assertEqual(result[1:3], [4.0, 7.0])
+        self.assertTrue(np.isnan(result[0]))
+        self.assertEqual(Utilities.interpFill(x, [np.nan]*4, newX, fillValue=0), [0, 0, 0, 0])
+
+    def test_matches_scan(self):
+        from Source.Utilities import Utilities
+        rng = np.random.default_rng(0)
+        x = np.sort(rng.uniform(0, 86400, 400))
+        # Stations in consecutive blocks, with gaps (NaN) between them
+        y = np.repeat(np.arange(1, 11, dtype=float), 40)
+        y[rng.random(400) < 0.2] = np.nan
+        newX = np.sort(rng.uniform(-600, 87000, 5000)).tolist()
+        np.testing.assert_array_equal(Utilities.interpFill(x.tolist(), y.tolist(), newX),
+                                      interpFillLoop(x.tolist(), y.tolist(), newX))
+
+
+class TestBadTimes(unittest.TestCase):
+    def test_bad_times_mask_matches_loop(self):
+        import datetime
+        from Source.Utilities import Utilities
+        rng = np.random.default_rng(0)
+        t0 = datetime.datetime(2022, 7, 19, tzinfo=datetime.timezone.utc)
+        timeStamp = [t0 + datetime.timedelta(seconds=float(s)) for s in np.sort(rng.uniform(0, 3600, 2000))]
+        # Overlapping, nested, reversed and single-instant intervals, unsorted
+        badTimes = []
+        for start in rng.uniform(0, 3600, 60):
+            badTimes.append([t0 + datetime.timedelta(seconds=float(start)),
+                             t0 + datetime.timedelta(seconds=float(start + rng.uniform(-10, 120)))])
+        badTimes.append([timeStamp[5], timeStamp[5]])
+
+        keep = Utilities.badTimesMask(timeStamp, badTimes)
+        expected = [not any(start <= t <= stop for start, stop in badTimes) for t in timeStamp]
+        self.assertEqual(keep.tolist(), expected)
+        self.assertFalse(keep[5])
+        self.assertTrue(Utilities.badTimesMask(timeStamp, []).all())
+
+    def test_filter_data_characterization_and_empty_group(self):
+        import datetime
+        from Source.ConfigFile import ConfigFile
+        from Source.Utilities import Utilities
+        from Source.HDFGroup import HDFGroup
+        t0 = datetime.datetime(2022, 7, 19, tzinfo=datetime.timezone.utc)
+        times = [t0 + datetime.timedelta(seconds=s) for s in range(3)]
+        sensorType = ConfigFile.settings.get("SensorType")
+        try:
+            lengths = {}
+            for sensor in ["TriOS", "SeaBird"]:
+                ConfigFile.settings["SensorType"] = sensor
+                # CAL_ has one row per band, here as many as there are records
+                gp = HDFGroup()
+                gp.id = "ES_LIGHT"
+                ds = gp.addDataset("Timestamp")
+                ds.columns["Datetime"] = times
+                ds.columnsToDataset()
+                gp.addDataset("ES").fromArray(np.ones((3, 2)), ['400.0', '410.0'])
+                gp.addDataset("CAL_ES").fromArray(np.ones((3, 1)), ['0'])
+                self.assertAlmostEqual(Utilities.filterData(gp, [[times[1], times[1]]], 'L1AQC'), 1/3)
+                self.assertEqual(len(gp.getDataset("ES").data), 2)
+                lengths[sensor] = len(gp.getDataset("CAL_ES").data)
+            # Only TriOS carries the characterization in CAL_/BACK_, which is never filtered
+            self.assertEqual(lengths, {"TriOS": 3, "SeaBird": 2})
+
+            gp = HDFGroup()
+            gp.id = "ES_LIGHT"
+            ds = gp.addDataset("Timestamp")
+            ds.columns["Datetime"] = []
+            ds.data = np.zeros(0, dtype=[("Datetime", object)])
+            self.assertEqual(Utilities.filterData(gp, [[times[0], times[1]]], 'L1AQC'), 1.0)
+        finally:
+            if sensorType is None:
+                del ConfigFile.settings["SensorType"]
+            else:
+                ConfigFile.settings["SensorType"] = sensorType
+
+
+if __name__ == '__main__':
+    unittest.main()